@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+DIALOGUE_LINES = [
+    "Ale's fresh today. Copper a mug.",
+    "Rumors cost extra, friend.",
+    "Keep your voice down and your hands on the bar.",
+    "Room upstairs is two silver, breakfast included.",
+]
+
+
+class MockOllamaConfig:
+    def __init__(
+        self,
+        latency: float = 0.02,
+        token_rate: float = 500.0,
+        embed_dim: int = 768,
+        embed_latency: float = 0.005,
+        response_tokens: int = 60,
+        prompt_eval_rate: float = 4000.0,
+        prefix_cache: bool = True,
+    ):
+        self.latency = latency
+        self.token_rate = token_rate
+        self.embed_dim = embed_dim
+        self.embed_latency = embed_latency
+        self.response_tokens = response_tokens
+        self.prompt_eval_rate = prompt_eval_rate
+        self.prefix_cache = prefix_cache
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit-ish vector derived from the text, so equal inputs embed equally."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim, dtype=np.float32).tolist()
+
+
+def fake_npc_json(prompt: str) -> str:
+    rng = random.Random(prompt)
+    return json.dumps({
+        "dialogue": rng.choice(DIALOGUE_LINES),
+        "actions": "wipes a mug",
+        "emotion": rng.choice(["warm", "wary", "bored"]),
+        "decision": "serve the customer",
+    })
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockOllamaServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", "0"))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count(self.path)
+        cfg = self.server.config
+        if self.path == "/api/embeddings":
+            time.sleep(cfg.embed_latency)
+            self._send_json({"embedding": fake_embedding(data.get("prompt", ""), cfg.embed_dim)})
+        elif self.path == "/api/embed":
+            inputs = data.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(cfg.embed_latency * max(1, len(inputs)) ** 0.5)
+            self._send_json({"model": data.get("model"), "embeddings": [fake_embedding(t, cfg.embed_dim) for t in inputs]})
+        elif self.path in ("/api/generate", "/api/chat"):
+            self._generate(data)
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def _generate(self, data: Dict[str, Any]) -> None:
+        cfg = self.server.config
+        if self.path == "/api/chat":
+            prompt = "".join(m.get("content", "") for m in data.get("messages", []))
+        else:
+            prompt = data.get("system", "") + data.get("prompt", "")
+        # like llama.cpp, only the part after the longest prefix shared with the last prompt is prefilled
+        reused = self.server.reuse_prefix(data.get("model", ""), prompt) if cfg.prefix_cache else 0
+        prompt_tokens = max(1, (len(prompt) - reused) // 4)
+        prompt_eval = prompt_tokens / cfg.prompt_eval_rate
+        text = fake_npc_json(prompt)
+        # split into roughly response_tokens pieces, emitted at token_rate
+        step = max(1, len(text) // cfg.response_tokens)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        stats = {
+            "done": True,
+            "total_duration": int((cfg.latency + prompt_eval + len(pieces) / cfg.token_rate) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": len(pieces),
+            "eval_duration": int(len(pieces) / cfg.token_rate * 1e9),
+        }
+
+        time.sleep(cfg.latency + prompt_eval)
+        if not data.get("stream", True):
+            time.sleep(len(pieces) / cfg.token_rate)
+            if self.path == "/api/chat":
+                self._send_json({"model": data.get("model"), "message": {"role": "assistant", "content": text}, **stats})
+            else:
+                self._send_json({"model": data.get("model"), "response": text, "context": [1, 2, 3], **stats})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(1 / cfg.token_rate)
+            if self.path == "/api/chat":
+                line = {"message": {"role": "assistant", "content": piece}, "done": False}
+            else:
+                line = {"response": piece, "done": False}
+            self._write_chunk(json.dumps(line).encode("utf-8") + b"\n")
+        final = {"response": "", **stats} if self.path == "/api/generate" else {"message": {"role": "assistant", "content": ""}, **stats}
+        self._write_chunk(json.dumps(final).encode("utf-8") + b"\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """
+    Local stand-in for Ollama's /api/generate, /api/chat, /api/embeddings and /api/embed.
+
+    Latency, token rate and embedding dimension are configurable; responses are
+    deterministic for a given input. Use as a context manager to run it on a
+    background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[MockOllamaConfig] = None):
+        super().__init__((host, port), MockOllamaHandler)
+        self.config = config or MockOllamaConfig()
+        self.requests: Dict[str, int] = {}
+        self._count_lock = threading.Lock()
+        self._last_prompt: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path: str) -> None:
+        with self._count_lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def reuse_prefix(self, model: str, prompt: str) -> int:
+        """Characters of prompt shared with the model's previous prompt; remembers this one."""
+        with self._count_lock:
+            previous = self._last_prompt.get(model, "")
+            self._last_prompt[model] = prompt
+        return len(os.path.commonprefix([previous, prompt]))
+
+    def __enter__(self) -> "MockOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Run a mock Ollama server for benchmarks and local testing")
+    p.add_argument("--port", type=int, default=11435)
+    p.add_argument("--latency", type=float, default=0.02, help="Fixed seconds added to every generate call")
+    p.add_argument("--token-rate", type=float, default=500.0, help="Generated tokens per second")
+    p.add_argument("--embed-dim", type=int, default=768)
+    args = p.parse_args()
+    config = MockOllamaConfig(latency=args.latency, token_rate=args.token_rate, embed_dim=args.embed_dim)
+    server = MockOllamaServer(port=args.port, config=config)
+    print(f"Mock Ollama listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from unittest.mock import patch
+
+if __package__ in (None, ""):
+    # allow running as `python benchmarks/run_benchmarks.py` from the repo root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.mock_ollama import MockOllamaConfig, MockOllamaServer
+from npcs import bartender_rag, rag_client
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker, NPCDecisionMaker
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(name: str, latencies: List[float], wall: float, peak_bytes: Optional[int], **extra: Any) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "ops_per_sec": len(latencies) / wall if wall else 0.0,
+        "peak_alloc_mb": peak_bytes / 2 ** 20 if peak_bytes is not None else None,
+        "max_rss_mb": max_rss_mb(),
+        **extra,
+    }
+
+
+TRACE_ALLOCATIONS = False
+
+
+def measured(fn: Callable[[], List[float]]):
+    """
+    Run fn; returns (latencies, wall seconds, peak traced bytes or None).
+
+    Allocation tracing slows Python-heavy code several-fold, so it is only on
+    with --trace-alloc; process max RSS is always reported.
+    """
+    if TRACE_ALLOCATIONS:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        latencies = fn()
+    finally:
+        wall = time.perf_counter() - start
+        peak = None
+        if TRACE_ALLOCATIONS:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    return latencies, wall, peak
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_npc_turns(url: str, concurrency: int, turns: int) -> Dict[str, Any]:
+    """concurrency players, each taking turns back to back on a thread."""
+    npc = NPCDecisionMaker(ollama_url=url, model="mock")
+
+    def one(i: int) -> float:
+        return timed(lambda: npc.get_npc_response("Mara", "warm", f"beer number {i}", "talk"))
+
+    def run() -> List[float]:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(one, range(turns)))
+
+    latencies, wall, peak = measured(run)
+    return summarize(f"npc_turns.sync.c{concurrency}", latencies, wall, peak, concurrency=concurrency)
+
+
+def bench_async_npc_turns(url: str, concurrency: int, turns: int) -> Dict[str, Any]:
+    """concurrency players as asyncio tasks over one AsyncNPCDecisionMaker."""
+    async def run_async() -> List[float]:
+        latencies: List[float] = []
+        async with AsyncNPCDecisionMaker(ollama_url=url, model="mock", max_concurrency=concurrency) as npc:
+            async def player(p: int) -> None:
+                for i in range(p, turns, concurrency):
+                    start = time.perf_counter()
+                    await npc.get_npc_response("Mara", "warm", f"beer number {i}", "talk")
+                    latencies.append(time.perf_counter() - start)
+            await asyncio.gather(*[player(p) for p in range(concurrency)])
+        return latencies
+
+    latencies, wall, peak = measured(lambda: asyncio.run(run_async()))
+    return summarize(f"npc_turns.async.c{concurrency}", latencies, wall, peak, concurrency=concurrency)
+
+
+def bench_prefix_reuse(url: str, turns: int, prefix_reuse: bool) -> Dict[str, Any]:
+    """Per-turn prompt-eval time reported by Ollama, with and without the constant system prefix."""
+    npc = NPCDecisionMaker(ollama_url=url, model=f"mock-prefix-{prefix_reuse}", prefix_reuse=prefix_reuse)
+    prefill: List[float] = []
+    saved: List[float] = []
+
+    def run() -> List[float]:
+        for i in range(turns):
+            npc.get_npc_response("Mara", "warm", f"beer number {i}", "talk", context=f"Earlier: turn {i - 1}")
+            prefill.append(npc.last_metrics.spans.get("ollama_prompt_eval", 0.0) / 1000)
+            saved.append(npc.last_metrics.est_prefill_saved_ms)
+        return prefill
+
+    latencies, wall, peak = measured(run)
+    name = "prefill.prefix_reuse" if prefix_reuse else "prefill.stateless"
+    return summarize(name, latencies, wall, peak, mean_est_prefill_saved_ms=statistics.fmean(saved) if saved else 0.0)
+
+
+def synthetic_chunks(n: int) -> List[bartender_rag.Chunk]:
+    return [
+        bartender_rag.Chunk(id=f"lore.{i}", text=f"Lore chunk {i}: the tavern cellar holds barrel {i}.", meta={"section": "lore"})
+        for i in range(n)
+    ]
+
+
+def bench_build_index(url: str, size: int) -> Dict[str, Any]:
+    chunks = synthetic_chunks(size)
+
+    def run() -> List[float]:
+        return [timed(lambda: bartender_rag.build_index(chunks, ollama_url=url, embed_model="mock-embed"))]
+
+    latencies, wall, peak = measured(run)
+    return summarize(f"build_index.n{size}", latencies, wall, peak, size=size, chunks_per_sec=size / wall)
+
+
+def random_index(size: int, dim: int) -> Dict[str, Any]:
+    """Clustered random vectors, roughly like embeddings of topical lore chunks."""
+    rng = np.random.default_rng(size)
+    centers = rng.standard_normal((max(1, size // 400), dim), dtype=np.float32)
+    matrix = centers[rng.integers(0, len(centers), size)] + 0.6 * rng.standard_normal((size, dim), dtype=np.float32)
+    return {
+        "ollama_url": "",
+        "embed_model": "mock-embed",
+        "items": [
+            {"id": f"lore.{i}", "text": f"chunk {i}", "meta": {}, "embedding": row.tolist()}
+            for i, row in enumerate(matrix)
+        ],
+    }
+
+
+def bench_search(url: str, size: int, dim: int, queries: int, kind: str = "vector") -> Dict[str, Any]:
+    """kind is "vector" (exact numpy scan), "ivf" (approximate) or "reference" (pure Python)."""
+    index = random_index(size, dim)
+    vindex = bartender_rag.VectorIndex.from_index(index)
+    extra: Dict[str, Any] = {}
+    if kind == "ivf":
+        vindex = vindex.with_ivf()
+        recall = bartender_rag.recall_report(vindex, top_k=6, queries=queries, nprobes=[vindex.ivf.nprobe])
+        extra = {"recall_at_6": recall["runs"][0]["recall"], "nlist": vindex.ivf.nlist, "nprobe": vindex.ivf.nprobe}
+    qvec = (vindex.matrix[0] + 0.1).tolist()
+
+    def run() -> List[float]:
+        # embedding round trips are measured by build/turn benchmarks; this isolates scoring
+        with patch.object(bartender_rag, "embed", return_value=qvec):
+            if kind == "reference":
+                return [timed(lambda: bartender_rag.search_index(index, "q", url, "mock-embed", top_k=6)) for _ in range(queries)]
+            return [timed(lambda: vindex.search("q", url, "mock-embed", top_k=6)) for _ in range(queries)]
+
+    latencies, wall, peak = measured(run)
+    return summarize(f"search.{kind}.n{size}", latencies, wall, peak, size=size, **extra)
+
+
+def bench_main_loop(url: str, turns: int) -> Dict[str, Any]:
+    import main_process
+
+    inputs = [f"beer number {i}" for i in range(turns)] + ["quit"]
+    turn_starts: List[float] = []
+
+    def fake_input(prompt: str) -> str:
+        turn_starts.append(time.perf_counter())
+        return inputs[len(turn_starts) - 1]
+
+    def run() -> List[float]:
+        with patch.object(main_process, "llm_url", url), patch.object(main_process, "llm_model", "mock"), \
+                patch.object(main_process, "load_retriever", return_value=None), \
+                patch("builtins.input", side_effect=fake_input), patch("builtins.print"):
+            main_process.main_loop()
+        return [b - a for a, b in zip(turn_starts, turn_starts[1:])]
+
+    latencies, wall, peak = measured(run)
+    return summarize("main_loop.turns", latencies, wall, peak)
+
+
+def run_command(argv: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def bench_startup(url: str, runs: int, embed_dim: int) -> List[Dict[str, Any]]:
+    """
+    Wall time of a fresh process per CLI invocation, from exec to exit.
+
+    The bare interpreter is the floor; every other entry also reports its p50
+    over it. Queries run lexical-first against text that BM25 answers
+    confidently, so no embedding round trip is included in either query path.
+    """
+    python = sys.executable
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "startup_index.npy")
+        index = random_index(200, embed_dim)
+        index["ollama_url"] = url
+        bartender_rag.VectorIndex.from_index(index).save(index_path)
+        socket_path = os.path.join(tmp, "rag.sock")
+        query = ["chunk 7", "--index", index_path, "--mode", "lexical-first"]
+        commands = {
+            "startup.interpreter": [python, "-c", "pass"],
+            "startup.import.main_process": [python, "-c", "import main_process"],
+            "startup.query": [python, "npcs/bartender_rag.py", "query", *query],
+            "startup.query.socket": [python, "npcs/bartender_rag.py", "query", *query, "--socket", socket_path],
+            "startup.query.client": [python, "npcs/rag_client.py", *query, "--socket", socket_path],
+        }
+        daemon = subprocess.Popen(
+            [python, "npcs/bartender_rag.py", "serve", "--socket", socket_path, "--preload", index_path],
+            cwd=ROOT, stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while not rag_client.ping(socket_path):
+                if daemon.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("query daemon did not start")
+                time.sleep(0.05)
+            results = []
+            for name, argv in commands.items():
+                run_command(argv)  # warm the OS page cache and __pycache__
+                latencies, wall, _ = measured(lambda: [run_command(argv) for _ in range(runs)])
+                results.append(summarize(name, latencies, wall, None))
+        finally:
+            rag_client.shutdown(socket_path)
+            daemon.wait(timeout=10)
+    floor = results[0]["p50_ms"]
+    for r in results[1:]:
+        r["over_interpreter_ms"] = r["p50_ms"] - floor
+    return results
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    config = MockOllamaConfig(latency=args.latency, token_rate=args.token_rate, embed_dim=args.embed_dim)
+    results: List[Dict[str, Any]] = []
+    with MockOllamaServer(config=config) as server:
+        results.extend(bench_startup(server.url, args.startup_runs, args.embed_dim))
+        for c in [] if args.startup_only else args.concurrency:
+            results.append(bench_npc_turns(server.url, c, args.turns))
+            results.append(bench_async_npc_turns(server.url, c, args.turns))
+        if not args.startup_only:
+            results.append(bench_prefix_reuse(server.url, args.turns, prefix_reuse=False))
+            results.append(bench_prefix_reuse(server.url, args.turns, prefix_reuse=True))
+            for size in args.build_sizes:
+                results.append(bench_build_index(server.url, size))
+            for size in args.index_sizes:
+                results.append(bench_search(server.url, size, args.embed_dim, args.queries))
+                if size >= args.ivf_min:
+                    results.append(bench_search(server.url, size, args.embed_dim, args.queries, kind="ivf"))
+                if size <= args.reference_max:
+                    results.append(bench_search(server.url, size, args.embed_dim, args.queries, kind="reference"))
+            results.append(bench_main_loop(server.url, args.turns))
+        requests_served = dict(server.requests)
+    return {
+        "config": {
+            "latency": args.latency, "token_rate": args.token_rate, "embed_dim": args.embed_dim,
+            "turns": args.turns, "queries": args.queries, "startup_runs": args.startup_runs,
+        },
+        "max_rss_mb": max_rss_mb(),
+        "mock_requests": requests_served,
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Names of benchmarks whose p95 latency regressed by more than tolerance versus baseline."""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in report["results"]:
+        old = previous.get(r["name"])
+        if old and old["p95_ms"] > 0 and r["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{r['name']}: p95 {old['p95_ms']:.2f}ms -> {r['p95_ms']:.2f}ms")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'benchmark':32} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'RSS MB':>8} {'alloc MB':>8}")
+    for r in report["results"]:
+        alloc = f"{r['peak_alloc_mb']:8.1f}" if r["peak_alloc_mb"] is not None else f"{'-':>8}"
+        note = ""
+        if "recall_at_6" in r:
+            note = f"  recall@6={r['recall_at_6']:.3f}"
+        elif "mean_est_prefill_saved_ms" in r:
+            note = f"  est. saved {r['mean_est_prefill_saved_ms']:.1f}ms/turn"
+        elif "over_interpreter_ms" in r:
+            note = f"  +{r['over_interpreter_ms']:.1f}ms over the bare interpreter"
+        print(
+            f"{r['name']:32} {r['count']:6d} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f}"
+            f" {r['ops_per_sec']:9.1f} {r['max_rss_mb']:8.1f} {alloc}{note}"
+        )
+    print(f"max RSS: {report['max_rss_mb']:.1f} MB; mock requests: {report['mock_requests']}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Throughput/latency benchmarks against a local mock Ollama")
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--turns", type=int, default=64, help="NPC turns per concurrency level")
+    p.add_argument("--build-sizes", type=int, nargs="+", default=[100, 1000])
+    p.add_argument("--index-sizes", type=int, nargs="+", default=[1000, 10000])
+    p.add_argument("--reference-max", type=int, default=1000, help="Largest index size to also run the pure-Python reference scan on")
+    p.add_argument("--ivf-min", type=int, default=10000, help="Smallest index size to also benchmark IVF search on")
+    p.add_argument("--queries", type=int, default=50)
+    p.add_argument("--startup-runs", type=int, default=20, help="Fresh processes per CLI startup benchmark")
+    p.add_argument("--startup-only", action="store_true", help="Only run the CLI startup benchmarks")
+    p.add_argument("--latency", type=float, default=0.02)
+    p.add_argument("--token-rate", type=float, default=500.0)
+    p.add_argument("--embed-dim", type=int, default=768)
+    p.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, default=None, help="Write results as the new baseline")
+    p.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None, help="Compare against a saved baseline")
+    p.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown versus baseline (0.2 = 20%%)")
+    p.add_argument("--trace-alloc", action="store_true", help="Also record peak Python allocations per benchmark (slow)")
+    p.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    return p
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    global TRACE_ALLOCATIONS
+    args = build_arg_parser().parse_args(argv)
+    TRACE_ALLOCATIONS = args.trace_alloc
+    report = run_suite(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline → {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,167 @@
-from npcs.npc_decision_maker_module import NPCDecisionMaker
-from dotenv import load_dotenv
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional
+from npcs.conversation_memory import ConversationMemory
+from npcs.metrics import MetricsRegistry
 import random
 import os
 
-load_dotenv()
+if TYPE_CHECKING:
+    # numpy and requests come in with these; main_loop loads them while the player types
+    from npcs.npc_decision_maker_module import NPCDecisionMaker
+
+
+def find_dotenv() -> Optional[str]:
+    """The .env python-dotenv would pick: the nearest one at or above this file's directory."""
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        candidate = os.path.join(path, '.env')
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+dotenv_path = find_dotenv()
+if dotenv_path:
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path)
 llm_url: str = os.getenv('OLLAMA_URL')
 llm_model: str = os.getenv('OLLAMA_MODEL')
+context_token_budget: int = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1024'))
+rag_index: str = os.getenv('RAG_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs', 'bartender_rules_index.npy'))
+metrics_jsonl: str = os.getenv('METRICS_JSONL')
+rag_mode: str = os.getenv('RAG_MODE', 'lexical-first')
+prefetch_default: bool = os.getenv('PREFETCH', '0') == '1'
 import json
 
+
+def load_retriever(index_path: str = rag_index, mode: str = rag_mode):
+    """Load the rules index once at startup; returns None when no index has been built."""
+    from npcs.bartender_rag import Retriever
+    try:
+        return Retriever.from_path(index_path, mode=mode)
+    except FileNotFoundError:
+        return None
+
+
+def load_npc(metrics: MetricsRegistry) -> 'NPCDecisionMaker':
+    from npcs.npc_decision_maker_module import NPCDecisionMaker
+    return NPCDecisionMaker(ollama_url=llm_url, model=llm_model, retriever=load_retriever(), metrics=metrics)
+
+
+def stream_response(npc: 'NPCDecisionMaker', npc_kwargs: dict) -> dict:
+    """Print the dialogue as the model writes it; returns the fully parsed response."""
+    print('The bartender says: ', end='', flush=True)
+    response: dict = {}
+    for kind, value in npc.get_npc_response_stream_parsed(**npc_kwargs):
+        if kind == 'dialogue':
+            print(value, end='', flush=True)
+        else:
+            response = value
+    print()
+    return response
+
+
+def show_reply(response: dict, streamed: bool = False) -> None:
+    """Print the bartender's emotion and, unless it was already streamed, the dialogue."""
+    # replies are validated, so every field is present and emotion is never empty
+    if streamed:
+        print(f'({response["emotion"]})')
+    else:
+        print(f'({response["emotion"]}), The bartender says: {response["dialogue"]}')
+
+
+personalities = ['wary', 'cautious', 'inebriated', 'happy', 'buys', 'sad', 'bored', 'spiteful', 'rushed']
+quit_commands = ('quit', 'Q')
+
+
 def main_loop():
-    npc: NPCDecisionMaker = NPCDecisionMaker(ollama_url=llm_url, model=llm_model)
+    metrics = MetricsRegistry(jsonl_path=metrics_jsonl)
+    # the prompt shows right away; the decision maker and rules index load while the first input is typed
+    loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='npc-load')
+    loading: Future = loader.submit(load_npc, metrics)
+    npc: Optional['NPCDecisionMaker'] = None
     debug_mode: bool = False
-    rolling_conntext = []
+    stream_mode: bool = False
+    memory = ConversationMemory(token_budget=context_token_budget)
+    prefetcher = None
     while True:
         prompt: str = input('> ')
-        if prompt == 'quit':
-            print(f'Goodbye {prompt}')
+        if npc is None and prompt not in quit_commands:
+            npc = loading.result()
+            if prefetch_default:
+                from npcs.prefetch import Prefetcher
+                prefetcher = Prefetcher(npc)
+        if prompt in quit_commands:
+            loader.shutdown()
+            if prefetcher:
+                prefetcher.close()
+            print('Goodbye quit')
             break
         if prompt == 'help':
-            print('Type quit to exit the program\nType debug to toggle debug mode\nType anything else to talk to Bob the bartender')
+            print('Type quit (or Q) to exit the program\nType debug to toggle debug mode\nType stream to toggle streaming dialogue\nType prefetch to toggle answering likely follow-ups while you type\nType metrics to print Prometheus metrics for this session\nType anything else to talk to Bob the bartender')
             continue
         if prompt == 'debug':
             debug_mode = not debug_mode
             print('Switching debug mode to', debug_mode)
+        elif prompt == 'stream':
+            stream_mode = not stream_mode
+            print('Switching stream mode to', stream_mode)
+        elif prompt == 'prefetch':
+            if prefetcher:
+                prefetcher.close()
+                print('Switching prefetch mode to False', prefetcher.stats())
+                prefetcher = None
+            else:
+                from npcs.prefetch import Prefetcher
+                prefetcher = Prefetcher(npc)
+                print('Switching prefetch mode to True')
+        elif prompt == 'metrics':
+            print(metrics.to_prometheus(), end='')
+            if prefetcher:
+                print(f'# prefetch {json.dumps(prefetcher.stats())}')
         else:
-            response: dict = npc.get_npc_response(
+            npc_kwargs = dict(
                 npc_name='Bob the bartender',
-                npc_personality=random.choice(['wary', 'cautious', 'inebriated', 'happy', 'buys', 'sad', 'bored', 'spiteful', 'rushed']),
+                npc_personality=random.choice(personalities),
                 situation=prompt,
-                context=json.dumps(rolling_conntext, ensure_ascii=False, indent=2),
+                context=memory.render(),
                 player_action='talk'
             )
+            response = prefetcher.take(prompt) if prefetcher else None
+            prefetched = response is not None
+            if prefetched:
+                if stream_mode:
+                    print(f'The bartender says: {response["dialogue"]}')
+            elif stream_mode:
+                response = stream_response(npc, npc_kwargs)
+            else:
+                response: dict = npc.get_npc_response(**npc_kwargs)
 
-            rolling_conntext.append({"previous_response": response["dialogue"]})
-            rolling_conntext.append({"previous_prompt": prompt})
+            if 'error' in response:
+                print(f'The bartender does not answer. {response["message"]} ({response["error"]})')
+                continue
 
-            # todo sometimes emotion is empty and causes an error
-            if response['emotion']:
-                emotion = f'{response["emotion"]}'
-            else:
-                emotion = 'neutral'
-            print(f'({emotion}), The bartender says: {response["dialogue"]}')
+            memory.add_turn(prompt, response['dialogue'])
+            show_reply(response, streamed=stream_mode)
+            if prefetcher:
+                # speculate on the next input while the player reads and types
+                prefetcher.start(prompt, dict(
+                    npc_kwargs,
+                    npc_personality=random.choice(personalities),
+                    context=memory.render()
+                ))
             if debug_mode:
                 print(f'Input: {prompt}')
+                if prefetched:
+                    print(f'Prefetched reply (hit rate {prefetcher.hit_rate:.0%})')
+                elif npc.last_metrics:
+                    print(f'Timings: {npc.last_metrics.breakdown()}')
                 print(json.dumps(response, indent=2))
-                print(json.dumps(rolling_conntext, indent=2))
+                print(f'Context (~{memory.tokens} tokens, {memory.turns_seen} turns seen):')
+                print(memory.render())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from npcs.metrics import MetricsRegistry
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker
+from npcs.scheduler import OllamaScheduler
+from npcs.sessions import SessionManager, SessionNotFound, TooManySessions
+
+load_dotenv()
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY_BYTES = 1 << 20
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class NPCServer:
+    """
+    Minimal HTTP + WebSocket front end for SessionManager.
+
+    HTTP (JSON bodies):
+      POST   /sessions               {"npc_name" | "npc", "personality"?, "index"?} -> {"session_id"}
+                                     ("npc" picks a rules file from the registry)
+      POST   /sessions/{id}/turns    {"input", "action"?, "temperature"?}   -> NPC response
+      DELETE /sessions/{id}
+      GET    /npcs                   NPCs discovered in the rules directory
+      GET    /stats
+      GET    /metrics                Prometheus text format
+    WebSocket:
+      GET    /sessions/{id}/ws       each text frame is a player input; the server sends
+                                     {"type": "dialogue", "text"} frames as the reply is
+                                     generated, then {"type": "response", "response"}.
+    """
+
+    def __init__(self, manager: SessionManager):
+        self.manager = manager
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, path, headers)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if method == "GET" and path.split("?", 1)[0] == "/metrics":
+                    self._write_metrics(writer, keep_alive)
+                    await writer.drain()
+                    continue
+                try:
+                    status, payload = await self._route(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                self._write_json(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_BYTES:
+            raise ConnectionError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    @staticmethod
+    def _json_body(body: bytes) -> Dict:
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HttpError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        return data
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        try:
+            if parts == ["stats"] and method == "GET":
+                return 200, self.manager.stats()
+            if parts == ["npcs"] and method == "GET":
+                # rescanned so new rules files show up, off the loop since it parses every one
+                npcs = await asyncio.get_running_loop().run_in_executor(None, self.manager.registry.discover)
+                return 200, {"npcs": [
+                    {"npc": npc.npc_id, "npc_name": npc.npc_name, "built": npc.built}
+                    for npc in npcs.values()
+                ]}
+            if parts == ["sessions"] and method == "POST":
+                data = self._json_body(body)
+                for key in ("npc_name", "npc", "personality", "index"):
+                    if data.get(key) is not None and not isinstance(data[key], str):
+                        raise HttpError(400, f"{key} must be a string")
+                if not data.get("npc_name") and not data.get("npc"):
+                    raise HttpError(400, "npc_name or npc is required")
+                if data.get("npc"):
+                    registry = self.manager.registry
+                    # an unknown id rescans the rules directory
+                    known = await asyncio.get_running_loop().run_in_executor(None, registry.__contains__, data["npc"])
+                    if not known:
+                        raise HttpError(404, f"Unknown NPC {data['npc']!r}")
+                session = await self.manager.open_session(
+                    npc_name=data.get("npc_name"),
+                    npc_personality=data.get("personality", "neutral"),
+                    index_path=data.get("index"),
+                    npc_id=data.get("npc"),
+                )
+                return 201, {"session_id": session.session_id, "npc_name": session.npc_name}
+            if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+                self.manager.close_session(parts[1])
+                return 200, {"closed": parts[1]}
+            if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "turns" and method == "POST":
+                data = self._json_body(body)
+                if not isinstance(data.get("input"), str):
+                    raise HttpError(400, "input is required")
+                try:
+                    temperature = float(data.get("temperature", 0.7))
+                except (TypeError, ValueError):
+                    raise HttpError(400, "temperature must be a number")
+                response = await self.manager.take_turn(
+                    parts[1], data["input"],
+                    player_action=data.get("action", "talk"),
+                    temperature=temperature,
+                )
+                return 200, response
+        except SessionNotFound:
+            raise HttpError(404, "Unknown session")
+        except TooManySessions as e:
+            raise HttpError(503, str(e))
+        except FileNotFoundError as e:
+            raise HttpError(400, str(e))
+        raise HttpError(404, f"No route for {method} {path}")
+
+    @staticmethod
+    def _write_json(writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool = True) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+    def _write_metrics(self, writer: asyncio.StreamWriter, keep_alive: bool = True) -> None:
+        metrics = self.manager.client.metrics
+        if metrics is None:
+            self._write_json(writer, 404, {"error": "Metrics are disabled"}, keep_alive)
+            return
+        body = metrics.to_prometheus().encode("utf-8")
+        head = (
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str, headers: Dict[str, str]) -> None:
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if len(parts) != 3 or parts[0] != "sessions" or parts[2] != "ws":
+            self._write_json(writer, 404, {"error": "No websocket route"}, keep_alive=False)
+            return
+        if not headers.get("sec-websocket-key"):
+            self._write_json(writer, 400, {"error": "Missing Sec-WebSocket-Key"}, keep_alive=False)
+            return
+        session_id = parts[1]
+        try:
+            self.manager.get(session_id)
+        except SessionNotFound:
+            self._write_json(writer, 404, {"error": "Unknown session"}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WS_GUID).encode()).digest()).decode()
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1")
+        )
+        await writer.drain()
+
+        while True:
+            opcode, data = await read_ws_frame(reader)
+            if opcode == 0x8:
+                writer.write(ws_frame(b"", opcode=0x8))
+                await writer.drain()
+                return
+            if opcode == 0x9:
+                writer.write(ws_frame(data, opcode=0xA))
+            elif opcode == 0x1:
+                try:
+                    async for kind, value in self.manager.stream_turn(session_id, data.decode("utf-8")):
+                        if kind == "dialogue":
+                            message = {"type": "dialogue", "text": value}
+                        else:
+                            message = {"type": "response", "response": value}
+                        writer.write(ws_frame(json.dumps(message, ensure_ascii=False).encode("utf-8")))
+                        await writer.drain()
+                except SessionNotFound:
+                    writer.write(ws_frame(json.dumps({"type": "error", "error": "Session expired"}).encode()))
+                    writer.write(ws_frame(b"", opcode=0x8))
+                    await writer.drain()
+                    return
+            await writer.drain()
+
+
+async def read_ws_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one (unfragmented) client frame; returns (opcode, unmasked payload)."""
+    b1, b2 = await reader.readexactly(2)
+    opcode = b1 & 0x0F
+    length = b2 & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+    if length > MAX_BODY_BYTES:
+        raise ConnectionError("websocket frame too large")
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    data = await reader.readexactly(length)
+    if mask:
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+    return opcode, data
+
+
+def ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Build an unmasked server frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def serve(args: argparse.Namespace) -> None:
+    from npcs.registry import IndexRegistry
+
+    scheduler = OllamaScheduler(args.ollama_url, workers=args.max_in_flight, timeout=args.timeout)
+    client = AsyncNPCDecisionMaker(
+        ollama_url=args.ollama_url, model=args.model,
+        max_concurrency=args.max_in_flight, timeout=args.timeout, scheduler=scheduler,
+        metrics=MetricsRegistry(jsonl_path=args.metrics_jsonl),
+    )
+    manager = SessionManager(
+        client,
+        max_sessions=args.max_sessions,
+        idle_timeout=args.idle_timeout,
+        max_in_flight=args.max_in_flight,
+        rag_mode=args.rag_mode,
+        registry=IndexRegistry(
+            rules_dir=args.rules_dir, index_dir=args.index_dir,
+            memory_budget=int(args.index_memory_mb * 1024 * 1024),
+        ),
+    )
+    server = NPCServer(manager)
+    evictor = asyncio.create_task(manager.run_evictor(interval=min(30.0, args.idle_timeout)))
+    listener = await asyncio.start_server(server.handle, args.host, args.port)
+    print(f"NPC server listening on http://{args.host}:{args.port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        evictor.cancel()
+        await client.aclose()
+        scheduler.close()
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Multi-session NPC server (HTTP + WebSocket) backed by Ollama")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=int(os.getenv("NPC_SERVER_PORT", "8080")))
+    p.add_argument("--ollama-url", default=os.getenv("OLLAMA_URL"), help="Ollama base URL")
+    p.add_argument("--model", default=os.getenv("OLLAMA_MODEL"), help="Generation model name")
+    p.add_argument("--max-sessions", type=int, default=1000)
+    p.add_argument("--idle-timeout", type=float, default=900.0, help="Seconds before an idle session is evicted")
+    p.add_argument("--max-in-flight", type=int, default=16, help="Concurrent LLM requests across all sessions")
+    p.add_argument("--timeout", type=float, default=120.0, help="Per-request Ollama timeout in seconds")
+    p.add_argument("--rag-mode", choices=["vector", "hybrid", "lexical-first"], default=os.getenv("RAG_MODE", "lexical-first"), help="Rules retrieval strategy for sessions with an index")
+    p.add_argument("--rules-dir", default=os.getenv("NPC_RULES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "npcs")), help="Directory of <npc>_rules.json files sessions can pick with \"npc\"")
+    p.add_argument("--index-dir", default=os.getenv("NPC_INDEX_DIR"), help="Directory holding the per-NPC indexes (default: the rules directory)")
+    p.add_argument("--index-memory-mb", type=float, default=float(os.getenv("INDEX_MEMORY_MB", "256")), help="Loaded rules indexes beyond this size are unloaded, least recently used first")
+    p.add_argument("--metrics-jsonl", default=os.getenv("METRICS_JSONL"), help="Append every turn's timing breakdown to this JSON-lines file")
+    return p
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(build_arg_parser().parse_args()))
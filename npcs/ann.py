@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from npcs.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# below this many items an exact matrix-vector scan is already sub-millisecond
+IVF_AUTO_MIN_ITEMS = 20000
+ASSIGN_BLOCK_ROWS = 8192
+
+
+def default_nlist(n_items: int) -> int:
+    return max(1, min(n_items, int(2 * math.sqrt(n_items))))
+
+
+def default_nprobe(nlist: int) -> int:
+    return max(1, min(nlist, max(8, nlist // 32)))
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms != 0)
+
+
+def assign_lists(matrix: np.ndarray, centroids: np.ndarray, block: int = ASSIGN_BLOCK_ROWS) -> np.ndarray:
+    """
+    Nearest centroid (by cosine) for every row, computed in blocks to bound memory.
+
+    Row norms don't change the argmax, so rows are scored un-normalized.
+    """
+    out = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], block):
+        out[start:start + block] = np.argmax(np.asarray(matrix[start:start + block]) @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(
+    matrix: np.ndarray,
+    nlist: int,
+    iterations: int = 10,
+    sample_size: Optional[int] = None,
+    seed: int = 0
+) -> np.ndarray:
+    """Spherical k-means on a row sample; returns (nlist, dim) unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample_size = min(n, sample_size or max(nlist * 32, 10000))
+    rows = np.sort(rng.choice(n, sample_size, replace=False)) if sample_size < n else np.arange(n)
+    sample = _unit_rows(np.asarray(matrix[rows], dtype=np.float32))
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+        centroids[filled] = sums
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            # re-seed dead lists so every list ends up holding something
+            centroids[empty] = sample[rng.choice(sample_size, empty.size, replace=False)]
+        centroids = _unit_rows(centroids)
+    return centroids
+
+
+@dataclass
+class IVFLists:
+    """
+    Inverted-file partition of an index whose rows are stored grouped by list.
+
+    List i owns matrix rows offsets[i]:offsets[i + 1], so probing a list is a
+    contiguous slice of the (possibly memory-mapped) matrix. nprobe is the
+    default number of lists searched per query: higher is slower but closer to
+    the exact scan.
+    """
+
+    centroids: np.ndarray
+    offsets: np.ndarray
+    nprobe: int
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def probe(self, q: np.ndarray, nprobe: Optional[int] = None, min_rows: int = 0) -> List[Tuple[int, int]]:
+        """Row ranges of the lists nearest to q, widened past nprobe until they hold min_rows."""
+        nprobe = max(1, min(self.nlist, nprobe or self.nprobe))
+        order = np.argsort(-(self.centroids @ q))
+        ranges: List[Tuple[int, int]] = []
+        rows = 0
+        for i, lst in enumerate(order):
+            if i >= nprobe and rows >= min_rows:
+                break
+            start, end = int(self.offsets[lst]), int(self.offsets[lst + 1])
+            if end > start:
+                ranges.append((start, end))
+                rows += end - start
+        return ranges
+
+
+def build_ivf(
+    matrix: np.ndarray,
+    nlist: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    iterations: int = 10,
+    seed: int = 0
+) -> Tuple[IVFLists, np.ndarray]:
+    """
+    Train lists for matrix and return them with the row permutation that groups rows by list.
+
+    Callers reorder their matrix/norms/items with the permutation before using
+    the IVFLists offsets.
+    """
+    n = matrix.shape[0]
+    nlist = max(1, min(n, nlist or default_nlist(n)))
+    centroids = train_centroids(matrix, nlist, iterations=iterations, seed=seed)
+    assign = assign_lists(matrix, centroids)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=nlist)))).astype(np.int64)
+    return IVFLists(centroids, offsets, nprobe or default_nprobe(nlist)), order
@@ -1,15 +1,54 @@
+from __future__ import annotations
+
 import argparse
+import errno
+import hashlib
 import json
 import math
 import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+if __package__ in (None, ""):
+    # allow running as `python npcs/bartender_rag.py` from the repo root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npcs.ann import IVF_AUTO_MIN_ITEMS, IVFLists, build_ivf
+from npcs.caching import EmbeddingCache
+from npcs.lazy import lazy_import
+from npcs.lexical import LexicalIndex
+from npcs.prompt_templates import PromptTemplate, Segment
+from npcs.rag_client import DEFAULT_SOCKET
 
-import requests
+if TYPE_CHECKING:
+    # requests-based; imported where used so `query --socket` starts without them
+    from npcs.scheduler import OllamaScheduler
+    from npcs.transport import OllamaTransport
 
+# numpy is only imported once an index is actually touched, which keeps CLI startup fast
+np = lazy_import("numpy")
 
 DEFAULT_OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 DEFAULT_EMBED_MODEL = os.environ.get("EMBED_MODEL", "nomic-embed-text")
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "bartender_rules_index.npy")
+
+INDEX_FORMAT = "bartender_rag.index"
+INDEX_FORMAT_VERSION = 1
+
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical-first")
+LEXICAL_CONFIDENCE = 0.5
+# candidates pulled from each side before fusing, as a multiple of top_k
+FUSION_CANDIDATES = 4
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", "4"))
 
 
 @dataclass
@@ -24,6 +63,12 @@ def load_rules(rules_path: str) -> Dict[str, Any]:
         return json.load(f)
 
 
+# chunk texts, compiled once; the built index stores exactly what these render
+PERSONA_CHUNK = PromptTemplate((Segment("persona", "NPC {npc_name} {field}: {value}"),))
+SAFETY_CHUNK = PromptTemplate((Segment("safety", "{label} {i}: {item}"),))
+RULE_CHUNK = PromptTemplate((Segment("rule", "Rule {rid}: {rtext} (tags: {tags})"),))
+
+
 def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
     chunks: List[Chunk] = []
 
@@ -35,7 +80,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
         chunks.append(
             Chunk(
                 id="persona.backstory",
-                text=f"NPC {npc_name} backstory: {persona.get('backstory', '')}",
+                text=PERSONA_CHUNK.render(npc_name=npc_name, field="backstory", value=persona.get("backstory", "")),
                 meta={"section": "persona", "field": "backstory", "npc_name": npc_name},
             )
         )
@@ -44,7 +89,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
             chunks.append(
                 Chunk(
                     id="persona.traits",
-                    text=f"NPC {npc_name} traits: " + ", ".join(persona["traits"]),
+                    text=PERSONA_CHUNK.render(npc_name=npc_name, field="traits", value=", ".join(persona["traits"])),
                     meta={"section": "persona", "field": "traits", "npc_name": npc_name},
                 )
             )
@@ -52,7 +97,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
             chunks.append(
                 Chunk(
                     id="persona.goals",
-                    text=f"NPC {npc_name} goals: " + ", ".join(persona["goals"]),
+                    text=PERSONA_CHUNK.render(npc_name=npc_name, field="goals", value=", ".join(persona["goals"])),
                     meta={"section": "persona", "field": "goals", "npc_name": npc_name},
                 )
             )
@@ -63,7 +108,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
             chunks.append(
                 Chunk(
                     id="persona.dialogue_style",
-                    text=f"NPC {npc_name} dialogue style: " + "; ".join(style_bits),
+                    text=PERSONA_CHUNK.render(npc_name=npc_name, field="dialogue style", value="; ".join(style_bits)),
                     meta={"section": "persona", "field": "dialogue_style", "npc_name": npc_name},
                 )
             )
@@ -76,7 +121,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
                 chunks.append(
                     Chunk(
                         id=f"safety.refuse.{i}",
-                        text=f"Refuse policy {i}: {item}",
+                        text=SAFETY_CHUNK.render(label="Refuse policy", i=i, item=item),
                         meta={"section": "safety", "field": "refuse", "index": i, "npc_name": npc_name},
                     )
                 )
@@ -85,7 +130,7 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
                 chunks.append(
                     Chunk(
                         id=f"safety.deescalation.{i}",
-                        text=f"De-escalation tip {i}: {item}",
+                        text=SAFETY_CHUNK.render(label="De-escalation tip", i=i, item=item),
                         meta={"section": "safety", "field": "deescalation", "index": i, "npc_name": npc_name},
                     )
                 )
@@ -95,11 +140,10 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
         rid = rule.get("id") or f"rule.{len(chunks)}"
         rtext = rule.get("text", "")
         tags = rule.get("tags", [])
-        text = f"Rule {rid}: {rtext} (tags: {', '.join(tags)})"
         chunks.append(
             Chunk(
                 id=f"rules.{rid}",
-                text=text,
+                text=RULE_CHUNK.render(rid=rid, rtext=rtext, tags=", ".join(tags)),
                 meta={"section": "rules", "rule_id": rid, "tags": tags, "npc_name": npc_name},
             )
         )
@@ -107,18 +151,188 @@ def build_chunks_from_rules(rules: Dict[str, Any]) -> List[Chunk]:
     return chunks
 
 
-def embed(text: str, ollama_url: str = DEFAULT_OLLAMA_URL, model: str = DEFAULT_EMBED_MODEL) -> List[float]:
-    url = f"{ollama_url}/api/embeddings"
+def embed(
+    text: str,
+    ollama_url: str = DEFAULT_OLLAMA_URL,
+    model: str = DEFAULT_EMBED_MODEL,
+    cache: Optional[EmbeddingCache] = None,
+    scheduler: Optional[OllamaScheduler] = None,
+    transport: Optional[OllamaTransport] = None,
+) -> List[float]:
+    if cache is not None:
+        cached = cache.get(model, text)
+        if cached is not None:
+            return cached
+    if scheduler is not None:
+        vec = scheduler.embed(text, model)
+        if cache is not None:
+            cache.put(model, text, vec)
+        return vec
+    if transport is None:
+        from npcs.transport import get_transport
+
+        transport = get_transport(ollama_url)
     payload = {"model": model, "prompt": text}
-    resp = requests.post(url, json=payload, timeout=60)
+    resp = transport.post("/api/embeddings", json=payload)
     resp.raise_for_status()
     data = resp.json()
     vec = data.get("embedding")
     if not isinstance(vec, list):
         raise RuntimeError("Invalid embedding response from Ollama")
+    if cache is not None:
+        cache.put(model, text, vec)
     return vec
 
 
+class SharedQueryEmbedding:
+    """
+    One query text embedded at most once per embedding model, however many retrievers ask.
+
+    For group scenes: every NPC retrieves against the same situation, so the
+    first retriever that needs the vector embeds it (through its own cache and
+    scheduler) and the others wait for that result instead of sending their
+    own request. Retrievers that answer lexically never trigger the embed.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._lock = threading.Lock()
+        self._vectors: Dict[Tuple[str, str], "Future[List[float]]"] = {}
+        self.requests = 0
+        self.embeds = 0
+
+    def vector(self, retriever: "Retriever") -> List[float]:
+        key = (retriever.ollama_url, retriever.embed_model)
+        with self._lock:
+            self.requests += 1
+            future = self._vectors.get(key)
+            owner = future is None
+            if owner:
+                future = self._vectors[key] = Future()
+                self.embeds += 1
+        if owner:
+            try:
+                future.set_result(embed(
+                    self.text, ollama_url=retriever.ollama_url, model=retriever.embed_model,
+                    cache=retriever.cache, scheduler=retriever.scheduler
+                ))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+
+class BatchEmbedder:
+    """
+    Embeds many texts over a pooled OllamaTransport with a bounded worker pool.
+
+    Uses Ollama's /api/embed array input, falling back to one /api/embeddings
+    call per text on servers that predate it. Transient 5xx and connection
+    errors are retried with jittered backoff by the transport.
+    Texts already in the optional embedding cache are not sent at all. With a
+    scheduler attached, texts are queued as background work there instead.
+    """
+
+    def __init__(
+        self,
+        ollama_url: str = DEFAULT_OLLAMA_URL,
+        model: str = DEFAULT_EMBED_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        workers: int = EMBED_WORKERS,
+        timeout: float = 60,
+        retries: int = 3,
+        backoff: float = 0.5,
+        cache: Optional[EmbeddingCache] = None,
+        scheduler: Optional[OllamaScheduler] = None,
+    ):
+        self.ollama_url = ollama_url
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.cache = cache
+        self.scheduler = scheduler
+        from npcs.transport import OllamaTransport
+
+        self.transport = OllamaTransport(ollama_url, pool_maxsize=self.workers, retries=retries, backoff=backoff)
+        self.session = self.transport.session
+        self.supports_batch: Optional[bool] = None
+        self.embedded = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Chunks embedded per second of wall time spent in embed_many."""
+        return self.embedded / self.seconds if self.seconds else 0.0
+
+    def _embed_batch(self, texts: Sequence[str]) -> List[List[float]]:
+        if self.supports_batch is not False:
+            resp = self.transport.post(
+                "/api/embed",
+                json={"model": self.model, "input": list(texts)},
+                timeout=self.timeout,
+            )
+            if resp.status_code == 404:
+                self.supports_batch = False
+            else:
+                resp.raise_for_status()
+                self.supports_batch = True
+                vecs = resp.json().get("embeddings")
+                if not isinstance(vecs, list) or len(vecs) != len(texts):
+                    raise RuntimeError("Invalid batch embedding response from Ollama")
+                return vecs
+        return [self._embed_one(t) for t in texts]
+
+    def _embed_one(self, text: str) -> List[float]:
+        resp = self.transport.post(
+            "/api/embeddings",
+            json={"model": self.model, "prompt": text},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        vec = resp.json().get("embedding")
+        if not isinstance(vec, list):
+            raise RuntimeError("Invalid embedding response from Ollama")
+        return vec
+
+    def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        if self.cache is not None:
+            for i, text in enumerate(texts):
+                out[i] = self.cache.get(self.model, text)
+        todo = [i for i, vec in enumerate(out) if vec is None]
+        missing = [texts[i] for i in todo]
+
+        if self.scheduler is not None:
+            from npcs.scheduler import BACKGROUND
+
+            fresh = self.scheduler.embed_many(missing, self.model, priority=BACKGROUND)
+        else:
+            fresh = self._embed_pooled(missing)
+        for i, vec in zip(todo, fresh):
+            out[i] = vec
+            if self.cache is not None:
+                self.cache.put(self.model, texts[i], vec)
+        self.seconds += time.perf_counter() - start
+        self.embedded += len(texts)
+        return out  # type: ignore[return-value]
+
+    def _embed_pooled(self, texts: Sequence[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.supports_batch is None and batches:
+            # probe /api/embed once before fanning out so workers agree on the endpoint
+            results = [self._embed_batch(batches[0])]
+            rest = batches[1:]
+        else:
+            results, rest = [], batches
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results.extend(pool.map(self._embed_batch, rest))
+        return [vec for batch in results for vec in batch]
+
+    def close(self) -> None:
+        self.transport.close()
+
+
 def l2_norm(vec: List[float]) -> float:
     return math.sqrt(sum(x * x for x in vec))
 
@@ -137,20 +351,70 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
     return dot / (na * nb)
 
 
-def build_index(chunks: List[Chunk], ollama_url: str, embed_model: str) -> Dict[str, Any]:
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def build_index(
+    chunks: List[Chunk],
+    ollama_url: str,
+    embed_model: str,
+    embedder: Optional[BatchEmbedder] = None,
+    previous: Optional["VectorIndex"] = None,
+) -> Dict[str, Any]:
+    """
+    Embed chunks into a list-of-dicts index.
+
+    When a previous index built with the same embed model is given, chunks whose
+    id and text hash are unchanged reuse its embeddings; only added or modified
+    chunks are sent to Ollama, and chunks no longer present are dropped.
+    The returned dict carries a "stats" entry with reused/embedded/removed counts.
+    """
+    hashes = [text_hash(ch.text) for ch in chunks]
+    reusable: Dict[str, int] = {}
+    if previous is not None and previous.embed_model == embed_model:
+        for row, item in enumerate(previous.items):
+            if item.get("text_hash"):
+                reusable[item["id"]] = row
+
+    vecs: List[Optional[List[float]]] = [None] * len(chunks)
+    pending: List[int] = []
+    for i, (ch, h) in enumerate(zip(chunks, hashes)):
+        row = reusable.get(ch.id)
+        if row is not None and previous.items[row]["text_hash"] == h:
+            vecs[i] = previous.matrix[row].tolist()
+        else:
+            pending.append(i)
+
+    if pending:
+        owns_embedder = embedder is None
+        if embedder is None:
+            embedder = BatchEmbedder(ollama_url=ollama_url, model=embed_model)
+        try:
+            fresh = embedder.embed_many([chunks[i].text for i in pending])
+        finally:
+            if owns_embedder:
+                embedder.close()
+        for i, vec in zip(pending, fresh):
+            vecs[i] = vec
+
     index_items = []
-    for ch in chunks:
-        vec = embed(ch.text, ollama_url=ollama_url, model=embed_model)
+    for ch, h, vec in zip(chunks, hashes, vecs):
         index_items.append({
             "id": ch.id,
             "text": ch.text,
             "meta": ch.meta,
+            "text_hash": h,
             "embedding": vec,
+            "norm": l2_norm(vec),
         })
+    current_ids = {ch.id for ch in chunks}
+    removed = sum(1 for item in previous.items if item["id"] not in current_ids) if previous is not None else 0
     return {
         "ollama_url": ollama_url,
         "embed_model": embed_model,
         "items": index_items,
+        "stats": {"reused": len(chunks) - len(pending), "embedded": len(pending), "removed": removed},
     }
 
 
@@ -164,8 +428,286 @@ def load_json(path: str) -> Any:
         return json.load(f)
 
 
-def search_index(index: Dict[str, Any], query: str, ollama_url: str, embed_model: str, top_k: int = 5) -> List[Dict[str, Any]]:
-    qvec = embed(query, ollama_url=ollama_url, model=embed_model)
+class VectorIndex:
+    """
+    Index items packed into a contiguous float32 matrix with precomputed row norms.
+
+    Scoring a query is a single matrix-vector product followed by an
+    argpartition top-k, instead of a Python loop over every item. For large
+    corpora an optional IVF partition (see with_ivf) restricts scoring to the
+    nprobe lists nearest the query.
+    """
+
+    def __init__(self, matrix: np.ndarray, norms: np.ndarray, items: List[Dict[str, Any]], embed_model: Optional[str] = None, ollama_url: Optional[str] = None, ivf: Optional[IVFLists] = None):
+        if matrix.ndim != 2 or matrix.shape[0] != len(items) or norms.shape != (len(items),):
+            raise ValueError("Matrix, norms and items do not line up")
+        if ivf is not None and int(ivf.offsets[-1]) != len(items):
+            raise ValueError("IVF lists do not cover the index")
+        self.matrix = matrix
+        self.norms = norms
+        self.items = items
+        self.embed_model = embed_model
+        self.ollama_url = ollama_url
+        self.ivf = ivf
+
+    @classmethod
+    def from_index(cls, index: Dict[str, Any]) -> "VectorIndex":
+        raw_items = index.get("items", [])
+        dim = max((len(it["embedding"]) for it in raw_items), default=0)
+        matrix = np.zeros((len(raw_items), dim), dtype=np.float32)
+        for row, it in enumerate(raw_items):
+            vec = it["embedding"]
+            matrix[row, :len(vec)] = vec
+        if all("norm" in it for it in raw_items):
+            norms = np.asarray([it["norm"] for it in raw_items], dtype=np.float32)
+        else:
+            norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        # Embeddings live in the matrix only; items keep id/text/meta for results
+        items = [{k: v for k, v in it.items() if k not in ("embedding", "norm")} for it in raw_items]
+        return cls(matrix, norms, items, embed_model=index.get("embed_model"), ollama_url=index.get("ollama_url"))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+
+    @property
+    def npc_name(self) -> str:
+        if not self.items:
+            return "Bartender"
+        return self.items[0].get("meta", {}).get("npc_name") or "Bartender"
+
+    def scores(self, qvec: List[float]) -> np.ndarray:
+        q = np.asarray(qvec, dtype=np.float32)
+        matrix, norms = self.matrix, self.norms
+        if q.shape[0] != self.dim:
+            # same trimming behaviour as cosine_similarity for mismatched dims
+            n = min(q.shape[0], self.dim)
+            q = q[:n]
+            matrix = matrix[:, :n]
+            norms = np.linalg.norm(matrix, axis=1)
+        qn = float(np.linalg.norm(q))
+        if qn == 0 or len(self.items) == 0:
+            return np.zeros(len(self.items), dtype=np.float32)
+        denom = norms * qn
+        dots = matrix @ q
+        return np.divide(dots, denom, out=np.zeros_like(dots), where=denom != 0)
+
+    def score_rows(self, qvec: List[float], rows: Sequence[int]) -> np.ndarray:
+        """Cosine similarity of the query against just the given rows."""
+        q = np.asarray(qvec, dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int64)
+        qn = float(np.linalg.norm(q))
+        if q.shape[0] != self.dim or qn == 0:
+            return self.scores(qvec)[rows]
+        dots = np.asarray(self.matrix[rows]) @ q
+        denom = self.norms[rows] * qn
+        return np.divide(dots, denom, out=np.zeros_like(dots), where=denom != 0)
+
+    def search_vector(self, qvec: List[float], top_k: int = 5, nprobe: Optional[int] = None, exact: bool = False) -> List[Dict[str, Any]]:
+        """
+        Top-k items by cosine similarity.
+
+        With IVF lists attached the search is approximate unless exact is set;
+        nprobe overrides the index's default number of lists to scan.
+        """
+        if top_k <= 0 or not self.items:
+            return []
+        if self.ivf is not None and not exact and len(qvec) == self.dim:
+            q = np.asarray(qvec, dtype=np.float32)
+            qn = float(np.linalg.norm(q))
+            if qn > 0:
+                ranges = self.ivf.probe(q / qn, nprobe, min_rows=top_k)
+                rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+                dots = np.concatenate([self.matrix[start:end] @ q for start, end in ranges])
+                denom = self.norms[rows] * qn
+                sims = np.divide(dots, denom, out=np.zeros_like(dots), where=denom != 0)
+                return self._top_k(sims, rows, top_k)
+        sims = self.scores(qvec)
+        return self._top_k(sims, np.arange(sims.shape[0]), top_k)
+
+    def _top_k(self, sims: np.ndarray, rows: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        k = min(top_k, sims.shape[0])
+        if k < sims.shape[0]:
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(sims.shape[0])
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [dict(self.items[rows[i]], score=float(sims[i])) for i in top]
+
+    def with_ivf(self, nlist: Optional[int] = None, nprobe: Optional[int] = None, iterations: int = 10, seed: int = 0) -> "VectorIndex":
+        """
+        Copy of this index with rows regrouped into IVF lists for approximate search.
+
+        nlist defaults to ~2*sqrt(n); more lists make each probe cheaper but need
+        a higher nprobe for the same recall.
+        """
+        matrix = np.asarray(self.matrix, dtype=np.float32)
+        ivf, order = build_ivf(matrix, nlist=nlist, nprobe=nprobe, iterations=iterations, seed=seed)
+        return VectorIndex(
+            np.ascontiguousarray(matrix[order]), self.norms[order], [self.items[i] for i in order],
+            embed_model=self.embed_model, ollama_url=self.ollama_url, ivf=ivf,
+        )
+
+    def search(self, query: str, ollama_url: str, embed_model: str, top_k: int = 5, cache: Optional[EmbeddingCache] = None, nprobe: Optional[int] = None, exact: bool = False) -> List[Dict[str, Any]]:
+        qvec = embed(query, ollama_url=ollama_url, model=embed_model, cache=cache)
+        return self.search_vector(qvec, top_k=top_k, nprobe=nprobe, exact=exact)
+
+    def save(self, path: str) -> Tuple[str, str]:
+        """
+        Write the binary index: a raw float32 .npy matrix plus a small JSON sidecar.
+
+        IVF centroids, when present, go to a third .ivf.npy file. Every file is
+        written to a temporary name and renamed into place, matrix first and
+        sidecar last, so processes that have the old matrix memory-mapped keep
+        reading the old file. Returns the (matrix_path, sidecar_path) that were written.
+        """
+        matrix_path, sidecar_path = index_paths(path)
+        centroids_path = ivf_path(path)
+        write_atomic(matrix_path, lambda f: np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32), allow_pickle=False))
+        if self.ivf is not None:
+            write_atomic(centroids_path, lambda f: np.save(f, np.ascontiguousarray(self.ivf.centroids, dtype=np.float32), allow_pickle=False))
+        sidecar = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_FORMAT_VERSION,
+            "ollama_url": self.ollama_url,
+            "embed_model": self.embed_model,
+            "count": len(self.items),
+            "dim": self.dim,
+            "norms": [float(n) for n in self.norms],
+            "items": self.items,
+        }
+        if self.ivf is not None:
+            sidecar["ivf"] = {"nprobe": self.ivf.nprobe, "offsets": [int(o) for o in self.ivf.offsets]}
+        payload = json.dumps(sidecar, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        write_atomic(sidecar_path, lambda f: f.write(payload))
+        if self.ivf is None and os.path.exists(centroids_path):
+            os.remove(centroids_path)
+        return matrix_path, sidecar_path
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, attempts: int = 3) -> "VectorIndex":
+        """
+        Load a binary index; the matrix is memory-mapped read-only unless mmap is False.
+
+        A concurrent save can briefly leave a new matrix next to the old sidecar;
+        a mismatched pair is re-read up to attempts times before giving up.
+        """
+        attempt = 1
+        while True:
+            try:
+                return cls._load(path, mmap=mmap)
+            except ValueError:
+                if attempt >= attempts:
+                    raise
+                time.sleep(0.05 * attempt)
+                attempt += 1
+
+    @classmethod
+    def _load(cls, path: str, mmap: bool = True) -> "VectorIndex":
+        matrix_path, sidecar_path = index_paths(path)
+        sidecar = load_json(sidecar_path)
+        if sidecar.get("format") != INDEX_FORMAT:
+            raise ValueError(f"{sidecar_path} is not a {INDEX_FORMAT} sidecar")
+        matrix = np.load(matrix_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+        if matrix.dtype != np.float32:
+            raise ValueError(f"{matrix_path} has dtype {matrix.dtype}, expected float32")
+        norms = np.asarray(sidecar["norms"], dtype=np.float32)
+        ivf = None
+        if sidecar.get("ivf"):
+            ivf = IVFLists(
+                centroids=np.load(ivf_path(path), allow_pickle=False),
+                offsets=np.asarray(sidecar["ivf"]["offsets"], dtype=np.int64),
+                nprobe=int(sidecar["ivf"]["nprobe"]),
+            )
+        return cls(matrix, norms, sidecar["items"], embed_model=sidecar.get("embed_model"), ollama_url=sidecar.get("ollama_url"), ivf=ivf)
+
+
+def index_paths(path: str) -> Tuple[str, str]:
+    """
+    Map any index path (base, .npy, .meta.json or legacy .json) to its (matrix, sidecar) pair.
+    """
+    base = path
+    for suffix in (".meta.json", ".npy", ".json"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+            break
+    return base + ".npy", base + ".meta.json"
+
+
+def index_stamp(path: str) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of an index's sidecar, which save() replaces last; None when there is none yet."""
+    try:
+        st = os.stat(index_paths(path)[1])
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def write_atomic(path: str, write: Callable[[BinaryIO], Any]) -> None:
+    """Write path via a temporary file in the same directory and os.replace it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def ivf_path(path: str) -> str:
+    return index_paths(path)[0][: -len(".npy")] + ".ivf.npy"
+
+
+def lexical_path(path: str) -> str:
+    return index_paths(path)[0][: -len(".npy")] + ".lexical.json"
+
+
+def load_lexical(path: str, vindex: VectorIndex) -> LexicalIndex:
+    """Load the BM25 index saved next to path, rebuilding it from vindex's items if missing or stale."""
+    try:
+        lexical = LexicalIndex.load(lexical_path(path))
+    except (FileNotFoundError, ValueError, KeyError):
+        lexical = None
+    if lexical is None or not lexical.matches(it["id"] for it in vindex.items):
+        lexical = LexicalIndex.from_items(vindex.items)
+    return lexical
+
+
+def convert_json_index(json_path: str, out_path: Optional[str] = None) -> VectorIndex:
+    """Convert a legacy JSON index (embeddings inline) to the binary format and return it."""
+    vindex = VectorIndex.from_index(load_json(json_path))
+    vindex.save(out_path or json_path)
+    return vindex
+
+
+def load_index(path: str, mmap: bool = True) -> VectorIndex:
+    """
+    Load an index by path, converting a legacy JSON index to the binary format on first use.
+    """
+    matrix_path, sidecar_path = index_paths(path)
+    if os.path.exists(matrix_path) and os.path.exists(sidecar_path):
+        return VectorIndex.load(path, mmap=mmap)
+    legacy_path = matrix_path[: -len(".npy")] + ".json"
+    if path.endswith(".json") and not path.endswith(".meta.json"):
+        legacy_path = path
+    if os.path.exists(legacy_path):
+        convert_json_index(legacy_path)
+        return VectorIndex.load(path, mmap=mmap)
+    raise FileNotFoundError(f"No index found at {matrix_path} (or legacy {legacy_path})")
+
+
+def search_index(index: Dict[str, Any], query: str, ollama_url: str, embed_model: str, top_k: int = 5, cache: Optional[EmbeddingCache] = None) -> List[Dict[str, Any]]:
+    """
+    Reference implementation: exact pure-Python scan over the list-of-dicts index.
+
+    Kept for equivalence testing against VectorIndex; the CLI uses VectorIndex.
+    """
+    qvec = embed(query, ollama_url=ollama_url, model=embed_model, cache=cache)
     scored: List[Tuple[float, Dict[str, Any]]] = []
     for item in index.get("items", []):
         sim = cosine_similarity(qvec, item["embedding"])  # type: ignore
@@ -174,48 +716,544 @@ def search_index(index: Dict[str, Any], query: str, ollama_url: str, embed_model
     return [dict(item, score=float(score)) for score, item in scored[:top_k]]
 
 
+def recall_report(
+    vindex: VectorIndex,
+    top_k: int = 10,
+    queries: int = 200,
+    nprobes: Optional[Sequence[int]] = None,
+    noise: float = 0.1,
+    seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Measure ANN recall@k and latency against the exact scan.
+
+    Queries are index rows perturbed with Gaussian noise (noise is relative to
+    the row norm), so no embedding calls are needed. Returns exact-scan timings
+    and one entry per nprobe with recall, mean_ms and p95_ms.
+    """
+    if vindex.ivf is None:
+        raise ValueError("Index has no IVF lists; build it with --ivf-lists")
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vindex), min(queries, len(vindex)), replace=False)
+    base = np.asarray(vindex.matrix[np.sort(rows)], dtype=np.float32)
+    scale = (vindex.norms[np.sort(rows)] * noise / math.sqrt(vindex.dim))[:, None]
+    qs = base + rng.standard_normal(base.shape, dtype=np.float32) * scale
+
+    def run(**kwargs: Any) -> Tuple[List[set], List[float]]:
+        ids, times = [], []
+        for q in qs:
+            start = time.perf_counter()
+            hits = vindex.search_vector(q.tolist(), top_k=top_k, **kwargs)
+            times.append((time.perf_counter() - start) * 1000)
+            ids.append({h["id"] for h in hits})
+        return ids, times
+
+    truth, exact_times = run(exact=True)
+    runs = []
+    for nprobe in nprobes or sorted({1, vindex.ivf.nprobe // 2 or 1, vindex.ivf.nprobe, vindex.ivf.nprobe * 2}):
+        found, times = run(nprobe=nprobe)
+        recall = sum(len(f & t) / max(1, len(t)) for f, t in zip(found, truth)) / len(truth)
+        runs.append({"nprobe": nprobe, "recall": recall, "mean_ms": float(np.mean(times)), "p95_ms": float(np.percentile(times, 95))})
+    return {
+        "items": len(vindex),
+        "nlist": vindex.ivf.nlist,
+        "top_k": top_k,
+        "queries": len(qs),
+        "exact_mean_ms": float(np.mean(exact_times)),
+        "exact_p95_ms": float(np.percentile(exact_times, 95)),
+        "runs": runs,
+    }
+
+
+def print_recall_report(report: Dict[str, Any]) -> None:
+    print(f"recall@{report['top_k']} over {report['queries']} queries, {report['items']} items in {report['nlist']} lists")
+    print(f"exact scan: mean {report['exact_mean_ms']:.2f}ms, p95 {report['exact_p95_ms']:.2f}ms")
+    for r in report["runs"]:
+        print(f"nprobe={r['nprobe']:<5d} recall={r['recall']:.3f}  mean {r['mean_ms']:.2f}ms, p95 {r['p95_ms']:.2f}ms")
+
+
+def rules_block(hits: List[Dict[str, Any]]) -> str:
+    return "\n".join([f"- {h['text']}" for h in hits])
+
+
+COMPOSE_TEMPLATE = PromptTemplate((
+    Segment("persona", "You are roleplaying NPC {npc_name}, a bartender. Use the following retrieved rules and persona snippets to guide your response.\n"),
+    Segment("rules", "Rules and persona context (top-{top_k}):\n{rules}\n\n"),
+    Segment("input", "Player input: {query}\n\n"),
+    Segment("instructions", "Respond in JSON with fields: dialogue, actions, emotion, decision. Keep it concise and in-character."),
+))
+
+
 def compose_prompt(npc_name: str, query: str, hits: List[Dict[str, Any]]) -> str:
-    rules_block = "\n".join([f"- {h['text']}" for h in hits])
-    prompt = (
-        f"You are roleplaying NPC {npc_name}, a bartender. Use the following retrieved rules and persona snippets to guide your response.\n"
-        f"Rules and persona context (top-{len(hits)}):\n{rules_block}\n\n"
-        f"Player input: {query}\n\n"
-        f"Respond in JSON with fields: dialogue, actions, emotion, decision. Keep it concise and in-character."
-    )
-    return prompt
+    return COMPOSE_TEMPLATE.render(npc_name=npc_name, top_k=len(hits), rules=rules_block(hits), query=query)
+
+
+class Retriever:
+    """
+    Long-lived retriever for the live NPC loop.
+
+    Loads the index once (memory-mapped) and reuses one embedding cache, so each
+    turn only pays for a query embedding (or a cache hit) and one scoring pass.
+    Per-call timings are kept in last_timings and accumulated in totals.
+
+    mode selects the strategy:
+      vector         cosine similarity only (default)
+      hybrid         BM25 over text and tags fused with cosine similarity,
+                     alpha * cosine + (1 - alpha) * bm25
+      lexical-first  answer from BM25 alone when its best match scores at
+                     least lexical_confidence, skipping the embedding call;
+                     otherwise behave like hybrid
+    """
+
+    def __init__(
+        self,
+        index: VectorIndex,
+        ollama_url: Optional[str] = None,
+        embed_model: Optional[str] = None,
+        top_k: int = 4,
+        cache: Optional[EmbeddingCache] = None,
+        scheduler: Optional[OllamaScheduler] = None,
+        mode: str = "vector",
+        lexical: Optional[LexicalIndex] = None,
+        lexical_confidence: float = LEXICAL_CONFIDENCE,
+        alpha: float = 0.5,
+    ):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}")
+        self.index = index
+        self.ollama_url = ollama_url or index.ollama_url or DEFAULT_OLLAMA_URL
+        self.embed_model = embed_model or index.embed_model or DEFAULT_EMBED_MODEL
+        self.top_k = top_k
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.scheduler = scheduler
+        self.mode = mode
+        if lexical is None and mode != "vector":
+            lexical = LexicalIndex.from_items(index.items)
+        self.lexical = lexical
+        self.lexical_confidence = lexical_confidence
+        self.alpha = alpha
+        self._rows: Optional[Dict[str, int]] = None
+        self.last_timings: Dict[str, float] = {}
+        self.totals: Dict[str, float] = {"calls": 0, "embed_ms": 0.0, "score_ms": 0.0, "lexical_ms": 0.0, "embeds_skipped": 0}
+
+    @classmethod
+    def from_path(cls, path: str = DEFAULT_INDEX_PATH, **kwargs: Any) -> "Retriever":
+        index = load_index(path)
+        if kwargs.get("mode", "vector") != "vector" and kwargs.get("lexical") is None:
+            kwargs["lexical"] = load_lexical(path, index)
+        return cls(index, **kwargs)
+
+    @property
+    def npc_name(self) -> str:
+        return self.index.npc_name
+
+    def retrieve(self, query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.retrieve_with_timings(query, top_k=top_k)[0]
+
+    def retrieve_with_timings(
+        self,
+        query: str,
+        top_k: Optional[int] = None,
+        shared: Optional[SharedQueryEmbedding] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """
+        Like retrieve, also returning this call's timings (last_timings is shared between threads).
+
+        With shared (built for the same query), the query vector comes from
+        there, so retrievers serving one scene embed it only once.
+        """
+        top_k = top_k or self.top_k
+        timings: Dict[str, float] = {}
+        lexical_hits: List[Tuple[int, float]] = []
+        start = time.perf_counter()
+        if self.lexical is not None and self.mode != "vector":
+            lexical_hits = self.lexical.search(query, top_k=top_k * FUSION_CANDIDATES)
+            timings["lexical_ms"] = (time.perf_counter() - start) * 1000
+            if self.mode == "lexical-first" and lexical_hits and lexical_hits[0][1] >= self.lexical_confidence:
+                self.totals["embeds_skipped"] += 1
+                return self._record(timings, [
+                    dict(self.index.items[row], score=score, lexical_score=score, source="lexical")
+                    for row, score in lexical_hits[:top_k]
+                ])
+
+        started = time.perf_counter()
+        if shared is not None:
+            qvec = shared.vector(self)
+        else:
+            qvec = embed(query, ollama_url=self.ollama_url, model=self.embed_model, cache=self.cache, scheduler=self.scheduler)
+        embedded = time.perf_counter()
+        if self.mode == "vector":
+            hits = self.index.search_vector(qvec, top_k=top_k)
+        else:
+            hits = self._fuse(qvec, lexical_hits, top_k)
+        scored = time.perf_counter()
+        timings["embed_ms"] = (embedded - started) * 1000
+        timings["score_ms"] = (scored - embedded) * 1000
+        return self._record(timings, hits)
+
+    def _fuse(self, qvec: List[float], lexical_hits: List[Tuple[int, float]], top_k: int) -> List[Dict[str, Any]]:
+        if self._rows is None:
+            self._rows = {it["id"]: row for row, it in enumerate(self.index.items)}
+        lexical_scores = dict(lexical_hits)
+        rows = [self._rows[h["id"]] for h in self.index.search_vector(qvec, top_k=top_k * FUSION_CANDIDATES)]
+        seen = set(rows)
+        rows += [row for row in lexical_scores if row not in seen]
+        cosines = self.index.score_rows(qvec, rows)
+        fused = []
+        for row, cos in zip(rows, cosines):
+            lex = lexical_scores.get(row, 0.0)
+            fused.append(dict(
+                self.index.items[row],
+                score=self.alpha * float(cos) + (1 - self.alpha) * lex,
+                vector_score=float(cos),
+                lexical_score=lex,
+                source="hybrid",
+            ))
+        fused.sort(key=lambda h: -h["score"])
+        return fused[:top_k]
+
+    def _record(self, timings: Dict[str, float], hits: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        self.last_timings = timings
+        self.totals["calls"] += 1
+        for key, value in timings.items():
+            self.totals[key] += value
+        return hits, timings
+
+    def rules_for(self, query: str, top_k: Optional[int] = None) -> str:
+        """Retrieved rules rendered as a prompt-ready bullet list."""
+        return self.rules_with_timings(query, top_k=top_k)[0]
+
+    def rules_with_timings(
+        self,
+        query: str,
+        top_k: Optional[int] = None,
+        shared: Optional[SharedQueryEmbedding] = None
+    ) -> Tuple[str, Dict[str, float]]:
+        hits, timings = self.retrieve_with_timings(query, top_k=top_k, shared=shared)
+        return rules_block(hits), timings
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def build_rules_index(
+    rules_path: str,
+    out: str,
+    embedder: BatchEmbedder,
+    full: bool = False,
+    ivf_lists: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> Tuple[VectorIndex, Dict[str, Any]]:
+    """
+    Build (incrementally, unless full) and save the vector and BM25 indexes for one rules file.
+
+    ivf_lists follows the CLI convention: None picks automatically by size,
+    0 disables IVF and -1 uses the default list count. Returns the saved index
+    and build stats (reused/embedded/removed, plus ivf_seconds when trained).
+    """
+    chunks = build_chunks_from_rules(load_rules(rules_path))
+    previous = None
+    if not full:
+        try:
+            previous = load_index(out)
+        except (FileNotFoundError, ValueError, KeyError):
+            previous = None
+    index = build_index(chunks, ollama_url=embedder.ollama_url, embed_model=embedder.model, embedder=embedder, previous=previous)
+    # drop the memory map on the old matrix before overwriting its file
+    previous = None
+    vindex = VectorIndex.from_index(index)
+    stats: Dict[str, Any] = dict(index["stats"])
+    if ivf_lists is None:
+        ivf_lists = -1 if len(vindex) >= IVF_AUTO_MIN_ITEMS else 0
+    if ivf_lists != 0 and len(vindex) > 0:
+        start = time.perf_counter()
+        vindex = vindex.with_ivf(nlist=ivf_lists if ivf_lists > 0 else None, nprobe=nprobe)
+        stats["ivf_seconds"] = time.perf_counter() - start
+    vindex.save(out)
+    LexicalIndex.from_items(vindex.items).save(lexical_path(out))
+    return vindex, stats
 
 
 def cmd_build(args: argparse.Namespace) -> None:
-    rules = load_rules(args.rules)
-    chunks = build_chunks_from_rules(rules)
-    index = build_index(chunks, ollama_url=args.ollama_url, embed_model=args.embed_model)
-    save_json(args.out, index)
-    print(f"Built index with {len(index['items'])} items → {args.out}")
+    cache = EmbeddingCache(path=args.embed_cache)
+    embedder = BatchEmbedder(
+        ollama_url=args.ollama_url,
+        model=args.embed_model,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        cache=cache,
+    )
+    if args.rules_dir:
+        try:
+            cmd_build_all(args, embedder)
+        finally:
+            embedder.close()
+            cache.close()
+        return
+    try:
+        vindex, stats = build_rules_index(args.rules, args.out, embedder, full=args.full, ivf_lists=args.ivf_lists, nprobe=args.nprobe)
+    finally:
+        embedder.close()
+        cache.close()
+    if vindex.ivf is not None:
+        print(f"Trained {vindex.ivf.nlist} IVF lists (nprobe {vindex.ivf.nprobe}) in {stats['ivf_seconds']:.2f}s")
+    matrix_path, sidecar_path = index_paths(args.out)
+    print(f"Built index with {len(vindex)} items → {matrix_path} (+ {os.path.basename(sidecar_path)})")
+    print(f"Reused {stats['reused']}, embedded {stats['embedded']}, removed {stats['removed']}")
+    print(f"Embedded {embedder.embedded} chunks in {embedder.seconds:.2f}s ({embedder.throughput:.1f} chunks/sec)")
+    if args.recall and vindex.ivf is not None:
+        print_recall_report(recall_report(vindex))
 
 
-def cmd_query(args: argparse.Namespace) -> None:
-    index = load_json(args.index)
-    ollama_url = args.ollama_url or index.get("ollama_url", DEFAULT_OLLAMA_URL)
-    embed_model = args.embed_model or index.get("embed_model", DEFAULT_EMBED_MODEL)
+def cmd_build_all(args: argparse.Namespace, embedder: BatchEmbedder) -> None:
+    from npcs.registry import IndexRegistry
 
-    hits = search_index(index, args.query, ollama_url=ollama_url, embed_model=embed_model, top_k=args.top_k)
-    npc_name = (index.get("items", [{}])[0].get("meta", {}).get("npc_name") or "Bartender") if index.get("items") else "Bartender"
+    registry = IndexRegistry(rules_dir=args.rules_dir, index_dir=args.index_dir)
+    if not registry.discover():
+        print(f"No *_rules.json files found in {args.rules_dir}")
+        return
+    results = registry.build_all(embedder, stale_only=args.stale_only, full=args.full, ivf_lists=args.ivf_lists, nprobe=args.nprobe)
+    for npc_id, npc in registry.npcs.items():
+        stats = results.get(npc_id)
+        if stats is None:
+            print(f"{npc_id}: up to date → {npc.index_path}")
+        else:
+            print(f"{npc_id}: reused {stats['reused']}, embedded {stats['embedded']}, removed {stats['removed']} → {npc.index_path}")
+    print(f"Embedded {embedder.embedded} chunks in {embedder.seconds:.2f}s ({embedder.throughput:.1f} chunks/sec)")
 
-    if args.json:
-        out = {
-            "query": args.query,
-            "top_k": args.top_k,
+
+class QueryService:
+    """
+    What `query` needs to answer: loaded indexes, their retrievers and one embedding cache.
+
+    cmd_query builds one for a single query; `serve` keeps one resident behind
+    a unix socket, so repeated queries skip loading numpy, requests and the
+    index and reuse the transport's warm HTTP pool. Retrievers are keyed by
+    everything that shapes their results and share the cache, which is safe
+    across the daemon's handler threads. An index is reloaded (and its
+    retrievers rebuilt) once its sidecar changes, so a running daemon picks
+    up a `build` without a restart.
+    """
+
+    def __init__(self, embed_cache: Optional[str] = None, rules_dir: Optional[str] = None, index_dir: Optional[str] = None):
+        self.cache = EmbeddingCache(path=embed_cache)
+        self.rules_dir = rules_dir or os.path.dirname(os.path.abspath(__file__))
+        self.index_dir = index_dir
+        self._indexes: Dict[str, Tuple[Optional[Tuple[int, int]], VectorIndex]] = {}
+        self._retrievers: Dict[Tuple[Any, ...], Retriever] = {}
+        self._registry: Any = None
+        self._lock = threading.Lock()
+
+    def index_path(self, index: str, npc: Optional[str] = None) -> str:
+        if not npc:
+            return index
+        with self._lock:
+            if self._registry is None:
+                from npcs.registry import IndexRegistry
+
+                self._registry = IndexRegistry(rules_dir=self.rules_dir, index_dir=self.index_dir)
+            registry = self._registry
+        return registry.rules(npc).index_path
+
+    def index(self, path: str) -> VectorIndex:
+        with self._lock:
+            loaded = self._indexes.get(path)
+            if loaded is not None and loaded[0] == index_stamp(path):
+                return loaded[1]
+            vindex = load_index(path)
+            # stamped after loading: a legacy JSON index only gets its sidecar when converted
+            self._indexes[path] = (index_stamp(path), vindex)
+            return vindex
+
+    def retriever(self, path: str, mode: str, ollama_url: str, embed_model: str, top_k: int, lexical_confidence: float) -> Retriever:
+        key = (path, mode, ollama_url, embed_model, top_k, lexical_confidence)
+        vindex = self.index(path)
+        with self._lock:
+            retriever = self._retrievers.get(key)
+            if retriever is None or retriever.index is not vindex:
+                retriever = self._retrievers[key] = Retriever(
+                    vindex, ollama_url=ollama_url, embed_model=embed_model, top_k=top_k, cache=self.cache,
+                    mode=mode, lexical=load_lexical(path, vindex), lexical_confidence=lexical_confidence,
+                )
+            return retriever
+
+    def query(
+        self,
+        query: str,
+        index: str = DEFAULT_INDEX_PATH,
+        npc: Optional[str] = None,
+        top_k: int = 6,
+        mode: str = "vector",
+        ollama_url: Optional[str] = None,
+        embed_model: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        lexical_confidence: float = LEXICAL_CONFIDENCE,
+    ) -> Dict[str, Any]:
+        """The result `query --json` prints."""
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}")
+        path = self.index_path(index, npc)
+        vindex = self.index(path)
+        ollama_url = ollama_url or vindex.ollama_url or DEFAULT_OLLAMA_URL
+        embed_model = embed_model or vindex.embed_model or DEFAULT_EMBED_MODEL
+        if mode == "vector":
+            hits = vindex.search(query, ollama_url=ollama_url, embed_model=embed_model, top_k=top_k, cache=self.cache, nprobe=nprobe, exact=exact)
+            timings: Dict[str, float] = {}
+        else:
+            retriever = self.retriever(path, mode, ollama_url, embed_model, top_k, lexical_confidence)
+            hits, timings = retriever.retrieve_with_timings(query)
+        return {
+            "query": query,
+            "top_k": top_k,
             "results": hits,
-            "composed_prompt": compose_prompt(npc_name, args.query, hits),
+            "composed_prompt": compose_prompt(vindex.npc_name, query, hits),
+            "embedding_cache": self.cache.stats(),
+            "mode": mode,
+            "embedding_skipped": mode != "vector" and "embed_ms" not in timings,
         }
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def query_kwargs(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "query": args.query, "index": args.index, "npc": args.npc, "top_k": args.top_k, "mode": args.mode,
+        "ollama_url": args.ollama_url, "embed_model": args.embed_model, "nprobe": args.nprobe,
+        "exact": args.exact, "lexical_confidence": args.lexical_confidence,
+    }
+
+
+def print_query_result(out: Dict[str, Any], as_json: bool) -> None:
+    if as_json:
         print(json.dumps(out, ensure_ascii=False, indent=2))
+        return
+    print("Top results:")
+    for i, h in enumerate(out["results"], start=1):
+        print(f"{i}. score={h['score']:.3f} | {h['id']} :: {h['text']}")
+    print()
+    print("Composed prompt:")
+    print(out["composed_prompt"])
+
+
+def cmd_query(args: argparse.Namespace) -> None:
+    if args.socket:
+        from npcs import rag_client
+
+        try:
+            # the daemon resolves paths against its own working directory
+            kwargs = dict(query_kwargs(args), index=os.path.abspath(args.index))
+            print_query_result(rag_client.query(args.socket, **kwargs), args.json)
+            return
+        except rag_client.DaemonUnavailable:
+            # no daemon listening; answer in-process like a plain `query`
+            pass
+    service = QueryService(embed_cache=args.embed_cache, rules_dir=args.rules_dir, index_dir=args.index_dir)
+    try:
+        out = service.query(**query_kwargs(args))
+    finally:
+        service.close()
+    print_query_result(out, args.json)
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            reply = self.server.dispatch(line)
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class RAGDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Resident query process for `query --socket` and npcs/rag_client.py.
+
+    Speaks newline-delimited JSON over a unix socket: each request is an
+    object with an "op" ("ping", "query" or "shutdown"; query takes the
+    QueryService.query arguments) and gets one {"ok": ...} object back.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, service: QueryService):
+        self.path = path
+        self.service = service
+        self.queries = 0
+        self.started = time.time()
+        self._queries_lock = threading.Lock()
+        if os.path.exists(path):
+            self._remove_stale_socket(path)
+        super().__init__(path, _DaemonHandler)
+
+    @staticmethod
+    def _remove_stale_socket(path: str) -> None:
+        """Unlink a socket left behind by a daemon that didn't shut down cleanly; refuse a live one."""
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+        finally:
+            probe.close()
+        raise OSError(errno.EADDRINUSE, f"A query daemon is already listening on {path}")
+
+    def dispatch(self, line: bytes) -> Dict[str, Any]:
+        try:
+            request = json.loads(line)
+            op = request.pop("op", "query")
+            if op == "ping":
+                return {"ok": True, "pid": os.getpid(), "queries": self.queries, "uptime_s": time.time() - self.started}
+            if op == "shutdown":
+                threading.Thread(target=self.shutdown, daemon=True).start()
+                return {"ok": True}
+            if op != "query":
+                return {"ok": False, "error": f"Unknown op {op!r}"}
+            result = self.service.query(**request)
+            with self._queries_lock:
+                self.queries += 1
+            return {"ok": True, "result": result}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.service.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def cmd_serve(args: argparse.Namespace) -> None:
+    service = QueryService(embed_cache=args.embed_cache, rules_dir=args.rules_dir, index_dir=args.index_dir)
+    try:
+        server = RAGDaemon(args.socket, service)
+    except OSError as e:
+        service.close()
+        sys.exit(str(e))
+    with server:
+        for path in args.preload or ():
+            # pay for numpy, the index and the first embedding connection before the first client does;
+            # clients connecting meanwhile wait in the listen backlog
+            try:
+                service.query("warm up", index=path, top_k=1)
+            except Exception as e:
+                print(f"Warm-up query against {path} failed: {e}", file=sys.stderr)
+        print(f"Serving queries on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def cmd_recall(args: argparse.Namespace) -> None:
+    report = recall_report(load_index(args.index), top_k=args.top_k, queries=args.queries, nprobes=args.nprobe, noise=args.noise)
+    if args.json:
+        print(json.dumps(report, indent=2))
     else:
-        print("Top results:")
-        for i, h in enumerate(hits, start=1):
-            print(f"{i}. score={h['score']:.3f} | {h['id']} :: {h['text']}")
-        print()
-        print("Composed prompt:")
-        print(compose_prompt(npc_name, args.query, hits))
+        print_recall_report(report)
 
 
 def build_arg_parser() -> argparse.ArgumentParser:
@@ -226,18 +1264,54 @@ def build_arg_parser() -> argparse.ArgumentParser:
     pb.add_argument("--rules", default=os.path.join(os.path.dirname(__file__), "bartender_rules.json"), help="Path to rules JSON")
     pb.add_argument("--ollama-url", default=DEFAULT_OLLAMA_URL, help="Ollama base URL")
     pb.add_argument("--embed-model", default=DEFAULT_EMBED_MODEL, help="Embedding model name (Ollama)")
-    pb.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "bartender_rules_index.json"), help="Output index JSON path")
+    pb.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding request")
+    pb.add_argument("--workers", type=int, default=EMBED_WORKERS, help="Concurrent embedding requests")
+    pb.add_argument("--full", action="store_true", help="Re-embed every chunk instead of reusing unchanged ones from the existing index")
+    pb.add_argument("--out", default=DEFAULT_INDEX_PATH, help="Output index path (.npy matrix; a .meta.json sidecar is written next to it)")
+    pb.add_argument("--embed-cache", default=os.environ.get("EMBED_CACHE_PATH"), help="sqlite file for the persistent embedding cache (default: $EMBED_CACHE_PATH, memory only if unset)")
+    pb.add_argument("--ivf-lists", type=int, default=None, help=f"IVF lists for approximate search: 0 = exact only, -1 = ~2*sqrt(n) (default: -1 from {IVF_AUTO_MIN_ITEMS} items, else 0)")
+    pb.add_argument("--nprobe", type=int, default=None, help="Default lists scanned per query (higher = better recall, slower)")
+    pb.add_argument("--recall", action="store_true", help="Print a recall@k report against the exact scan after building")
+    pb.add_argument("--rules-dir", default=None, help="Build one index per <npc>_rules.json in this directory instead of a single --rules file")
+    pb.add_argument("--index-dir", default=None, help="Where --rules-dir indexes are written (default: the rules directory)")
+    pb.add_argument("--stale-only", action="store_true", help="With --rules-dir, skip NPCs whose index is newer than their rules file")
     pb.set_defaults(func=cmd_build)
 
     pq = sub.add_parser("query", help="Query the index and produce a composed prompt")
     pq.add_argument("query", help="User/player query to retrieve relevant rules")
-    pq.add_argument("--index", default=os.path.join(os.path.dirname(__file__), "bartender_rules_index.json"), help="Path to the built index JSON")
+    pq.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Path to the built index (.npy); legacy JSON indexes are converted automatically")
+    pq.add_argument("--npc", default=None, help="Query this NPC's index from the rules registry instead of --index")
+    pq.add_argument("--rules-dir", default=os.path.dirname(os.path.abspath(__file__)), help="Directory of <npc>_rules.json files used to resolve --npc")
+    pq.add_argument("--index-dir", default=None, help="Directory holding the --npc indexes (default: the rules directory)")
     pq.add_argument("--ollama-url", default=None, help="Override Ollama base URL (defaults to index or env)")
     pq.add_argument("--embed-model", default=None, help="Override embedding model (defaults to index or env)")
     pq.add_argument("--top-k", type=int, default=6, help="Number of results to retrieve")
     pq.add_argument("--json", action="store_true", help="Print JSON output including composed prompt")
+    pq.add_argument("--embed-cache", default=os.environ.get("EMBED_CACHE_PATH"), help="sqlite file for the persistent embedding cache (default: $EMBED_CACHE_PATH, memory only if unset)")
+    pq.add_argument("--nprobe", type=int, default=None, help="IVF lists to scan (defaults to the index's setting)")
+    pq.add_argument("--exact", action="store_true", help="Ignore IVF lists and scan every item")
+    pq.add_argument("--mode", choices=RETRIEVAL_MODES, default="vector", help="vector only, BM25+vector hybrid, or lexical-first (skip embedding on confident keyword/tag matches)")
+    pq.add_argument("--lexical-confidence", type=float, default=LEXICAL_CONFIDENCE, help="Normalized BM25 score needed to answer lexical-first queries without embedding")
+    pq.add_argument("--socket", default=None, help="Ask the `serve` daemon on this unix socket, answering in-process if none is running")
     pq.set_defaults(func=cmd_query)
 
+    ps = sub.add_parser("serve", help="Keep indexes, embedding cache and HTTP pool resident for `query --socket`")
+    ps.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on (default: $RAG_SOCKET or $TMPDIR/bartender_rag.sock)")
+    ps.add_argument("--preload", nargs="*", default=None, help="Index paths to load (and embed a warm-up query against) at startup")
+    ps.add_argument("--rules-dir", default=os.path.dirname(os.path.abspath(__file__)), help="Directory of <npc>_rules.json files used to resolve npc queries")
+    ps.add_argument("--index-dir", default=None, help="Directory holding the npc indexes (default: the rules directory)")
+    ps.add_argument("--embed-cache", default=os.environ.get("EMBED_CACHE_PATH"), help="sqlite file for the persistent embedding cache (default: $EMBED_CACHE_PATH, memory only if unset)")
+    ps.set_defaults(func=cmd_serve)
+
+    pr = sub.add_parser("recall", help="Report ANN recall@k and latency against the exact scan")
+    pr.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Path to an index built with IVF lists")
+    pr.add_argument("--top-k", type=int, default=10)
+    pr.add_argument("--queries", type=int, default=200, help="Number of sampled queries")
+    pr.add_argument("--nprobe", type=int, nargs="+", default=None, help="nprobe values to compare")
+    pr.add_argument("--noise", type=float, default=0.1, help="Relative noise added to sampled rows to form queries")
+    pr.add_argument("--json", action="store_true")
+    pr.set_defaults(func=cmd_recall)
+
     return p
 
 
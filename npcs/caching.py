@@ -0,0 +1,306 @@
+import copy
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU map with hit/miss counters.
+
+    A max_entries of 0 disables caching (every get is a miss, puts are dropped).
+    With a ttl (seconds), entries older than ttl are treated as misses and dropped.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                value, stored = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            if self.ttl is not None and time.monotonic() - stored > self.ttl:
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data[key] = (value, stored)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.monotonic())
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteEmbeddingStore:
+    """
+    On-disk embedding store keyed by (model, text), bounded to max_entries rows.
+
+    Vectors are stored as packed float32 blobs; the least recently used rows
+    are evicted once the table grows past max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, text TEXT NOT NULL, vec BLOB NOT NULL, used REAL NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+        self._conn.commit()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vec FROM embeddings WHERE model = ? AND text = ?", (model, text)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE embeddings SET used = ? WHERE model = ? AND text = ?", (time.time(), model, text)
+            )
+            self._conn.commit()
+        return array("f", row[0]).tolist()
+
+    def put(self, model: str, text: str, vec: List[float]) -> None:
+        blob = array("f", vec).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, vec, used) VALUES (?, ?, ?, ?)",
+                (model, text, blob, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN"
+                    " (SELECT rowid FROM embeddings ORDER BY used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by (embed_model, normalized text).
+
+    An in-process LRU sits in front of an optional sqlite store, so repeated
+    player inputs ("beer!", "Beer! ") skip the Ollama round trip, across
+    restarts when a path is given.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None, max_disk_entries: int = 100_000):
+        self.memory = LRUCache(max_entries)
+        self.disk = SqliteEmbeddingStore(path, max_disk_entries) if path else None
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()).casefold()
+
+    def _key(self, model: str, text: str) -> Tuple[str, str]:
+        return model, self.normalize(text)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self._key(model, text)
+        vec = self.memory.get(key)
+        if vec is not None:
+            return vec
+        if self.disk is not None:
+            vec = self.disk.get(*key)
+            if vec is not None:
+                self.disk_hits += 1
+                self.memory.put(key, vec)
+                return vec
+        self.misses += 1
+        return None
+
+    def put(self, model: str, text: str, vec: List[float]) -> None:
+        key = self._key(model, text)
+        self.memory.put(key, vec)
+        if self.disk is not None:
+            self.disk.put(*key, vec)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory.hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+        }
+
+    def close(self) -> None:
+        if self.disk is not None:
+            self.disk.close()
+
+
+
+class SqliteResponseStore:
+    """
+    On-disk response store: JSON values keyed by string, with optional TTL and a row bound.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY used ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Opt-in cache of parsed NPC responses for deterministic (low-temperature) turns.
+
+    Keys are a sha256 of the final request payload: prompt, model and sampling
+    options. Requests above max_temperature bypass the cache entirely. The
+    backend is "memory" (LRU) or "sqlite" (needs path); both honour ttl and
+    max_entries.
+    """
+
+    def __init__(
+        self,
+        backend: str = "memory",
+        path: Optional[str] = None,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        max_temperature: float = 0.3,
+    ):
+        if backend == "memory":
+            self.store: Any = LRUCache(max_entries, ttl=ttl)
+        elif backend == "sqlite":
+            if not path:
+                raise ValueError("The sqlite response cache backend needs a path")
+            self.store = SqliteResponseStore(path, max_entries=max_entries, ttl=ttl)
+        else:
+            raise ValueError(f"Unknown response cache backend: {backend}")
+        self.backend = backend
+        self.max_temperature = max_temperature
+        self.bypassed = 0
+
+    @staticmethod
+    def key(payload: Dict[str, Any]) -> str:
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def accepts(self, temperature: float) -> bool:
+        """False (and counted as a bypass) when the request is too random to cache."""
+        if temperature > self.max_temperature:
+            self.bypassed += 1
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.store.get(key)
+        # hand out copies so callers can't mutate the cached response
+        return copy.deepcopy(value) if value is not None else None
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        self.store.put(key, copy.deepcopy(response))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.store.hits + self.store.misses
+        return {
+            "backend": self.backend,
+            "hits": self.store.hits,
+            "misses": self.store.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.store.hits / lookups if lookups else 0.0,
+            "entries": len(self.store),
+        }
+
+    def close(self) -> None:
+        if isinstance(self.store, SqliteResponseStore):
+            self.store.close()
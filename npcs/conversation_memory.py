@@ -0,0 +1,122 @@
+import json
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text).
+
+    Good enough for budgeting prompts without running the model's tokenizer.
+    """
+    return tokens_for_length(len(text)) if text else 0
+
+
+def tokens_for_length(chars: int) -> int:
+    """estimate_tokens for a text of the given length, without needing the text."""
+    return (chars + 3) // 4 if chars > 0 else 0
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(0, max_tokens * 4 - 3)].rstrip() + "..."
+
+
+class ConversationMemory:
+    """
+    Rolling conversation context held to a fixed token budget.
+
+    The most recent turns are kept verbatim as compact JSON. Turns that fall out
+    of the verbatim window are condensed into one-line summaries, and the oldest
+    summaries are dropped once they exceed summary_budget. Each turn is
+    serialized once when added, so rendering costs O(budget) per turn no matter
+    how long the session runs.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 1024,
+        max_recent_turns: int = 8,
+        summary_budget: Optional[int] = None,
+        summary_chars: int = 80
+    ):
+        self.token_budget = token_budget
+        self.max_recent_turns = max(1, max_recent_turns)
+        self.summary_budget = summary_budget if summary_budget is not None else token_budget // 4
+        self.summary_chars = summary_chars
+        self._recent: Deque[Tuple[str, str, str, int]] = deque()
+        self._recent_tokens = 0
+        self._summary: Deque[Tuple[str, int]] = deque()
+        self._summary_tokens = 0
+        self._rendered: Optional[str] = None
+        self.turns_seen = 0
+        self.turns_dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._recent) + len(self._summary)
+
+    @property
+    def tokens(self) -> int:
+        """Estimated tokens of the rendered context."""
+        return estimate_tokens(self.render())
+
+    def add_turn(self, player_input: str, npc_response: str) -> None:
+        recent_budget = max(1, self.token_budget - self.summary_budget)
+        line = self._render_turn(player_input, npc_response)
+        tokens = estimate_tokens(line)
+        if tokens > recent_budget:
+            npc_response = truncate_to_tokens(npc_response, recent_budget // 2)
+            player_input = truncate_to_tokens(player_input, recent_budget // 4)
+            line = self._render_turn(player_input, npc_response)
+            tokens = estimate_tokens(line)
+
+        self._recent.append((player_input, npc_response, line, tokens))
+        self._recent_tokens += tokens
+        self.turns_seen += 1
+
+        while len(self._recent) > 1 and (
+            len(self._recent) > self.max_recent_turns or self._recent_tokens > recent_budget
+        ):
+            old_input, old_response, _, old_tokens = self._recent.popleft()
+            self._recent_tokens -= old_tokens
+            self._summarize(old_input, old_response)
+        self._rendered = None
+
+    def _summarize(self, player_input: str, npc_response: str) -> None:
+        summary = f"player: {self._clip(player_input)} / npc: {self._clip(npc_response)}"
+        tokens = estimate_tokens(summary) + 1
+        self._summary.append((summary, tokens))
+        self._summary_tokens += tokens
+        while self._summary and self._summary_tokens > self.summary_budget:
+            _, dropped = self._summary.popleft()
+            self._summary_tokens -= dropped
+            self.turns_dropped += 1
+
+    def _clip(self, text: str) -> str:
+        text = " ".join(text.split())
+        if len(text) <= self.summary_chars:
+            return text
+        return text[: self.summary_chars - 3].rstrip() + "..."
+
+    @staticmethod
+    def _render_turn(player_input: str, npc_response: str) -> str:
+        return json.dumps({"player": player_input, "npc": npc_response}, ensure_ascii=False, separators=(",", ":"))
+
+    def render(self) -> str:
+        """Prompt-ready context string: earlier-turn summary, then recent turns as compact JSON."""
+        if self._rendered is None:
+            parts = []
+            if self._summary:
+                parts.append("Earlier: " + "; ".join(s for s, _ in self._summary))
+            if self._recent:
+                parts.append("Recent turns: [" + ",".join(line for _, _, line, _ in self._recent) + "]")
+            self._rendered = "\n".join(parts)
+        return self._rendered
+
+    def clear(self) -> None:
+        self._recent.clear()
+        self._summary.clear()
+        self._recent_tokens = 0
+        self._summary_tokens = 0
+        self._rendered = None
@@ -0,0 +1,23 @@
+import importlib
+import types
+from typing import Any
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    Lets CLI entry points define everything at module level without paying
+    for numpy or requests on paths that never touch them. After the first
+    access the real module's namespace is copied in, so later lookups cost
+    the same as on the module itself.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def lazy_import(name: str) -> Any:
+    return LazyModule(name)
@@ -0,0 +1,135 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+LEXICAL_FORMAT = "bartender_rag.lexical"
+LEXICAL_FORMAT_VERSION = 1
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ing", "ed", "es", "s", "e")
+STOPWORDS = frozenset(
+    "a about an and any are as at be but by can could do does for from get give got have how i if "
+    "in is it its just like me much my of on or please really so some tell that the their them "
+    "then there this to want was we what when where which who will with would you your".split()
+)
+
+
+def stem(word: str) -> str:
+    """Crude suffix stripping so "drinks"/"drinking" and "price"/"pricing" meet."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over chunk text plus meta tags.
+
+    Tags count tag_boost times as much as a word in the text (a lightweight
+    BM25F), so a query mentioning "alcohol" lands on rules tagged alcohol even
+    when the rule text words it differently. Rows line up with the VectorIndex
+    items the index was built from.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        doc_len: List[float],
+        postings: Dict[str, List[Tuple[int, float]]],
+        k1: float = 1.2,
+        b: float = 0.75,
+        tag_boost: float = 2.0
+    ):
+        self.ids = ids
+        self.doc_len = doc_len
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.tag_boost = tag_boost
+        self.avg_len = sum(doc_len) / len(doc_len) if doc_len else 0.0
+
+    @classmethod
+    def from_items(cls, items: Sequence[Dict[str, Any]], k1: float = 1.2, b: float = 0.75, tag_boost: float = 2.0) -> "LexicalIndex":
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        doc_len: List[float] = []
+        for row, item in enumerate(items):
+            tf: Counter = Counter(tokenize(item.get("text", "")))
+            for tag in item.get("meta", {}).get("tags", []) or []:
+                for token in tokenize(str(tag)):
+                    tf[token] += tag_boost
+            for token, count in tf.items():
+                postings[token].append((row, float(count)))
+            doc_len.append(float(sum(tf.values())))
+        return cls([it["id"] for it in items], doc_len, dict(postings), k1=k1, b=b, tag_boost=tag_boost)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def idf(self, token: str) -> float:
+        df = len(self.postings.get(token, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Top-k (row, score) pairs, with BM25 scores normalized to about [0, 1].
+
+        Scores are relative to a document of average length containing every
+        query term once, so the top score doubles as a confidence: queries
+        full of words the index has never seen come out low even if one term
+        matched.
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.ids:
+            return []
+        scores: Dict[int, float] = defaultdict(float)
+        ceiling = 0.0
+        for token in terms:
+            idf = self.idf(token)
+            ceiling += idf
+            for row, tf in self.postings.get(token, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[row] / self.avg_len)
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]
+        return [(row, min(1.0, score / ceiling)) for row, score in ranked]
+
+    def matches(self, ids: Iterable[str]) -> bool:
+        return list(ids) == self.ids
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "format": LEXICAL_FORMAT,
+            "version": LEXICAL_FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "tag_boost": self.tag_boost,
+            "ids": self.ids,
+            "doc_len": self.doc_len,
+            "postings": {t: [[row, tf] for row, tf in plist] for t, plist in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LexicalIndex":
+        if data.get("format") != LEXICAL_FORMAT:
+            raise ValueError(f"Not a {LEXICAL_FORMAT} file")
+        postings = {t: [(int(row), float(tf)) for row, tf in plist] for t, plist in data["postings"].items()}
+        return cls(data["ids"], data["doc_len"], postings, k1=data["k1"], b=data["b"], tag_boost=data["tag_boost"])
+
+    def save(self, path: str) -> None:
+        # imported here: bartender_rag imports this module
+        from npcs.bartender_rag import write_atomic
+
+        # temp file + rename, so readers never see a half-written index
+        payload = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        write_atomic(path, lambda f: f.write(payload))
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,264 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from npcs.npc_response import FALLBACK, OUTCOMES, VALID
+
+# seconds; spans range from sub-millisecond scoring to multi-second generations
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Ollama response fields (nanoseconds) -> stage names in TurnMetrics.spans
+OLLAMA_DURATIONS = {
+    "load_duration": "ollama_load",
+    "prompt_eval_duration": "ollama_prompt_eval",
+    "eval_duration": "ollama_eval",
+    "total_duration": "ollama_total",
+}
+
+
+@dataclass
+class TurnMetrics:
+    """
+    Timing breakdown for one NPC turn.
+
+    spans holds milliseconds per stage: lexical/embed/score (retrieval), prompt, cache,
+    request (HTTP round trip, including any scheduler queueing), first_token
+    (streaming only), parse, plus the ollama_* durations Ollama reports for the
+    generation itself. network is request minus ollama_total, i.e. time spent
+    outside the model.
+
+    When the client knows roughly how many prompt tokens a cold prefill would
+    cost (expected_prompt_tokens), the shortfall in Ollama's prompt_eval_count
+    is counted as est_reused_prompt_tokens and priced at the turn's own
+    prefill rate (prompt_eval_duration / prompt_eval_count) in
+    est_prefill_saved_ms. The est_ prefix is literal: expected tokens come
+    from a characters-per-token heuristic, not the model's tokenizer, so
+    treat these as a trend, not a measurement.
+
+    response is how the reply was obtained (valid, repaired, reasked or
+    fallback; see npcs.npc_response); empty for cached, streamed-text and
+    failed turns.
+    """
+
+    npc: str = ""
+    model: str = ""
+    spans: Dict[str, float] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    eval_tokens: int = 0
+    expected_prompt_tokens: int = 0
+    est_reused_prompt_tokens: int = 0
+    est_prefill_saved_ms: float = 0.0
+    cached: bool = False
+    streamed: bool = False
+    error: bool = False
+    response: str = ""
+    started: float = field(default_factory=time.time)
+    total_ms: float = 0.0
+    _t0: float = field(default_factory=time.perf_counter, repr=False)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def add_timings(self, timings: Dict[str, float]) -> None:
+        """Merge a {"embed_ms": ..., "prompt_ms": ...} dict as spans."""
+        for key, value in timings.items():
+            self.spans[key[:-3] if key.endswith("_ms") else key] = value
+
+    def record_ollama(self, result: Dict[str, Any]) -> None:
+        """Pick up token counts and durations from an Ollama generate/chat response body."""
+        for source, name in OLLAMA_DURATIONS.items():
+            value = result.get(source)
+            if isinstance(value, (int, float)):
+                self.spans[name] = value / 1e6
+        if isinstance(result.get("prompt_eval_count"), int):
+            self.prompt_tokens = result["prompt_eval_count"]
+        if isinstance(result.get("eval_count"), int):
+            self.eval_tokens = result["eval_count"]
+        if self.expected_prompt_tokens and self.prompt_tokens:
+            self.est_reused_prompt_tokens = max(0, self.expected_prompt_tokens - self.prompt_tokens)
+            per_token_ms = self.spans.get("ollama_prompt_eval", 0.0) / self.prompt_tokens
+            self.est_prefill_saved_ms = self.est_reused_prompt_tokens * per_token_ms
+
+    def finish(self) -> "TurnMetrics":
+        self.total_ms = (time.perf_counter() - self._t0) * 1000
+        if "request" in self.spans and "ollama_total" in self.spans:
+            self.spans["network"] = max(0.0, self.spans["request"] - self.spans["ollama_total"])
+        return self
+
+    @property
+    def eval_tokens_per_sec(self) -> Optional[float]:
+        eval_ms = self.spans.get("ollama_eval")
+        if not eval_ms or not self.eval_tokens:
+            return None
+        return self.eval_tokens / (eval_ms / 1000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ts": self.started,
+            "npc": self.npc,
+            "model": self.model,
+            "total_ms": round(self.total_ms, 3),
+            "spans_ms": {k: round(v, 3) for k, v in self.spans.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "eval_tokens": self.eval_tokens,
+            "eval_tokens_per_sec": self.eval_tokens_per_sec,
+            "est_reused_prompt_tokens": self.est_reused_prompt_tokens,
+            "est_prefill_saved_ms": round(self.est_prefill_saved_ms, 3),
+            "cached": self.cached,
+            "streamed": self.streamed,
+            "error": self.error,
+            "response": self.response,
+        }
+
+    def breakdown(self) -> str:
+        """One-line human-readable summary for debug output."""
+        s = self.spans
+        parts = [f"{name} {s[name]:.1f}ms" for name in ("lexical", "embed", "score", "prompt", "cache") if name in s]
+        if "request" in s:
+            request = f"request {s['request']:.1f}ms"
+            if "ollama_total" in s:
+                request += (
+                    f" (load {s.get('ollama_load', 0.0):.1f}ms,"
+                    f" prefill {s.get('ollama_prompt_eval', 0.0):.1f}ms/{self.prompt_tokens} tok,"
+                    f" decode {s.get('ollama_eval', 0.0):.1f}ms/{self.eval_tokens} tok,"
+                    f" network {s.get('network', 0.0):.1f}ms)"
+                )
+            if self.est_reused_prompt_tokens:
+                request += f" [prefix reused ~{self.est_reused_prompt_tokens} tok, ~{self.est_prefill_saved_ms:.1f}ms saved]"
+            parts.append(request)
+        if "first_token" in s:
+            parts.append(f"first token {s['first_token']:.1f}ms")
+        if "parse" in s:
+            parts.append(f"parse {s['parse']:.1f}ms")
+        flags = [name for name, on in (("cached", self.cached), ("error", self.error)) if on]
+        if self.response and self.response != VALID:
+            flags.append(self.response)
+        total = f"total {self.total_ms:.1f}ms" + (f" [{', '.join(flags)}]" if flags else "")
+        return " | ".join(parts + [total])
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRegistry:
+    """
+    Aggregates TurnMetrics into Prometheus-style histograms and counters.
+
+    Every observed turn can also be appended to a JSON-lines file (jsonl_path)
+    for offline analysis. Safe to share between threads and sessions.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, jsonl_path: Optional[str] = None):
+        self.buckets = tuple(buckets)
+        self.jsonl_path = jsonl_path
+        self._stages: Dict[str, _Histogram] = {}
+        self._turns = _Histogram(self.buckets)
+        self._outcomes: Dict[str, int] = {"ok": 0, "cached": 0, "error": 0}
+        self._responses: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+        self._tokens: Dict[str, int] = {"prompt": 0, "eval": 0, "est_reused_prompt": 0}
+        self._est_prefill_saved = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, turn: TurnMetrics) -> None:
+        outcome = "error" if turn.error else "cached" if turn.cached else "ok"
+        with self._lock:
+            self._turns.observe(turn.total_ms / 1000)
+            for stage, ms in turn.spans.items():
+                if stage not in self._stages:
+                    self._stages[stage] = _Histogram(self.buckets)
+                self._stages[stage].observe(ms / 1000)
+            self._outcomes[outcome] += 1
+            if turn.response in self._responses:
+                self._responses[turn.response] += 1
+            self._tokens["prompt"] += turn.prompt_tokens
+            self._tokens["eval"] += turn.eval_tokens
+            self._tokens["est_reused_prompt"] += turn.est_reused_prompt_tokens
+            self._est_prefill_saved += turn.est_prefill_saved_ms / 1000
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(turn.to_dict(), separators=(",", ":")) + "\n")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counts and mean milliseconds per stage, for /stats style JSON endpoints."""
+        with self._lock:
+            return {
+                "turns": dict(self._outcomes),
+                "responses": dict(self._responses),
+                "fallback_rate": self._fallback_rate(),
+                "tokens": dict(self._tokens),
+                "mean_turn_ms": self._turns.sum / self._turns.count * 1000 if self._turns.count else 0.0,
+                "mean_est_prefill_saved_ms": self._est_prefill_saved / self._turns.count * 1000 if self._turns.count else 0.0,
+                "stages_mean_ms": {
+                    stage: h.sum / h.count * 1000 for stage, h in sorted(self._stages.items()) if h.count
+                },
+            }
+
+    def _fallback_rate(self) -> float:
+        parsed = sum(self._responses.values())
+        return self._responses[FALLBACK] / parsed if parsed else 0.0
+
+    def to_prometheus(self) -> str:
+        """Render in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            lines += [
+                "# HELP npc_turn_seconds Wall time of a whole NPC turn.",
+                "# TYPE npc_turn_seconds histogram",
+            ]
+            lines += _histogram_lines("npc_turn_seconds", "", self._turns)
+            lines += [
+                "# HELP npc_turn_stage_seconds Time spent in each stage of an NPC turn.",
+                "# TYPE npc_turn_stage_seconds histogram",
+            ]
+            for stage, h in sorted(self._stages.items()):
+                lines += _histogram_lines("npc_turn_stage_seconds", f'stage="{stage}"', h)
+            lines += ["# HELP npc_turns_total NPC turns by outcome.", "# TYPE npc_turns_total counter"]
+            lines += [f'npc_turns_total{{outcome="{k}"}} {v}' for k, v in self._outcomes.items()]
+            lines += [
+                "# HELP npc_responses_total Parsed NPC replies by how they were obtained.",
+                "# TYPE npc_responses_total counter",
+            ]
+            lines += [f'npc_responses_total{{outcome="{k}"}} {v}' for k, v in self._responses.items()]
+            lines += [
+                "# HELP npc_response_fallback_ratio Share of parsed replies that fell back to raw text.",
+                "# TYPE npc_response_fallback_ratio gauge",
+                f"npc_response_fallback_ratio {self._fallback_rate():.6f}",
+            ]
+            lines += ["# HELP npc_ollama_tokens_total Tokens reported by Ollama.", "# TYPE npc_ollama_tokens_total counter"]
+            lines += [f'npc_ollama_tokens_total{{kind="{k}"}} {v}' for k, v in self._tokens.items()]
+            lines += [
+                "# HELP npc_est_prefill_saved_seconds_total Estimated prompt-eval time saved by prefix reuse.",
+                "# TYPE npc_est_prefill_saved_seconds_total counter",
+                f"npc_est_prefill_saved_seconds_total {self._est_prefill_saved:.6f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, labels: str, h: _Histogram) -> List[str]:
+    sep = "," if labels else ""
+    suffix = f"{{{labels}}}" if labels else ""
+    lines = [f'{name}_bucket{{{labels}{sep}le="{bound:g}"}} {count}' for bound, count in zip(h.buckets, h.counts)]
+    lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {h.count}')
+    lines.append(f"{name}_sum{suffix} {h.sum:.6f}")
+    lines.append(f"{name}_count{suffix} {h.count}")
+    return lines
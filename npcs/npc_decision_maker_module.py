@@ -1,19 +1,134 @@
+import asyncio
+import copy
+import functools
 import requests
 import json
-from typing import Dict, List, Optional
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from dotenv import load_dotenv
 import os
+import sys
+
+if __package__ in (None, ""):
+    # allow running as `python npcs/npc_decision_maker_module.py` from the repo root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npcs.conversation_memory import estimate_tokens
+from npcs.metrics import TurnMetrics
+from npcs.npc_response import REASKED, NPCResponse, fallback, parse_response, reask_prompt
+from npcs.prompt_templates import PromptTemplate, Segment
+from npcs.streaming_json import DialogueStreamParser
+from npcs.transport import OllamaTransport, get_transport
+
+if TYPE_CHECKING:
+    from npcs.bartender_rag import Retriever, SharedQueryEmbedding
+    from npcs.caching import ResponseCache
+    from npcs.metrics import MetricsRegistry
+    from npcs.scheduler import OllamaScheduler
 
 load_dotenv()
 OLLAMA_URL: str = os.getenv('OLLAMA_URL')
 MODEL: str = os.getenv('OLLAMA_MODEL')
 EMB_MODEL: str = os.getenv('EMB_MODEL')
+KEEP_ALIVE: str = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+
+PROMPT_PREAMBLE = "You are a Dungeon Master assistant for a tabletop RPG game.\n"
+RESPONSE_INSTRUCTIONS = """Generate a response for this NPC. Include:
+1. The NPC's spoken dialogue (in quotes)
+2. The NPC's actions or body language (in italics or brackets)
+3. Their emotional state
+4. Any decisions they make
+
+Keep the response concise and in-character. Format your response as JSON with these fields:
+- dialogue: what the NPC says
+- actions: what the NPC does
+- emotion: how the NPC feels
+- decision: what the NPC decides to do next
+"""
+# Identical for every turn and every NPC, so Ollama can keep its prefill cached
+NPC_SYSTEM_PROMPT = f"{PROMPT_PREAMBLE}\n{RESPONSE_INSTRUCTIONS}"
+NPC_SYSTEM_PROMPT_TOKENS = estimate_tokens(NPC_SYSTEM_PROMPT)
+
+TURN_SEGMENTS = (
+    Segment("npc", "NPC Information:\n- Name: {npc_name}\n- Personality: {npc_personality}\n\n"),
+    Segment("turn", "Current Situation: {situation}\n\nPlayer Action: {player_action}\n"),
+    Segment("rules", "\nRelevant Rules:\n{rules}\n", optional=True),
+    Segment("context", "\nAdditional Context: {context}", optional=True),
+)
+# the per-turn prompt that goes with NPC_SYSTEM_PROMPT, and the all-in-one prompt used without prefix reuse
+TURN_TEMPLATE = PromptTemplate(TURN_SEGMENTS)
+FULL_TEMPLATE = PromptTemplate((
+    Segment("preamble", PROMPT_PREAMBLE + "\n"),
+    *TURN_SEGMENTS,
+    Segment("instructions", "\n\n" + RESPONSE_INSTRUCTIONS),
+))
+MAX_CACHED_TEMPLATES = 512
+GROUP_WORKERS = int(os.getenv('NPC_GROUP_WORKERS', '8'))
+
+
+@dataclass
+class NPCSpec:
+    """One NPC in a group turn. retriever and context default to the decision maker's and the scene's."""
+
+    name: str
+    personality: str
+    retriever: Optional["Retriever"] = None
+    context: Optional[str] = None
 
 class NPCDecisionMaker:
-    def __init__(self, ollama_url: str = OLLAMA_URL, model: str = MODEL):
+    def __init__(
+        self,
+        ollama_url: str = OLLAMA_URL,
+        model: str = MODEL,
+        retriever: Optional["Retriever"] = None,
+        rag_top_k: int = 4,
+        response_cache: Optional["ResponseCache"] = None,
+        scheduler: Optional["OllamaScheduler"] = None,
+        priority: int = 0,
+        metrics: Optional["MetricsRegistry"] = None,
+        prefix_reuse: bool = True,
+        keep_alive: Optional[str] = KEEP_ALIVE,
+        transport: Optional[OllamaTransport] = None,
+        max_reasks: int = 1
+    ):
+        """
+        With prefix_reuse, the fixed instructions go out as a constant system
+        prompt and only the per-turn details are sent as the prompt, so Ollama
+        re-prefills just the changing suffix. keep_alive keeps the model (and
+        that cache) loaded between turns.
+
+        Requests go through transport (by default the shared pooled transport
+        for ollama_url), which applies timeouts, retries and the circuit breaker.
+
+        Replies are validated against the NPC response schema and repaired
+        locally when they are truncated or slightly malformed. Only when that
+        fails is the model asked, at most max_reasks times, to restate its
+        reply as JSON (a short prompt, not a new turn); after that the raw
+        text is used as the dialogue.
+        """
         self.ollama_url = ollama_url
         self.model = model
         self.api_endpoint = f"{ollama_url}/api/generate"
+        self.transport = transport if transport is not None else get_transport(ollama_url)
+        self.retriever = retriever
+        self.rag_top_k = rag_top_k
+        self.response_cache = response_cache
+        self.scheduler = scheduler
+        self.priority = priority
+        self.metrics = metrics
+        self.prefix_reuse = prefix_reuse
+        self.keep_alive = keep_alive
+        self.max_reasks = max(0, max_reasks)
+        # per-NPC templates with name and personality already rendered; shared by bind() copies
+        self._templates: Dict[Tuple[bool, str, str], PromptTemplate] = {}
+        self.last_timings: Dict[str, float] = {}
+        self.last_metrics: Optional[TurnMetrics] = None
+        self.shared_query: Optional["SharedQueryEmbedding"] = None
+        # group_turn's workers, shared by every call and bind() copy; threads start on first use
+        self._group_pool = ThreadPoolExecutor(max_workers=GROUP_WORKERS, thread_name_prefix="npc-group")
     
     def create_npc_prompt(
         self,
@@ -21,37 +136,104 @@ class NPCDecisionMaker:
         npc_personality: str,
         situation: str,
         player_action: str,
-        context: Optional[str] = None
+        context: Optional[str] = None,
+        rules: Optional[str] = None
     ) -> str:
-        prompt = f"""You are a Dungeon Master assistant for a tabletop RPG game.
+        """The whole instruction prompt in one string (used when prefix_reuse is off)."""
+        return FULL_TEMPLATE.render(
+            npc_name=npc_name, npc_personality=npc_personality,
+            situation=situation, player_action=player_action, rules=rules, context=context
+        )
 
-NPC Information:
-- Name: {npc_name}
-- Personality: {npc_personality}
+    def create_turn_prompt(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        rules: Optional[str] = None
+    ) -> str:
+        """The per-turn part of the prompt; pairs with NPC_SYSTEM_PROMPT."""
+        return TURN_TEMPLATE.render(
+            npc_name=npc_name, npc_personality=npc_personality,
+            situation=situation, player_action=player_action, rules=rules, context=context
+        )
 
-Current Situation: {situation}
+    def template_for(self, npc_name: str, npc_personality: str, full: bool = False) -> PromptTemplate:
+        """
+        The turn template (or with full, the all-in-one template) with this NPC's
+        name and personality rendered in; compiled once per NPC and cached.
+        Its tokens() gives per-segment estimates for prompt budgeting.
+        """
+        key = (full, npc_name, npc_personality)
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= MAX_CACHED_TEMPLATES:
+                # personalities can be free text; don't let them grow the cache without bound
+                self._templates.clear()
+            template = (FULL_TEMPLATE if full else TURN_TEMPLATE).bind(npc_name=npc_name, npc_personality=npc_personality)
+            self._templates[key] = template
+        return template
 
-Player Action: {player_action}
-"""
-        
-        if context:
-            prompt += f"\nAdditional Context: {context}"
-        
-        prompt += """
+    def bind(
+        self,
+        retriever: Optional["Retriever"] = None,
+        rag_top_k: Optional[int] = None,
+        shared_query: Optional["SharedQueryEmbedding"] = None
+    ) -> "NPCDecisionMaker":
+        """
+        Shallow copy that uses a different retriever but shares everything else.
 
-Generate a response for this NPC. Include:
-1. The NPC's spoken dialogue (in quotes)
-2. The NPC's actions or body language (in italics or brackets)
-3. Their emotional state
-4. Any decisions they make
+        The copy reuses this instance's HTTP pool, limits and response cache, so
+        per-NPC or per-session views cost nothing extra. With shared_query the
+        copy takes the situation's embedding from there (see group_turn).
+        """
+        bound = copy.copy(self)
+        bound.retriever = retriever
+        bound.shared_query = shared_query
+        if rag_top_k is not None:
+            bound.rag_top_k = rag_top_k
+        bound.last_timings = {}
+        bound.last_metrics = None
+        return bound
 
-Keep the response concise and in-character. Format your response as JSON with these fields:
-- dialogue: what the NPC says
-- actions: what the NPC does
-- emotion: how the NPC feels
-- decision: what the NPC decides to do next
-"""
-        return prompt
+    def _prepare_prompt(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None
+    ) -> Tuple[str, Dict[str, float]]:
+        """
+        Build the turn's prompt, injecting the top-k retrieved rules when a retriever is attached.
+
+        Returns the prompt and the turn's timings (the retriever's
+        embed_ms/score_ms/lexical_ms, plus prompt_ms). The timings are returned
+        rather than stored because concurrent turns share this instance.
+        Retrieval failures are reported and the prompt is built without rules.
+        """
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        rules = None
+        if self.retriever is not None:
+            try:
+                if self.shared_query is not None:
+                    rules, retrieval_timings = self.retriever.rules_with_timings(
+                        situation, top_k=self.rag_top_k, shared=self.shared_query
+                    )
+                else:
+                    rules, retrieval_timings = self.retriever.rules_with_timings(situation, top_k=self.rag_top_k)
+                timings.update(retrieval_timings)
+            except (requests.exceptions.RequestException, RuntimeError) as e:
+                print(f"Retrieval error: {str(e)}")
+        build = self.create_turn_prompt if self.prefix_reuse else self.create_npc_prompt
+        prompt = build(
+            npc_name, npc_personality, situation, player_action, context, rules
+        )
+        timings["prompt_ms"] = (time.perf_counter() - start) * 1000 - sum(timings.values())
+        return prompt, timings
     
     def get_npc_response(
         self,
@@ -76,42 +258,126 @@ Keep the response concise and in-character. Format your response as JSON with th
         Returns:
             Dictionary containing the NPC's response
         """
-        prompt = self.create_npc_prompt(
+        turn = TurnMetrics(npc=npc_name, model=self.model)
+        prompt, timings = self._prepare_prompt(
             npc_name, npc_personality, situation, player_action, context
         )
+        self.last_timings = timings
+        turn.add_timings(timings)
+        payload = self._build_payload(prompt, temperature)
+        self._expect_prompt(turn, payload)
+        cache_key, cached = self._cache_lookup(payload, temperature, turn)
+        if cached is not None:
+            return self._finish_turn(turn, cached)
+        
+        try:
+            with turn.span("request"):
+                result = self._generate(payload)
+            turn.record_ollama(result)
+            with turn.span("parse"):
+                parsed = self._parse_result(result)
+            if parsed is None:
+                parsed = self._reask(result.get("response", ""), temperature, turn)
+            return self._finish_turn(turn, self._cache_store(cache_key, self._respond(turn, parsed)))
         
+        except requests.exceptions.RequestException as e:
+            return self._finish_turn(turn, self._error_response(e))
+
+    def _finish_turn(self, turn: TurnMetrics, response: Dict) -> Dict:
+        """Close out a turn's metrics: keep them in last_metrics and feed the registry."""
+        turn.error = "error" in response
+        self.last_metrics = turn.finish()
+        if self.metrics is not None:
+            self.metrics.observe(turn)
+        return response
+
+    def _respond(self, turn: TurnMetrics, parsed: NPCResponse) -> Dict:
+        turn.response = parsed.outcome
+        return parsed.to_dict()
+
+    def _reask(self, text: str, temperature: float, turn: TurnMetrics) -> NPCResponse:
+        """Last resort for a reply that could not be repaired: ask for it again as JSON, then fall back."""
+        for _ in range(self.max_reasks):
+            try:
+                with turn.span("reask"):
+                    result = self._generate(self._build_payload(reask_prompt(text), temperature))
+            except requests.exceptions.RequestException:
+                break
+            parsed = self._parse_result(result)
+            if parsed is not None:
+                parsed.outcome = REASKED
+                return parsed
+        return fallback(text)
+
+    def _generate(self, payload: Dict) -> Dict:
+        """POST a non-streaming generate payload, through the scheduler when one is attached."""
+        if self.scheduler is not None:
+            return self.scheduler.generate(payload, priority=self.priority)
+        response = self.transport.post("/api/generate", json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def _cache_lookup(self, payload: Dict, temperature: float, turn: TurnMetrics) -> Tuple[Optional[str], Optional[Dict]]:
+        if self.response_cache is None or not self.response_cache.accepts(temperature):
+            return None, None
+        with turn.span("cache"):
+            key = self.response_cache.key(payload)
+            cached = self.response_cache.get(key)
+        turn.cached = cached is not None
+        return key, cached
+
+    def _cache_store(self, cache_key: Optional[str], parsed: Dict) -> Dict:
+        # only well-formed responses are worth replaying
+        if cache_key is not None and "raw_response" not in parsed and "error" not in parsed:
+            self.response_cache.put(cache_key, parsed)
+        return parsed
+
+    def _build_payload(self, prompt: str, temperature: float) -> Dict:
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "temperature": temperature,
+            "options": {"temperature": temperature},
             "format": "json",
             "stream": False,
             "response-type": "Only respond in valid JSON format.",
         }
-        
-        try:
-            response = requests.post(self.api_endpoint, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            llm_response = result.get("response", "")
-            
-            try:
-                parsed_response = json.loads(llm_response)
-                return parsed_response
-            except json.JSONDecodeError:
-                return {
-                    "raw_response": llm_response,
-                    "dialogue": llm_response,
-                    "note": "Response not in JSON format"
-                }
-        
-        except requests.exceptions.RequestException as e:
-            print(f"Error: {str(e)}")
-            return {
-                "error": str(e),
-                "message": "Failed to connect to Ollama. Make sure it's running."
-            }
+        return self._with_prefix(payload)
+
+    def _build_streaming_payload(self, prompt: str, temperature: float, json_format: bool = False) -> Dict:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"temperature": temperature}
+        }
+        if json_format:
+            payload["format"] = "json"
+        return self._with_prefix(payload)
+
+    def _with_prefix(self, payload: Dict) -> Dict:
+        if self.prefix_reuse:
+            payload["system"] = NPC_SYSTEM_PROMPT
+        if self.keep_alive:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _expect_prompt(self, turn: TurnMetrics, payload: Dict) -> None:
+        """Tell the turn roughly how many prompt tokens a cold prefill would cost."""
+        if self.prefix_reuse:
+            turn.expected_prompt_tokens = NPC_SYSTEM_PROMPT_TOKENS + estimate_tokens(payload["prompt"])
+
+    @staticmethod
+    def _parse_result(result: Dict) -> Optional[NPCResponse]:
+        """The validated (possibly repaired) reply, or None when it needs a re-ask."""
+        return parse_response(result.get("response", ""))
+
+    @staticmethod
+    def _error_response(e: Exception) -> Dict:
+        print(f"Error: {str(e)}")
+        return {
+            "error": str(e),
+            "message": "Failed to connect to Ollama. Make sure it's running."
+        }
     
     def get_npc_response_streaming(
         self,
@@ -127,29 +393,411 @@ Keep the response concise and in-character. Format your response as JSON with th
         
         Yields response text as it's generated.
         """
-        prompt = self.create_npc_prompt(
+        turn = TurnMetrics(npc=npc_name, model=self.model, streamed=True)
+        prompt, timings = self._prepare_prompt(
             npc_name, npc_personality, situation, player_action, context
         )
+        self.last_timings = timings
+        turn.add_timings(timings)
+        payload = self._build_streaming_payload(prompt, temperature)
+        self._expect_prompt(turn, payload)
         
-        payload = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": True,
-            "temperature": temperature
-        }
+        try:
+            yield from self._stream_fragments(payload, turn)
+            self._finish_turn(turn, {})
         
+        except requests.exceptions.RequestException as e:
+            self._finish_turn(turn, {"error": str(e)})
+            yield f"Error: {str(e)}"
+
+    def _stream_fragments(self, payload: Dict, turn: Optional[TurnMetrics] = None) -> Iterator[str]:
+        start = time.perf_counter()
+        response = self.transport.post("/api/generate", json=payload, stream=True)
         try:
-            response = requests.post(self.api_endpoint, json=payload, stream=True)
             response.raise_for_status()
-            
             for line in response.iter_lines():
                 if line:
                     chunk = json.loads(line)
+                    if turn is not None:
+                        _observe_chunk(turn, chunk, start)
                     if "response" in chunk:
                         yield chunk["response"]
-        
+        finally:
+            # also runs when the consumer stops early, hanging up so Ollama stops generating
+            response.close()
+        if turn is not None:
+            turn.spans["request"] = (time.perf_counter() - start) * 1000
+
+    def get_npc_response_stream_parsed(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> Iterator[Tuple[str, Union[str, Dict]]]:
+        """
+        Stream the dialogue field as it's generated, then the full parsed response.
+
+        Yields ("dialogue", text) events as soon as the model starts writing the
+        dialogue value, followed by exactly one ("response", dict) event with the
+        same shape get_npc_response returns.
+        """
+        turn = TurnMetrics(npc=npc_name, model=self.model, streamed=True)
+        prompt, timings = self._prepare_prompt(
+            npc_name, npc_personality, situation, player_action, context
+        )
+        self.last_timings = timings
+        turn.add_timings(timings)
+        payload = self._build_streaming_payload(prompt, temperature, json_format=True)
+        self._expect_prompt(turn, payload)
+        parser = DialogueStreamParser()
+
+        try:
+            for fragment in self._stream_fragments(payload, turn):
+                delta = parser.feed(fragment)
+                if delta:
+                    yield "dialogue", delta
+        except requests.exceptions.RequestException as e:
+            yield "response", self._finish_turn(turn, self._error_response(e))
+            return
+        # the dialogue has already been shown, so a bad stream is repaired but never re-asked
+        with turn.span("parse"):
+            parsed = parser.response()
+        yield "response", self._finish_turn(turn, self._respond(turn, parsed))
+
+    def _group_members(self, npcs: Sequence[NPCSpec], situation: str) -> List["NPCDecisionMaker"]:
+        """One bound view per NPC, all sharing a single embedding of the situation."""
+        retrievers = [spec.retriever if spec.retriever is not None else self.retriever for spec in npcs]
+        shared = None
+        if any(r is not None for r in retrievers):
+            from npcs.bartender_rag import SharedQueryEmbedding
+            shared = SharedQueryEmbedding(situation)
+        return [self.bind(retriever=r, shared_query=shared) for r in retrievers]
+
+    def group_turn(
+        self,
+        npcs: Sequence[NPCSpec],
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_workers: int = GROUP_WORKERS
+    ) -> Iterator[Tuple[NPCSpec, Dict]]:
+        """
+        Get every NPC's response to one scene concurrently.
+
+        Yields (spec, response) pairs in completion order, so the quickest NPC
+        can be shown while the others are still generating; responses have the
+        get_npc_response shape. At most max_workers of this call's turns run
+        at once, and all group turns on this instance (and its bind() copies)
+        share one pool of GROUP_WORKERS threads; an attached scheduler applies
+        its own limit on top. The situation is embedded once for the whole
+        group, and a spec's own context replaces the scene context.
+        """
+        queued = zip(npcs, self._group_members(npcs, situation))
+        pending: Dict[Future, NPCSpec] = {}
+
+        def submit_next() -> None:
+            item = next(queued, None)
+            if item is not None:
+                spec, member = item
+                future = self._group_pool.submit(
+                    member.get_npc_response, spec.name, spec.personality, situation, player_action,
+                    spec.context if spec.context is not None else context, temperature
+                )
+                pending[future] = spec
+
+        try:
+            for _ in range(max(1, max_workers)):
+                submit_next()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    submit_next()
+                    yield pending.pop(future), future.result()
+        finally:
+            # a caller that stops iterating early doesn't wait for the rest
+            for future in pending:
+                future.cancel()
+
+
+class AsyncNPCDecisionMaker(NPCDecisionMaker):
+    """
+    asyncio counterpart of NPCDecisionMaker for serving many NPC conversations at once.
+
+    Requests go through an OllamaTransport (pooled session, retries, the shared
+    circuit breaker) on a bounded worker pool, so connections are reused across
+    calls. At most max_concurrency requests are in flight; each one is abandoned
+    with the usual error dict after timeout seconds. Prompts, payloads and
+    response parsing are shared with the sync class.
+    """
+
+    def __init__(
+        self,
+        ollama_url: str = OLLAMA_URL,
+        model: str = MODEL,
+        max_concurrency: int = 8,
+        timeout: float = 120.0,
+        retriever: Optional["Retriever"] = None,
+        rag_top_k: int = 4,
+        response_cache: Optional["ResponseCache"] = None,
+        scheduler: Optional["OllamaScheduler"] = None,
+        priority: int = 0,
+        metrics: Optional["MetricsRegistry"] = None,
+        prefix_reuse: bool = True,
+        keep_alive: Optional[str] = KEEP_ALIVE,
+        transport: Optional[OllamaTransport] = None,
+        max_reasks: int = 1
+    ):
+        if transport is None:
+            transport = OllamaTransport(ollama_url, pool_maxsize=max_concurrency)
+        super().__init__(
+            ollama_url=ollama_url, model=model, retriever=retriever, rag_top_k=rag_top_k,
+            response_cache=response_cache, scheduler=scheduler, priority=priority, metrics=metrics,
+            prefix_reuse=prefix_reuse, keep_alive=keep_alive, transport=transport, max_reasks=max_reasks
+        )
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="npc-http")
+        self._session = self.transport.session
+
+    async def __aenter__(self) -> "AsyncNPCDecisionMaker":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.transport.close()
+
+    async def _agenerate(self, payload: Dict) -> Dict:
+        if self.scheduler is not None:
+            future = asyncio.wrap_future(self.scheduler.submit_generate(payload, priority=self.priority))
+            # shielded: the scheduler may be sharing this future with deduplicated callers
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.transport.post, "/api/generate", json=payload, timeout=self.timeout)
+        response = await asyncio.wait_for(loop.run_in_executor(self._executor, call), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    async def _areask(self, text: str, temperature: float, turn: TurnMetrics) -> NPCResponse:
+        for _ in range(self.max_reasks):
+            try:
+                with turn.span("reask"):
+                    result = await self._agenerate(self._build_payload(reask_prompt(text), temperature))
+            except (requests.exceptions.RequestException, asyncio.TimeoutError):
+                break
+            parsed = self._parse_result(result)
+            if parsed is not None:
+                parsed.outcome = REASKED
+                return parsed
+        return fallback(text)
+
+    async def _prepare_prompt_async(self, *args) -> Tuple[str, Dict[str, float]]:
+        if self.retriever is None:
+            return self._prepare_prompt(*args)
+        # retrieval embeds the query over HTTP, so keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._prepare_prompt, *args))
+
+    async def get_npc_response(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> Dict:
+        """
+        Get an NPC response from Ollama without blocking the event loop.
+
+        Same arguments and return shape as NPCDecisionMaker.get_npc_response.
+        """
+        turn = TurnMetrics(npc=npc_name, model=self.model)
+        prompt, timings = await self._prepare_prompt_async(
+            npc_name, npc_personality, situation, player_action, context
+        )
+        turn.add_timings(timings)
+        payload = self._build_payload(prompt, temperature)
+        self._expect_prompt(turn, payload)
+        cache_key, cached = self._cache_lookup(payload, temperature, turn)
+        if cached is not None:
+            return self._finish_turn(turn, cached)
+
+        queued = time.perf_counter()
+        async with self._semaphore:
+            turn.spans["queue"] = (time.perf_counter() - queued) * 1000
+            try:
+                with turn.span("request"):
+                    result = await self._agenerate(payload)
+                turn.record_ollama(result)
+                with turn.span("parse"):
+                    parsed = self._parse_result(result)
+                if parsed is None:
+                    parsed = await self._areask(result.get("response", ""), temperature, turn)
+                return self._finish_turn(turn, self._cache_store(cache_key, self._respond(turn, parsed)))
+            except requests.exceptions.RequestException as e:
+                return self._finish_turn(turn, self._error_response(e))
+            except asyncio.TimeoutError:
+                return self._finish_turn(turn, self._error_response(TimeoutError(f"Ollama did not respond within {self.timeout}s")))
+
+    async def get_npc_response_streaming(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> AsyncIterator[str]:
+        """
+        Async iterator over response text as it's generated.
+
+        The blocking line reader runs on the worker pool and hands fragments to
+        the event loop through a queue; the timeout applies between fragments.
+        """
+        turn = TurnMetrics(npc=npc_name, model=self.model, streamed=True)
+        prompt, timings = await self._prepare_prompt_async(
+            npc_name, npc_personality, situation, player_action, context
+        )
+        turn.add_timings(timings)
+        payload = self._build_streaming_payload(prompt, temperature)
+        self._expect_prompt(turn, payload)
+
+        try:
+            async for fragment in self._astream_fragments(payload, turn):
+                yield fragment
+            self._finish_turn(turn, {})
         except requests.exceptions.RequestException as e:
+            self._finish_turn(turn, {"error": str(e)})
             yield f"Error: {str(e)}"
+        except asyncio.TimeoutError:
+            self._finish_turn(turn, {"error": "timeout"})
+            yield f"Error: Ollama did not respond within {self.timeout}s"
+
+    async def _astream_fragments(self, payload: Dict, turn: Optional[TurnMetrics] = None) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def pump() -> None:
+            start = time.perf_counter()
+            try:
+                response = self.transport.post("/api/generate", json=payload, stream=True, timeout=self.timeout)
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if stop.is_set():
+                        break
+                    if line:
+                        chunk = json.loads(line)
+                        if turn is not None:
+                            _observe_chunk(turn, chunk, start)
+                        if "response" in chunk:
+                            loop.call_soon_threadsafe(queue.put_nowait, chunk["response"])
+                response.close()
+                if turn is not None:
+                    turn.spans["request"] = (time.perf_counter() - start) * 1000
+            except requests.exceptions.RequestException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        async with self._semaphore:
+            pumping = loop.run_in_executor(self._executor, pump)
+            try:
+                while True:
+                    item = await asyncio.wait_for(queue.get(), timeout=self.timeout)
+                    if item is done:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                stop.set()
+                if pumping.done():
+                    pumping.result()
+
+    async def get_npc_response_stream_parsed(
+        self,
+        npc_name: str,
+        npc_personality: str,
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> AsyncIterator[Tuple[str, Union[str, Dict]]]:
+        """
+        Async counterpart of NPCDecisionMaker.get_npc_response_stream_parsed.
+        """
+        turn = TurnMetrics(npc=npc_name, model=self.model, streamed=True)
+        prompt, timings = await self._prepare_prompt_async(
+            npc_name, npc_personality, situation, player_action, context
+        )
+        turn.add_timings(timings)
+        payload = self._build_streaming_payload(prompt, temperature, json_format=True)
+        self._expect_prompt(turn, payload)
+        parser = DialogueStreamParser()
+
+        try:
+            async for fragment in self._astream_fragments(payload, turn):
+                delta = parser.feed(fragment)
+                if delta:
+                    yield "dialogue", delta
+        except requests.exceptions.RequestException as e:
+            yield "response", self._finish_turn(turn, self._error_response(e))
+            return
+        except asyncio.TimeoutError:
+            yield "response", self._finish_turn(turn, self._error_response(TimeoutError(f"Ollama did not respond within {self.timeout}s")))
+            return
+        with turn.span("parse"):
+            parsed = parser.response()
+        yield "response", self._finish_turn(turn, self._respond(turn, parsed))
+
+    async def group_turn(
+        self,
+        npcs: Sequence[NPCSpec],
+        situation: str,
+        player_action: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7
+    ) -> AsyncIterator[Tuple[NPCSpec, Dict]]:
+        """
+        Async counterpart of NPCDecisionMaker.group_turn.
+
+        All NPCs share this instance's max_concurrency limit and worker pool,
+        so a scene never has more than max_concurrency requests in flight.
+        """
+        members = self._group_members(npcs, situation)
+        pending = {
+            asyncio.ensure_future(member.get_npc_response(
+                spec.name, spec.personality, situation, player_action,
+                spec.context if spec.context is not None else context, temperature
+            )): spec
+            for spec, member in zip(npcs, members)
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield pending.pop(task), task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _observe_chunk(turn: TurnMetrics, chunk: Dict, start: float) -> None:
+    """Record time to first token and, on the final chunk, Ollama's own stats."""
+    if chunk.get("response") and "first_token" not in turn.spans:
+        turn.spans["first_token"] = (time.perf_counter() - start) * 1000
+    if chunk.get("done"):
+        turn.record_ollama(chunk)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,207 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+RESPONSE_FIELDS = ("dialogue", "actions", "emotion", "decision")
+DEFAULT_EMOTION = "neutral"
+
+# Outcomes, cheapest first: parsed as-is, fixed locally, needed a second generation, gave up
+VALID = "valid"
+REPAIRED = "repaired"
+REASKED = "reasked"
+FALLBACK = "fallback"
+OUTCOMES = (VALID, REPAIRED, REASKED, FALLBACK)
+
+# keys models use instead of the ones we asked for
+FIELD_ALIASES = {
+    "speech": "dialogue", "says": "dialogue", "say": "dialogue", "text": "dialogue", "line": "dialogue",
+    "action": "actions", "body_language": "actions",
+    "mood": "emotion", "emotional_state": "emotion", "feeling": "emotion", "emotions": "emotion",
+    "decisions": "decision", "next_action": "decision", "intent": "decision",
+}
+
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"'})
+
+
+@dataclass(slots=True)
+class NPCResponse:
+    """
+    One validated NPC reply.
+
+    The four schema fields are always strings; emotion falls back to "neutral".
+    outcome says how the reply was obtained (see OUTCOMES) and raw keeps the
+    model's text whenever it was not valid JSON as sent.
+    """
+
+    dialogue: str
+    actions: str = ""
+    emotion: str = DEFAULT_EMOTION
+    decision: str = ""
+    outcome: str = VALID
+    raw: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The dict shape get_npc_response has always returned."""
+        out: Dict[str, Any] = {
+            "dialogue": self.dialogue,
+            "actions": self.actions,
+            "emotion": self.emotion,
+            "decision": self.decision,
+        }
+        if self.outcome == FALLBACK:
+            out["raw_response"] = self.raw or ""
+            out["note"] = "Response not in JSON format"
+        return out
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, list):
+        return "; ".join(_as_text(v) for v in value if v not in (None, ""))
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def validate(data: Any, outcome: str = VALID, raw: Optional[str] = None) -> Optional[NPCResponse]:
+    """
+    Coerce a decoded object into an NPCResponse; None when it has no dialogue.
+
+    Keys are matched case-insensitively and through FIELD_ALIASES, lists are
+    joined and missing optional fields are filled in.
+    """
+    if not isinstance(data, dict):
+        return None
+    fields: Dict[str, str] = {}
+    for key, value in data.items():
+        name = str(key).strip().lower()
+        name = FIELD_ALIASES.get(name, name)
+        if name in RESPONSE_FIELDS and not fields.get(name):
+            fields[name] = _as_text(value)
+    if not fields.get("dialogue"):
+        return None
+    return NPCResponse(
+        dialogue=fields["dialogue"],
+        actions=fields.get("actions", ""),
+        emotion=fields.get("emotion") or DEFAULT_EMOTION,
+        decision=fields.get("decision", ""),
+        outcome=outcome,
+        raw=raw,
+    )
+
+
+def repair_json(text: str) -> Optional[str]:
+    """
+    Best-effort local fix for an almost-JSON object; None when there is no object to fix.
+
+    Handles code fences and prose around the object, smart quotes, trailing
+    commas, and truncation: an unterminated value string is closed, a dangling
+    key is dropped and open brackets are closed.
+    """
+    text = _FENCE.sub("", text.translate(_SMART_QUOTES))
+    start = text.find("{")
+    if start < 0:
+        return None
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    string_is_key = False
+    expect_key = False
+    # (len(out), open brackets) at the last point where the object could be cut cleanly
+    safe: Tuple[int, List[str]] = (0, [])
+    for ch in text[start:]:
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if not string_is_key:
+                    safe = (len(out), list(stack))
+            continue
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1] == "}" and expect_key
+            expect_key = False
+            out.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            expect_key = ch == "{"
+            out.append(ch)
+            safe = (len(out), list(stack))
+        elif ch in "}]":
+            if not stack:
+                break
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(stack.pop())
+            expect_key = False
+            if not stack:
+                break
+            safe = (len(out), list(stack))
+        elif ch == ",":
+            expect_key = bool(stack) and stack[-1] == "}"
+            out.append(ch)
+        else:
+            out.append(ch)
+            if ch not in ": \t\r\n":
+                # part of a number or literal; good enough to cut after
+                safe = (len(out), list(stack))
+    if not stack and out and out[-1] == "}":
+        return "".join(out)
+    if in_string and not string_is_key:
+        if escape:
+            out.pop()
+        out.append('"')
+        safe = (len(out), list(stack))
+    cut, open_brackets = safe
+    body = "".join(out[:cut]).rstrip().rstrip(",").rstrip()
+    if body.endswith(":"):
+        return None
+    return body + "".join(reversed(open_brackets))
+
+
+def parse_response(text: str) -> Optional[NPCResponse]:
+    """
+    Validate the model's text, repairing it locally when needed.
+
+    Returns None when neither the text nor its repair yields a dialogue; that is
+    the caller's cue to re-ask or fall back.
+    """
+    try:
+        parsed = validate(json.loads(text))
+        if parsed is not None:
+            return parsed
+    except json.JSONDecodeError:
+        pass
+    repaired = repair_json(text)
+    if repaired is None:
+        return None
+    try:
+        return validate(json.loads(repaired), outcome=REPAIRED, raw=text)
+    except json.JSONDecodeError:
+        return None
+
+
+def fallback(text: str, dialogue: Optional[str] = None) -> NPCResponse:
+    """Last resort: the model's text (or the dialogue streamed so far) as the dialogue."""
+    return NPCResponse(dialogue=(dialogue or text).strip(), outcome=FALLBACK, raw=text)
+
+
+def reask_prompt(text: str) -> str:
+    """Short follow-up asking the model to restate a reply it got wrong as the JSON we need."""
+    return (
+        "Your previous reply could not be read as the required JSON object.\n"
+        f"Previous reply:\n{text[:2000]}\n\n"
+        "Reply again with only a JSON object with the string fields "
+        "dialogue, actions, emotion and decision."
+    )
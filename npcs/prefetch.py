@@ -0,0 +1,206 @@
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from npcs.lexical import tokenize
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.scheduler import BACKGROUND
+
+# Likely next player inputs, keyed by the rule tags that make them likely
+FOLLOW_UPS: Dict[str, Tuple[str, ...]] = {
+    "service": ("An ale, please.",),
+    "greeting": ("What's good here?",),
+    "upsell": ("What do you have to drink?",),
+    "inventory": ("What do you have to drink?",),
+    "alcohol": ("An ale, please.",),
+    "rumors": ("Heard any rumors?",),
+    "info": ("Heard any rumors?",),
+    "quests": ("Any work going?",),
+    "pricing": ("How much do I owe?",),
+    "trade": ("How much do I owe?",),
+}
+MATCH_THRESHOLD = 0.6
+
+
+def _terms(text: str) -> FrozenSet[str]:
+    return frozenset(tokenize(text))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard overlap of two inputs' stemmed content words."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+@dataclass
+class _Speculation:
+    text: str
+    terms: FrozenSet[str]
+    cancel: threading.Event = field(default_factory=threading.Event)
+    future: "Optional[Future[Optional[Dict]]]" = None
+    started: bool = False
+
+
+class Prefetcher:
+    """
+    Speculatively answers likely next inputs while the player is typing.
+
+    After each turn, start() predicts up to max_candidates follow-ups from the
+    tags of the rules retrieved for that input (weighted toward tags seen in
+    recent turns, skipping what the player just asked) and generates answers
+    one at a time on a background thread. With a scheduler attached they are
+    queued at BACKGROUND priority, so the player's turn overtakes them;
+    without one they are streamed. take() is called with the real input: a
+    finished or in-flight speculation whose input is at least threshold
+    similar is served (waiting for it if it is still generating, since it is
+    ahead of a fresh request); everything else is cancelled, and a streamed
+    generation hangs up mid-stream so Ollama is free for the real turn.
+    """
+
+    def __init__(
+        self,
+        npc: NPCDecisionMaker,
+        max_candidates: int = 2,
+        threshold: float = MATCH_THRESHOLD,
+        follow_ups: Optional[Dict[str, Sequence[str]]] = None,
+        history: int = 3
+    ):
+        self.npc = npc
+        self.max_candidates = max_candidates
+        self.threshold = threshold
+        self.follow_ups = follow_ups if follow_ups is not None else FOLLOW_UPS
+        self._recent_tags: Deque[Counter] = deque(maxlen=history)
+        self._recent_inputs: Deque[FrozenSet[str]] = deque(maxlen=history)
+        self._pending: List[_Speculation] = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="npc-prefetch")
+        self.predicted = 0
+        self.generated = 0
+        self.cancelled = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _tags_for(self, player_input: str) -> Counter:
+        retriever = self.npc.retriever
+        if retriever is None:
+            return Counter()
+        try:
+            # the turn just retrieved for this input, so the query embedding is a cache hit
+            hits = retriever.retrieve(player_input)
+        except Exception:
+            return Counter()
+        return Counter(tag for hit in hits for tag in hit.get("meta", {}).get("tags", ()))
+
+    def predict(self, player_input: str) -> List[str]:
+        """Likely next inputs, most likely first."""
+        tags = self._tags_for(player_input)
+        self._recent_tags.append(tags)
+        self._recent_inputs.append(_terms(player_input))
+        weights: Counter = Counter()
+        for age, recent in enumerate(reversed(self._recent_tags)):
+            for tag, count in recent.items():
+                weights[tag] += count / (age + 1)
+        candidates: Dict[str, float] = {}
+        for tag, weight in weights.items():
+            for text in self.follow_ups.get(tag, ()):
+                candidates[text] = candidates.get(text, 0.0) + weight
+        asked = list(self._recent_inputs)
+        ranked = [
+            text for text, _ in sorted(candidates.items(), key=lambda kv: -kv[1])
+            if all(similarity(_terms(text), seen) < self.threshold for seen in asked)
+        ]
+        return ranked[:self.max_candidates]
+
+    def start(self, player_input: str, npc_kwargs: Dict[str, Any]) -> List[str]:
+        """Cancel outstanding work and speculate on the follow-ups to player_input; returns the predictions."""
+        self.cancel()
+        predictions = self.predict(player_input)
+        self.predicted += len(predictions)
+        speculative = self.npc.bind(retriever=self.npc.retriever)
+        speculative.priority = BACKGROUND
+        # speculative turns are not player turns; keep them out of the session's metrics
+        speculative.metrics = None
+        for text in predictions:
+            spec = _Speculation(text=text, terms=_terms(text))
+            kwargs = dict(npc_kwargs, situation=text)
+            spec.future = self._executor.submit(self._generate, speculative, spec, kwargs)
+            self._pending.append(spec)
+        return predictions
+
+    def _generate(self, npc: NPCDecisionMaker, spec: _Speculation, kwargs: Dict[str, Any]) -> Optional[Dict]:
+        if spec.cancel.is_set():
+            return None
+        spec.started = True
+        response: Optional[Dict] = None
+        if npc.scheduler is not None:
+            # streams bypass the scheduler; queued at BACKGROUND, the player's next turn overtakes this one
+            response = npc.get_npc_response(**kwargs)
+        else:
+            # streamed so a cancelled speculation can hang up mid-generation
+            events = npc.get_npc_response_stream_parsed(**kwargs)
+            try:
+                for kind, value in events:
+                    if spec.cancel.is_set():
+                        return None
+                    if kind == "response":
+                        response = value
+            finally:
+                events.close()
+        if spec.cancel.is_set() or response is None or "error" in response:
+            return None
+        self.generated += 1
+        return response
+
+    def take(self, player_input: str) -> Optional[Dict]:
+        """The speculative response for player_input if one matches; cancels everything else."""
+        terms = _terms(player_input)
+        best: Optional[_Speculation] = None
+        best_score = self.threshold
+        for spec in self._pending:
+            score = 1.0 if spec.text == player_input else similarity(terms, spec.terms)
+            usable = spec.started or (spec.future is not None and spec.future.done())
+            if usable and score >= best_score:
+                best, best_score = spec, score
+        self.cancel(keep=best)
+        response = None
+        if best is not None and best.future is not None:
+            try:
+                response = best.future.result()
+            except Exception:
+                response = None
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def cancel(self, keep: Optional[_Speculation] = None) -> None:
+        for spec in self._pending:
+            if spec is keep:
+                continue
+            spec.cancel.set()
+            if spec.future is not None and not spec.future.done():
+                spec.future.cancel()
+                self.cancelled += 1
+        self._pending = []
+
+    @property
+    def hit_rate(self) -> float:
+        taken = self.hits + self.misses
+        return self.hits / taken if taken else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "predicted": self.predicted,
+            "generated": self.generated,
+            "cancelled": self.cancelled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def close(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
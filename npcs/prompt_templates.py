@@ -0,0 +1,208 @@
+import string
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from npcs.conversation_memory import tokens_for_length
+
+_FORMATTER = string.Formatter()
+
+
+class _Missing:
+    """Default for a required slot: rendering it raises KeyError, like str.format_map."""
+
+    __slots__ = ("slot",)
+
+    def __init__(self, slot: str):
+        self.slot = slot
+
+    def __format__(self, spec: str) -> str:
+        raise KeyError(self.slot)
+
+
+@dataclass(frozen=True)
+class Segment:
+    """
+    One named piece of a prompt: literal text with {slot} placeholders.
+
+    An optional segment is left out entirely when any of its slots is empty,
+    the way "Relevant Rules" disappears on turns without retrieved rules.
+    """
+
+    name: str
+    text: str
+    optional: bool = False
+
+
+class _CompiledSegment:
+    """A Segment split once into literal runs and slot names."""
+
+    __slots__ = ("name", "optional", "parts", "slots", "literal_chars", "rendered", "tokens")
+
+    def __init__(self, name: str, optional: bool, parts: Tuple[Tuple[str, Optional[str]], ...]):
+        self.name = name
+        self.optional = optional
+        self.parts = parts
+        self.slots = tuple(slot for _, slot in parts if slot is not None)
+        self.literal_chars = sum(len(literal) for literal, _ in parts)
+        # fully static segments are rendered (and estimated) once, here
+        self.rendered: Optional[str] = "".join(literal for literal, _ in parts) if not self.slots else None
+        self.tokens = tokens_for_length(self.literal_chars) if not self.slots else 0
+
+    @classmethod
+    def compile(cls, segment: Segment) -> "_CompiledSegment":
+        parts = []
+        for literal, slot, spec, conversion in _FORMATTER.parse(segment.text):
+            if slot is not None and (spec or conversion or not slot.isidentifier()):
+                raise ValueError(f"Segment {segment.name!r}: only plain {{name}} slots are supported, got {{{slot}}}")
+            parts.append((literal, slot))
+        return cls(segment.name, segment.optional, tuple(parts))
+
+    def skipped(self, values: Dict[str, Any]) -> bool:
+        return self.optional and any(not values.get(slot) for slot in self.slots)
+
+    def bind(self, values: Dict[str, Any]) -> Optional["_CompiledSegment"]:
+        """Fill the slots found in values; None when the segment drops out."""
+        if not any(slot in values for slot in self.slots):
+            return self
+        if self.optional and any(slot in values and not values[slot] for slot in self.slots):
+            return None
+        merged: List[Tuple[str, Optional[str]]] = []
+        pending = ""
+        for literal, slot in self.parts:
+            pending += literal
+            if slot is None:
+                continue
+            if slot in values:
+                pending += str(values[slot])
+            else:
+                merged.append((pending, slot))
+                pending = ""
+        merged.append((pending, None))
+        return _CompiledSegment(self.name, self.optional, tuple(merged))
+
+    def chars(self, values: Dict[str, Any]) -> int:
+        return self.literal_chars + sum(len(str(values[slot])) for slot in self.slots)
+
+
+def _compile_renderer(segments: Sequence[_CompiledSegment]) -> Callable[..., str]:
+    """
+    Generate render(**values) for these segments.
+
+    Every slot becomes a keyword parameter and every literal run a constant,
+    so a call costs what a hand-written f-string function would. Literals are
+    emitted with repr() (braces doubled) and slots are validated identifiers,
+    so template text cannot inject code into the generated source.
+    """
+    namespace: Dict[str, Any] = {}
+    blocks: List[Tuple[Tuple[str, ...], List[Tuple[str, str]]]] = []
+    required: Dict[str, None] = {}
+    optional: Dict[str, None] = {}
+    for segment in segments:
+        guard = segment.slots if segment.optional else ()
+        (optional if guard else required).update(dict.fromkeys(segment.slots))
+        if not blocks or guard or blocks[-1][0]:
+            blocks.append((guard, []))
+        fields = blocks[-1][1]
+        for literal, slot in segment.parts:
+            if literal:
+                if fields and fields[-1][0] == "":
+                    # merge with the literal run before it (a previous static segment)
+                    fields[-1] = ("", fields[-1][1] + literal)
+                else:
+                    fields.append(("", literal))
+            if slot is not None:
+                fields.append((slot, ""))
+    # a missing required slot raises KeyError when it is formatted, so the happy path has no checks
+    namespace.update((f"_missing_{slot}", _Missing(slot)) for slot in required)
+    params = [f"{slot}=_missing_{slot}" for slot in required] + [f"{slot}=None" for slot in optional if slot not in required]
+    lines = ["def render(" + ("*, " + ", ".join(params) if params else "") + "):"]
+    assigned = False
+    for guard, fields in blocks:
+        if not fields:
+            continue
+        # adjacent f-strings compile to one; literals go in as constants via repr
+        expr = " ".join(
+            "f'{" + slot + "}'" if slot else "f" + repr(literal.replace("{", "{{").replace("}", "}}"))
+            for slot, literal in fields
+        )
+        if guard:
+            if not assigned:
+                lines.append("    out = ''")
+                assigned = True
+            lines.append("    if " + " and ".join(guard) + ":")
+            lines.append("        out += " + expr)
+        else:
+            lines.append(f"    out {'+=' if assigned else '='} {expr}")
+            assigned = True
+    lines.append("    return out" if assigned else "    return ''")
+    exec(compile("\n".join(lines), "<PromptTemplate>", "exec"), namespace)
+    return namespace["render"]
+
+
+class PromptTemplate:
+    """
+    A prompt compiled from named segments.
+
+    Literal text is split from its {slot}s once, at construction. bind() fills
+    the slots that don't change between turns (an NPC's name and personality)
+    and pre-renders every segment that becomes fully static. On first use a
+    template compiles one small render function: adjacent literal runs are
+    merged into constants and interleaved with the remaining slots in a single
+    f-string per run of required segments, and each optional segment is
+    appended behind a check of its slots. A render then costs what the
+    hand-written f-string would, and nothing is parsed per call. Token estimates (the same
+    heuristic as estimate_tokens) are kept per segment, static ones computed
+    once, so callers can check a prompt budget without rendering or
+    re-tokenizing.
+    """
+
+    def __init__(self, segments: Sequence[Segment]):
+        self._init(tuple(_CompiledSegment.compile(s) for s in segments))
+
+    @classmethod
+    def _from_compiled(cls, segments: Sequence[_CompiledSegment]) -> "PromptTemplate":
+        template = cls.__new__(cls)
+        template._init(tuple(segments))
+        return template
+
+    def _init(self, segments: Tuple[_CompiledSegment, ...]) -> None:
+        self._segments = segments
+
+    @property
+    def names(self) -> Tuple[str, ...]:
+        return tuple(s.name for s in self._segments)
+
+    @property
+    def slots(self) -> Tuple[str, ...]:
+        """Slots still to be filled at render time, in order of first use."""
+        return tuple(dict.fromkeys(slot for s in self._segments for slot in s.slots))
+
+    @property
+    def static_tokens(self) -> int:
+        """Estimated tokens of the segments that no longer have slots."""
+        return sum(s.tokens for s in self._segments)
+
+    def bind(self, **values: Any) -> "PromptTemplate":
+        """A new template with these slots filled in; segments left without slots are rendered now."""
+        bound = (s.bind(values) for s in self._segments)
+        return self._from_compiled([s for s in bound if s is not None])
+
+    def render(self, **values: Any) -> str:
+        """The prompt for these values; a missing slot raises KeyError."""
+        # first call only: the generated renderer then shadows this method on the instance
+        self.render: Callable[..., str] = _compile_renderer(self._segments)
+        return self.render(**values)
+
+    def render_with_tokens(self, **values: Any) -> Tuple[str, Dict[str, int]]:
+        """The prompt and its estimated tokens per segment (skipped optional segments are absent)."""
+        return self.render(**values), self.tokens(**values)
+
+    def tokens(self, **values: Any) -> Dict[str, int]:
+        """Estimated tokens per segment for these values, without rendering the prompt."""
+        tokens: Dict[str, int] = {}
+        for segment in self._segments:
+            if segment.rendered is not None:
+                tokens[segment.name] = segment.tokens
+            elif not segment.skipped(values):
+                tokens[segment.name] = tokens_for_length(segment.chars(values))
+        return tokens
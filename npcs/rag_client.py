@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict
+
+# Client for `bartender_rag.py serve`. Standard library only, so a query against a
+# resident daemon costs an interpreter start and one round trip over the socket.
+# (unix sockets only, so $TMPDIR or /tmp rather than importing tempfile)
+DEFAULT_SOCKET = os.environ.get("RAG_SOCKET", os.path.join(os.environ.get("TMPDIR", "/tmp"), "bartender_rag.sock"))
+DEFAULT_TIMEOUT = float(os.environ.get("RAG_SOCKET_TIMEOUT", "30"))
+
+
+class DaemonUnavailable(ConnectionError):
+    """Nothing is listening on the socket."""
+
+
+class DaemonError(RuntimeError):
+    """The daemon answered with an error."""
+
+
+def request(path: str, payload: Dict[str, Any], timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    """Send one request to the daemon and return its reply; raises DaemonError on {"ok": false}."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonUnavailable(f"No query daemon on {path}: {e}") from e
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        sock.close()
+    if not line:
+        raise DaemonUnavailable(f"Query daemon on {path} closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise DaemonError(reply.get("error", "unknown error"))
+    return reply
+
+
+def query(path: str, query: str, **kwargs: Any) -> Dict[str, Any]:
+    """The daemon's answer to a `query`, in the shape `bartender_rag.py query --json` prints."""
+    return request(path, dict(kwargs, op="query", query=query))["result"]
+
+
+def ping(path: str, timeout: float = 1.0) -> bool:
+    try:
+        request(path, {"op": "ping"}, timeout=timeout)
+    except (DaemonUnavailable, OSError):
+        return False
+    return True
+
+
+def shutdown(path: str) -> None:
+    request(path, {"op": "shutdown"})
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query a running `bartender_rag.py serve` daemon")
+    p.add_argument("query", nargs="?", help="User/player query to retrieve relevant rules")
+    p.add_argument("--socket", default=DEFAULT_SOCKET, help="Daemon socket (default: $RAG_SOCKET or $TMPDIR/bartender_rag.sock)")
+    p.add_argument("--index", default=None, help="Index path on the daemon's side (default: the bartender index)")
+    p.add_argument("--npc", default=None, help="Query this NPC's index from the daemon's rules registry")
+    p.add_argument("--top-k", type=int, default=6)
+    p.add_argument("--mode", default="vector", help="vector, hybrid or lexical-first")
+    p.add_argument("--json", action="store_true", help="Print the full JSON result")
+    p.add_argument("--ping", action="store_true", help="Exit 0 if a daemon is listening, 1 otherwise")
+    p.add_argument("--shutdown", action="store_true", help="Stop the daemon")
+    args = p.parse_args()
+
+    if args.ping:
+        sys.exit(0 if ping(args.socket) else 1)
+    if args.shutdown:
+        shutdown(args.socket)
+        return
+    if not args.query:
+        p.error("a query is required")
+    kwargs: Dict[str, Any] = {"npc": args.npc, "top_k": args.top_k, "mode": args.mode}
+    if args.index:
+        # the daemon resolves paths against its own working directory, not ours
+        kwargs["index"] = os.path.abspath(args.index)
+    try:
+        out = query(args.socket, args.query, **kwargs)
+    except (DaemonUnavailable, DaemonError) as e:
+        sys.exit(str(e))
+    if args.json:
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+    else:
+        print("Top results:")
+        for i, h in enumerate(out["results"], start=1):
+            print(f"{i}. score={h['score']:.3f} | {h['id']} :: {h['text']}")
+        print()
+        print("Composed prompt:")
+        print(out["composed_prompt"])
+
+
+if __name__ == "__main__":
+    main()
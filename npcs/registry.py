@@ -0,0 +1,233 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from npcs.bartender_rag import (
+    BatchEmbedder,
+    Retriever,
+    VectorIndex,
+    build_rules_index,
+    index_paths,
+    index_stamp,
+    lexical_path,
+    load_index,
+    load_json,
+    load_lexical,
+)
+from npcs.lexical import LexicalIndex
+
+
+RULES_SUFFIX = "_rules.json"
+INDEX_SUFFIX = "_rules_index.npy"
+DEFAULT_RULES_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MEMORY_BUDGET = int(os.environ.get("INDEX_MEMORY_MB", "256")) * 1024 * 1024
+
+
+class UnknownNPC(KeyError):
+    pass
+
+
+@dataclass
+class NPCRules:
+    npc_id: str
+    npc_name: str
+    rules_path: str
+    index_path: str
+
+    @property
+    def built(self) -> bool:
+        return all(os.path.exists(p) for p in index_paths(self.index_path))
+
+    @property
+    def stale(self) -> bool:
+        """True when the index is missing or older than its rules file."""
+        if not self.built:
+            return True
+        return os.path.getmtime(self.rules_path) > os.path.getmtime(index_paths(self.index_path)[1])
+
+
+@dataclass
+class LoadedIndex:
+    index: VectorIndex
+    lexical: Optional[LexicalIndex]
+    nbytes: int
+    loaded: float = field(default_factory=time.monotonic)
+    # index_stamp when loaded; a different stamp means the files were rebuilt since
+    stamp: Optional[Tuple[int, int]] = None
+
+
+def index_nbytes(path: str, with_lexical: bool = False) -> int:
+    """Memory charged for a loaded index: the size of its files on disk."""
+    paths = list(index_paths(path))
+    if with_lexical:
+        paths.append(lexical_path(path))
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+class IndexRegistry:
+    """
+    Per-NPC rules indexes, discovered from a directory and loaded on first use.
+
+    Every <npc_id>_rules.json in rules_dir is one NPC; its index lives at
+    <npc_id>_rules_index.npy in index_dir (rules_dir by default), so the
+    bartender keeps the path bartender_rag has always used. Loaded indexes are
+    kept in LRU order and the coldest are unloaded once their combined size
+    passes memory_budget bytes; the most recently loaded index is always kept.
+    Retrievers already handed out keep their index alive until released; index
+    files are replaced atomically, so rebuilding an NPC while sessions are
+    reading it is safe. Each lookup compares the index's sidecar with the one
+    that was loaded, so new retrievers see a rebuild from build() as well as
+    one from the bartender_rag CLI or another process.
+    """
+
+    def __init__(
+        self,
+        rules_dir: str = DEFAULT_RULES_DIR,
+        index_dir: Optional[str] = None,
+        memory_budget: int = DEFAULT_MEMORY_BUDGET,
+        mmap: bool = True
+    ):
+        self.rules_dir = rules_dir
+        self.index_dir = index_dir or rules_dir
+        self.memory_budget = memory_budget
+        self.mmap = mmap
+        self._npcs: Optional[Dict[str, NPCRules]] = None
+        self._loaded: "OrderedDict[str, LoadedIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.unloads = 0
+
+    def discover(self) -> Dict[str, NPCRules]:
+        """(Re)scan rules_dir for NPC rules files."""
+        npcs: Dict[str, NPCRules] = {}
+        for name in sorted(os.listdir(self.rules_dir)):
+            if not name.endswith(RULES_SUFFIX):
+                continue
+            npc_id = name[: -len(RULES_SUFFIX)]
+            rules_path = os.path.join(self.rules_dir, name)
+            try:
+                npc_name = load_json(rules_path).get("npc_name") or npc_id
+            except (OSError, ValueError):
+                continue
+            npcs[npc_id] = NPCRules(
+                npc_id=npc_id,
+                npc_name=npc_name,
+                rules_path=rules_path,
+                index_path=os.path.join(self.index_dir, npc_id + INDEX_SUFFIX),
+            )
+        self._npcs = npcs
+        return npcs
+
+    @property
+    def npcs(self) -> Dict[str, NPCRules]:
+        if self._npcs is None:
+            self.discover()
+        return self._npcs
+
+    def rules(self, npc_id: str) -> NPCRules:
+        if npc_id not in self.npcs:
+            # pick up rules files added since the last scan
+            self.discover()
+        try:
+            return self.npcs[npc_id]
+        except KeyError:
+            raise UnknownNPC(npc_id) from None
+
+    def __contains__(self, npc_id: str) -> bool:
+        try:
+            self.rules(npc_id)
+        except UnknownNPC:
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self.npcs)
+
+    def build(self, npc_id: str, embedder: BatchEmbedder, **kwargs: Any) -> Dict[str, Any]:
+        """Build one NPC's index (see build_rules_index for kwargs) and drop any loaded copy."""
+        npc = self.rules(npc_id)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.unload(npc.index_path)
+        _, stats = build_rules_index(npc.rules_path, npc.index_path, embedder, **kwargs)
+        return stats
+
+    def build_all(self, embedder: BatchEmbedder, stale_only: bool = False, **kwargs: Any) -> Dict[str, Dict[str, Any]]:
+        """Build every discovered NPC's index; returns build stats per npc_id."""
+        return {
+            npc_id: self.build(npc_id, embedder, **kwargs)
+            for npc_id, npc in self.discover().items()
+            if not stale_only or npc.stale
+        }
+
+    def get(self, npc_id: str, lexical: bool = False) -> LoadedIndex:
+        """The NPC's loaded index, loading it (and unloading cold ones) if needed."""
+        return self.get_path(self.rules(npc_id).index_path, lexical=lexical)
+
+    def get_path(self, path: str, lexical: bool = False) -> LoadedIndex:
+        """Like get, for an index addressed by path instead of npc_id."""
+        key = index_paths(path)[0]
+        stamp = index_stamp(path)
+        with self._lock:
+            entry = self._loaded.get(key)
+            if entry is not None and entry.stamp != stamp:
+                # rebuilt behind our back; live retrievers keep the old one
+                del self._loaded[key]
+                self.unloads += 1
+                entry = None
+            if entry is not None:
+                self._loaded.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = LoadedIndex(index=load_index(path, mmap=self.mmap), lexical=None, nbytes=index_nbytes(path))
+                # stamped after loading: a legacy JSON index only gets its sidecar when converted
+                entry.stamp = index_stamp(path)
+                self._loaded[key] = entry
+                self.loads += 1
+            if lexical and entry.lexical is None:
+                entry.lexical = load_lexical(path, entry.index)
+                entry.nbytes = index_nbytes(path, with_lexical=True)
+            self._enforce_budget()
+            return entry
+
+    def retriever(self, npc_id: str, mode: str = "vector", **kwargs: Any) -> Retriever:
+        entry = self.get(npc_id, lexical=mode != "vector")
+        return Retriever(entry.index, mode=mode, lexical=entry.lexical, **kwargs)
+
+    def retriever_for_path(self, path: str, mode: str = "vector", **kwargs: Any) -> Retriever:
+        entry = self.get_path(path, lexical=mode != "vector")
+        return Retriever(entry.index, mode=mode, lexical=entry.lexical, **kwargs)
+
+    def _enforce_budget(self) -> None:
+        while len(self._loaded) > 1 and self.nbytes > self.memory_budget:
+            self._loaded.popitem(last=False)
+            self.unloads += 1
+
+    def unload(self, path: str) -> bool:
+        with self._lock:
+            if self._loaded.pop(index_paths(path)[0], None) is None:
+                return False
+            self.unloads += 1
+            return True
+
+    @property
+    def nbytes(self) -> int:
+        return sum(entry.nbytes for entry in self._loaded.values())
+
+    def loaded(self) -> List[str]:
+        """Index paths currently loaded, coldest first."""
+        return list(self._loaded)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "npcs": len(self.npcs),
+            "loaded": len(self._loaded),
+            "nbytes": self.nbytes,
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "hits": self.hits,
+            "unloads": self.unloads,
+        }
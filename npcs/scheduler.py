@@ -0,0 +1,268 @@
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from npcs.transport import OllamaTransport
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+@dataclass
+class _GenerateJob:
+    key: str
+    payload: Dict[str, Any]
+    future: Future
+    submitted: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _EmbedRequest:
+    text: str
+    priority: int
+    future: Future
+    submitted: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _EmbedMarker:
+    model: str
+
+
+class OllamaScheduler:
+    """
+    Priority queue, request coalescing and embedding micro-batching in front of Ollama.
+
+    Generation payloads are deduplicated while in flight: identical requests share
+    one Future. Embedding requests are collected per model for up to batch_window
+    seconds (or max_batch texts) and sent as one /api/embed call, which also keeps
+    the server from flipping between the generation and embedding models for
+    every call. Lower priority values run first, so INTERACTIVE dialogue
+    overtakes BACKGROUND work such as index builds.
+    """
+
+    def __init__(
+        self,
+        ollama_url: str,
+        workers: int = 4,
+        batch_window: float = 0.01,
+        max_batch: int = 64,
+        timeout: float = 120.0,
+        transport: Optional[OllamaTransport] = None
+    ):
+        self.ollama_url = ollama_url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.transport = transport if transport is not None else OllamaTransport(ollama_url, pool_maxsize=workers)
+        self.session = self.transport.session
+
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[int, int, Any]] = []
+        self._seq = itertools.count()
+        self._embed_pending: Dict[str, List[_EmbedRequest]] = {}
+        self._marker_priority: Dict[str, int] = {}
+        # models whose batch a worker is currently collecting; markers for them are left to that worker
+        self._embed_owners: Set[str] = set()
+        self._inflight_generate: Dict[str, Future] = {}
+        self._inflight_embed: Dict[Tuple[str, str], Future] = {}
+        self._closed = False
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"ollama-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._workers:
+            t.start()
+
+    # -- submission ---------------------------------------------------------
+
+    def submit_generate(self, payload: Dict[str, Any], priority: int = INTERACTIVE) -> Future:
+        """Queue an /api/generate call; resolves to Ollama's JSON response body."""
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._cond:
+            self._check_open()
+            self.submitted += 1
+            existing = self._inflight_generate.get(key)
+            if existing is not None:
+                self.deduplicated += 1
+                return existing
+            future: Future = Future()
+            self._inflight_generate[key] = future
+            heapq.heappush(self._heap, (priority, next(self._seq), _GenerateJob(key, payload, future)))
+            self._cond.notify_all()
+        return future
+
+    def submit_embed(self, text: str, model: str, priority: int = INTERACTIVE) -> Future:
+        """Queue one text for embedding; resolves to its vector."""
+        with self._cond:
+            self._check_open()
+            self.submitted += 1
+            existing = self._inflight_embed.get((model, text))
+            if existing is not None:
+                self.deduplicated += 1
+                return existing
+            future: Future = Future()
+            self._inflight_embed[(model, text)] = future
+            self._embed_pending.setdefault(model, []).append(_EmbedRequest(text, priority, future))
+            if priority < self._marker_priority.get(model, priority + 1):
+                # (re)queue the model's batch at the most urgent member's priority
+                self._marker_priority[model] = priority
+                heapq.heappush(self._heap, (priority, next(self._seq), _EmbedMarker(model)))
+            self._cond.notify_all()
+        return future
+
+    def generate(self, payload: Dict[str, Any], priority: int = INTERACTIVE) -> Dict[str, Any]:
+        return self.submit_generate(payload, priority).result()
+
+    def embed(self, text: str, model: str, priority: int = INTERACTIVE) -> List[float]:
+        return self.submit_embed(text, model, priority).result()
+
+    def embed_many(self, texts: Sequence[str], model: str, priority: int = BACKGROUND) -> List[List[float]]:
+        futures = [self.submit_embed(t, model, priority) for t in texts]
+        return [f.result() for f in futures]
+
+    def _check_open(self) -> None:
+        if self._closed:
+            raise RuntimeError("OllamaScheduler is closed")
+
+    # -- workers ------------------------------------------------------------
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._heap:
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                if isinstance(job, _EmbedMarker):
+                    batch = self._take_embed_batch(job.model)
+                    if not batch:
+                        continue
+                else:
+                    self._record_wait(job.submitted)
+            if isinstance(job, _EmbedMarker):
+                self._run_embed_batch(job.model, batch)
+            else:
+                self._run_generate(job)
+
+    def _take_embed_batch(self, model: str) -> List[_EmbedRequest]:
+        """
+        Called with the lock held: wait out the batching window, then claim a batch.
+
+        Only one worker collects a model's batch at a time. The lock is released
+        while waiting, so a marker for the same model popped by another worker in
+        the meantime is dropped here; whatever the owner leaves behind is
+        re-queued under a fresh marker.
+        """
+        if model in self._embed_owners or not self._embed_pending.get(model):
+            return []
+        self._embed_owners.add(model)
+        try:
+            deadline = self._embed_pending[model][0].submitted + self.batch_window
+            while len(self._embed_pending.get(model, ())) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        finally:
+            self._embed_owners.discard(model)
+        pending = self._embed_pending.get(model, [])
+        if not pending:
+            return []
+        pending.sort(key=lambda r: r.priority)
+        batch, rest = pending[: self.max_batch], pending[self.max_batch:]
+        self._embed_pending[model] = rest
+        self._marker_priority.pop(model, None)
+        if rest:
+            self._marker_priority[model] = rest[0].priority
+            heapq.heappush(self._heap, (rest[0].priority, next(self._seq), _EmbedMarker(model)))
+            self._cond.notify_all()
+        for req in batch:
+            self._record_wait(req.submitted)
+        self.batches += 1
+        self.batched_texts += len(batch)
+        return batch
+
+    def _record_wait(self, submitted: float) -> None:
+        wait = time.monotonic() - submitted
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.completed += 1
+
+    def _run_generate(self, job: _GenerateJob) -> None:
+        try:
+            resp = self.transport.post("/api/generate", json=job.payload, timeout=self.timeout)
+            resp.raise_for_status()
+            result = resp.json()
+        except Exception as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            with self._cond:
+                self._inflight_generate.pop(job.key, None)
+
+    def _run_embed_batch(self, model: str, batch: List[_EmbedRequest]) -> None:
+        try:
+            resp = self.transport.post(
+                "/api/embed",
+                json={"model": model, "input": [r.text for r in batch]},
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            vecs = resp.json().get("embeddings")
+            if not isinstance(vecs, list) or len(vecs) != len(batch):
+                raise RuntimeError("Invalid batch embedding response from Ollama")
+        except Exception as e:
+            for req in batch:
+                req.future.set_exception(e)
+        else:
+            for req, vec in zip(batch, vecs):
+                req.future.set_result(vec)
+        finally:
+            with self._cond:
+                for req in batch:
+                    self._inflight_embed.pop((model, req.text), None)
+
+    # -- lifecycle / stats --------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued_embeds = sum(len(p) for p in self._embed_pending.values())
+            queued_generate = sum(1 for _, _, job in self._heap if isinstance(job, _GenerateJob))
+            return {
+                "queue_depth": queued_generate + queued_embeds,
+                "queued_generate": queued_generate,
+                "queued_embed": queued_embeds,
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "embed_batches": self.batches,
+                "avg_embed_batch": self.batched_texts / self.batches if self.batches else 0.0,
+                "avg_wait_ms": self.total_wait / self.completed * 1000 if self.completed else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "transport": self.transport.stats(),
+            }
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._workers:
+            t.join(timeout=self.timeout)
+        self.transport.close()
@@ -0,0 +1,237 @@
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple, Union
+
+from npcs.caching import EmbeddingCache
+from npcs.conversation_memory import ConversationMemory
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class TooManySessions(RuntimeError):
+    pass
+
+
+@dataclass
+class NPCSession:
+    session_id: str
+    npc_name: str
+    npc_personality: str
+    npc: AsyncNPCDecisionMaker
+    memory: ConversationMemory
+    created: float = field(default_factory=time.monotonic)
+    last_active: float = field(default_factory=time.monotonic)
+    turns: int = 0
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """
+    Hosts many concurrent NPC conversations over one shared AsyncNPCDecisionMaker.
+
+    Each session gets its own NPC identity, ConversationMemory and retriever view
+    (indexes come from a shared IndexRegistry, which loads each NPC's index on
+    first use and unloads cold ones). Sessions idle for longer than
+    idle_timeout are evicted, and at most max_in_flight LLM requests run at once
+    across all sessions.
+    """
+
+    def __init__(
+        self,
+        client: AsyncNPCDecisionMaker,
+        max_sessions: int = 1000,
+        idle_timeout: float = 900.0,
+        max_in_flight: int = 16,
+        context_token_budget: int = 1024,
+        rag_mode: str = "vector",
+        registry: Optional[Any] = None
+    ):
+        self.client = client
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        self.context_token_budget = context_token_budget
+        self.rag_mode = rag_mode
+        self._sessions: Dict[str, NPCSession] = {}
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._registry = registry
+        self._embedding_cache = EmbeddingCache()
+        self.active_requests = 0
+        self.evicted = 0
+        self.total_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            # imported lazily so servers without RAG never load numpy
+            from npcs.registry import IndexRegistry
+            self._registry = IndexRegistry()
+        return self._registry
+
+    def _retriever_for(self, npc_id: Optional[str], index_path: Optional[str]):
+        kwargs = dict(cache=self._embedding_cache, scheduler=self.client.scheduler, mode=self.rag_mode)
+        if npc_id:
+            return self.registry.retriever(npc_id, **kwargs)
+        if index_path:
+            return self.registry.retriever_for_path(index_path, **kwargs)
+        return None
+
+    def create_session(
+        self,
+        npc_name: Optional[str] = None,
+        npc_personality: str = "neutral",
+        index_path: Optional[str] = None,
+        npc_id: Optional[str] = None
+    ) -> NPCSession:
+        """
+        Start a conversation. With npc_id the NPC's rules index comes from the
+        registry and npc_name defaults to the name in its rules file.
+        """
+        self._check_capacity()
+        return self._register(npc_name, npc_personality, npc_id, self._retriever_for(npc_id, index_path))
+
+    async def open_session(
+        self,
+        npc_name: Optional[str] = None,
+        npc_personality: str = "neutral",
+        index_path: Optional[str] = None,
+        npc_id: Optional[str] = None
+    ) -> NPCSession:
+        """
+        create_session for the event loop: the first session for an NPC loads its
+        index (disk reads, mmap, BM25 build) on a worker thread instead of
+        stalling every other connection.
+        """
+        self._check_capacity()
+        loop = asyncio.get_running_loop()
+        retriever = await loop.run_in_executor(None, self._retriever_for, npc_id, index_path)
+        # checked again: other sessions may have opened while the index loaded
+        self._check_capacity()
+        return self._register(npc_name, npc_personality, npc_id, retriever)
+
+    def _check_capacity(self) -> None:
+        self.evict_idle()
+        if len(self._sessions) >= self.max_sessions:
+            raise TooManySessions(f"Session limit of {self.max_sessions} reached")
+
+    def _register(self, npc_name: Optional[str], npc_personality: str, npc_id: Optional[str], retriever: Any) -> NPCSession:
+        if npc_name is None:
+            if not npc_id:
+                raise ValueError("npc_name or npc_id is required")
+            npc_name = self.registry.rules(npc_id).npc_name
+        session = NPCSession(
+            session_id=uuid.uuid4().hex,
+            npc_name=npc_name,
+            npc_personality=npc_personality,
+            npc=self.client.bind(retriever=retriever),
+            memory=ConversationMemory(token_budget=self.context_token_budget),
+        )
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> NPCSession:
+        try:
+            return self._sessions[session_id]
+        except KeyError:
+            raise SessionNotFound(session_id) from None
+
+    def close_session(self, session_id: str) -> None:
+        if self._sessions.pop(session_id, None) is None:
+            raise SessionNotFound(session_id)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [sid for sid, s in self._sessions.items() if s.last_active < cutoff]
+        for sid in idle:
+            del self._sessions[sid]
+        self.evicted += len(idle)
+        return len(idle)
+
+    async def run_evictor(self, interval: float = 30.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+
+    def _turn_kwargs(self, session: NPCSession, player_input: str, player_action: str, temperature: float) -> Dict[str, Any]:
+        return dict(
+            npc_name=session.npc_name,
+            npc_personality=session.npc_personality,
+            situation=player_input,
+            player_action=player_action,
+            context=session.memory.render() or None,
+            temperature=temperature,
+        )
+
+    def _record_turn(self, session: NPCSession, player_input: str, response: Dict) -> None:
+        if "error" not in response:
+            session.memory.add_turn(player_input, str(response.get("dialogue", "")))
+        session.turns += 1
+        self.total_turns += 1
+        session.touch()
+
+    async def take_turn(
+        self,
+        session_id: str,
+        player_input: str,
+        player_action: str = "talk",
+        temperature: float = 0.7
+    ) -> Dict:
+        session = self.get(session_id)
+        session.touch()
+        async with self._in_flight:
+            self.active_requests += 1
+            try:
+                response = await session.npc.get_npc_response(
+                    **self._turn_kwargs(session, player_input, player_action, temperature)
+                )
+            finally:
+                self.active_requests -= 1
+        self._record_turn(session, player_input, response)
+        return response
+
+    async def stream_turn(
+        self,
+        session_id: str,
+        player_input: str,
+        player_action: str = "talk",
+        temperature: float = 0.7
+    ) -> AsyncIterator[Tuple[str, Union[str, Dict]]]:
+        """Like take_turn, but yields ("dialogue", text) events before the final ("response", dict)."""
+        session = self.get(session_id)
+        session.touch()
+        async with self._in_flight:
+            self.active_requests += 1
+            try:
+                async for kind, value in session.npc.get_npc_response_stream_parsed(
+                    **self._turn_kwargs(session, player_input, player_action, temperature)
+                ):
+                    if kind == "response":
+                        self._record_turn(session, player_input, value)
+                    yield kind, value
+            finally:
+                self.active_requests -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "active_requests": self.active_requests,
+            "max_in_flight": self.max_in_flight,
+            "evicted": self.evicted,
+            "total_turns": self.total_turns,
+            "indexes": self._registry.stats() if self._registry is not None else None,
+            "embedding_cache": self._embedding_cache.stats(),
+            "transport": self.client.transport.stats(),
+            "scheduler": self.client.scheduler.stats() if self.client.scheduler is not None else None,
+            "metrics": self.client.metrics.snapshot() if self.client.metrics is not None else None,
+        }
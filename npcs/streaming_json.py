@@ -0,0 +1,132 @@
+import json
+from typing import Dict, List, Optional
+
+from npcs.npc_response import NPCResponse, fallback, parse_response
+
+
+class DialogueStreamParser:
+    """
+    Incremental scanner over a streamed JSON object.
+
+    Feed it text fragments as the model produces them; it returns the newly
+    decoded characters of one top-level string field (``dialogue`` by default)
+    as soon as they arrive, without waiting for the object to close. The whole
+    buffer is still kept so result() can parse the complete response.
+    """
+
+    def __init__(self, field: str = "dialogue"):
+        self.field = field
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._string_is_key = False
+        self._expect_key = False
+        self._key_chars: List[str] = []
+        self._last_key: Optional[str] = None
+        self._after_colon = False
+        self._in_target = False
+        self._escape: Optional[str] = None
+        self._high_surrogate: Optional[str] = None
+        self.field_complete = False
+        self.field_text: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buffer)
+
+    @property
+    def dialogue(self) -> str:
+        return "".join(self.field_text)
+
+    def feed(self, fragment: str) -> str:
+        """Consume a fragment; returns newly decoded text of the target field (may be empty)."""
+        self._buffer.append(fragment)
+        out: List[str] = []
+        for ch in fragment:
+            if self._in_string:
+                self._string_char(ch, out)
+            else:
+                self._structural_char(ch)
+        delta = "".join(out)
+        if delta:
+            self.field_text.append(delta)
+        return delta
+
+    def _structural_char(self, ch: str) -> None:
+        if ch == '"':
+            self._in_string = True
+            self._string_is_key = self._depth == 1 and self._expect_key
+            self._in_target = (
+                self._depth == 1 and self._after_colon and not self.field_complete
+                and self._last_key == self.field
+            )
+            self._key_chars = []
+            self._after_colon = False
+        elif ch in "{[":
+            self._depth += 1
+            self._expect_key = ch == "{"
+            self._after_colon = False
+        elif ch in "}]":
+            self._depth -= 1
+            self._expect_key = False
+        elif ch == ",":
+            self._expect_key = self._depth == 1
+            self._after_colon = False
+        elif ch == ":":
+            self._after_colon = self._depth == 1
+        elif not ch.isspace():
+            # a non-string scalar value (number, true, null...)
+            self._after_colon = False
+
+    def _string_char(self, ch: str, out: List[str]) -> None:
+        if self._escape is not None:
+            self._escape += ch
+            if self._escape == "\\u" or (self._escape.startswith("\\u") and len(self._escape) < 6):
+                return
+            try:
+                decoded = json.loads(f'"{self._escape}"')
+            except ValueError:
+                # an invalid escape such as \q or \x41: keep what the model wrote
+                decoded = self._escape
+            self._escape = None
+            self._emit(decoded, out)
+            return
+        if ch == "\\":
+            self._escape = "\\"
+            return
+        if ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                self._last_key = "".join(self._key_chars)
+                self._expect_key = False
+            if self._in_target:
+                self._in_target = False
+                self.field_complete = True
+            return
+        self._emit(ch, out)
+
+    def _emit(self, decoded: str, out: List[str]) -> None:
+        if self._string_is_key:
+            self._key_chars.append(decoded)
+            return
+        if not self._in_target:
+            return
+        if self._high_surrogate is not None:
+            decoded = (self._high_surrogate + decoded).encode("utf-16", "surrogatepass").decode("utf-16")
+            self._high_surrogate = None
+        elif len(decoded) == 1 and "\ud800" <= decoded <= "\udbff":
+            self._high_surrogate = decoded
+            return
+        out.append(decoded)
+
+    def response(self) -> NPCResponse:
+        """Validate (and if needed repair) the complete buffer; falls back to the streamed dialogue."""
+        text = self.text
+        parsed = parse_response(text)
+        if parsed is not None:
+            return parsed
+        return fallback(text, self.dialogue)
+
+    def result(self) -> Dict:
+        """response() in the dict shape get_npc_response returns."""
+        return self.response().to_dict()
@@ -0,0 +1,256 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+# (connect, read) seconds per endpoint; for streamed responses read is the gap allowed between chunks
+DEFAULT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "/api/generate": (CONNECT_TIMEOUT, float(os.environ.get("OLLAMA_GENERATE_TIMEOUT", "120"))),
+    "/api/embed": (CONNECT_TIMEOUT, float(os.environ.get("OLLAMA_EMBED_TIMEOUT", "60"))),
+    "/api/embeddings": (CONNECT_TIMEOUT, float(os.environ.get("OLLAMA_EMBED_TIMEOUT", "60"))),
+}
+FALLBACK_TIMEOUT = (CONNECT_TIMEOUT, 60.0)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """Raised without touching the network while Ollama is considered unhealthy."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After failure_threshold failed attempts in a row the circuit opens and every
+    call fails fast for reset_timeout seconds. Then one trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Give up a half-open trial without recording an outcome."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after_s": round(self.retry_after(), 3),
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_transports: Dict[str, "OllamaTransport"] = {}
+_registry_lock = threading.Lock()
+
+
+def shared_breaker(base_url: Optional[str]) -> CircuitBreaker:
+    """The process-wide breaker for one Ollama server, shared by every transport talking to it."""
+    key = str(base_url).rstrip("/")
+    with _registry_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker()
+        return _breakers[key]
+
+
+def get_transport(base_url: Optional[str]) -> "OllamaTransport":
+    """The process-wide default transport for one Ollama server."""
+    key = str(base_url).rstrip("/")
+    # resolved first: shared_breaker takes _registry_lock itself
+    breaker = shared_breaker(base_url)
+    with _registry_lock:
+        if key not in _transports:
+            _transports[key] = OllamaTransport(base_url, breaker=breaker)
+        return _transports[key]
+
+
+class OllamaTransport:
+    """
+    Pooled HTTP transport for Ollama with timeouts, retries and a circuit breaker.
+
+    One requests.Session (keep-alive pool of pool_maxsize connections) per
+    transport. Connection errors and 5xx responses are retried up to retries
+    times with full-jitter exponential backoff; read timeouts are not retried,
+    so a hung generation costs the player one timeout rather than several.
+    Failed attempts feed the breaker shared by every transport for the same
+    server, and while it is open post raises CircuitOpen, a
+    requests ConnectionError, so callers' existing error handling applies.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str],
+        pool_maxsize: int = 16,
+        timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+        retries: int = 2,
+        backoff: float = 0.25,
+        max_backoff: float = 4.0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.base_url = str(base_url).rstrip("/")
+        self.pool_maxsize = max(1, pool_maxsize)
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker if breaker is not None else shared_breaker(base_url)
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.short_circuited = 0
+
+    def timeout_for(self, path: str, timeout: Optional[Timeout] = None) -> Tuple[float, float]:
+        if timeout is None:
+            return self.timeouts.get(path, FALLBACK_TIMEOUT)
+        if isinstance(timeout, tuple):
+            return timeout
+        return min(self.timeouts.get(path, FALLBACK_TIMEOUT)[0], timeout), timeout
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def post(self, path: str, json: Any = None, stream: bool = False, timeout: Optional[Timeout] = None) -> requests.Response:
+        """
+        POST to base_url + path. Returns the last response (callers still call
+        raise_for_status) or raises the last connection/timeout error.
+        """
+        url = self.base_url + path
+        timeout = self.timeout_for(path, timeout)
+        self._count("requests")
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self._count("short_circuited")
+                raise CircuitOpen(f"Ollama at {self.base_url} is unavailable; retrying in {self.breaker.retry_after():.1f}s")
+            try:
+                resp = self.session.post(url, json=json, timeout=timeout, **({"stream": True} if stream else {}))
+            except requests.exceptions.ReadTimeout:
+                self._failed()
+                raise
+            except requests.exceptions.ConnectionError:
+                self._failed()
+                if attempt >= self.retries:
+                    raise
+            except (requests.exceptions.MissingSchema, requests.exceptions.InvalidSchema, requests.exceptions.InvalidURL):
+                # a misconfigured URL says nothing about Ollama's health
+                self.breaker.release_trial()
+                raise
+            except requests.exceptions.RequestException:
+                # bad headers, broken chunked bodies: not retryable
+                self._failed()
+                raise
+            except BaseException:
+                # not an Ollama failure, but a half-open trial must not stay claimed
+                self.breaker.release_trial()
+                raise
+            else:
+                if resp.ok or resp.status_code < 500:
+                    self.breaker.record_success()
+                    return resp
+                self._failed()
+                if attempt >= self.retries:
+                    return resp
+                resp.close()
+            self._count("retried")
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def _failed(self) -> None:
+        self._count("failures")
+        self.breaker.record_failure()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        opened = served = idle = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+        return {
+            "hosts": len(pools),
+            "maxsize": self.pool_maxsize,
+            "connections_opened": opened,
+            "idle_connections": idle,
+            "requests_served": served,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "pool": self.pool_stats(),
+            "breaker": self.breaker.stats(),
+        }
+
+    def close(self) -> None:
+        self.session.close()
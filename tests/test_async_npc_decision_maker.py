@@ -0,0 +1,132 @@
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker, NPCDecisionMaker
+import asyncio
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+
+RESPONSE_JSON = '{"dialogue": "Test dialogue", "actions": "Test actions", "emotion": "Test emotion", "decision": "Test decision"}'
+
+
+class TestAsyncNPCDecisionMaker(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.npc_dm = AsyncNPCDecisionMaker(ollama_url="http://test", model="test-model", max_concurrency=2, timeout=1.0)
+        self.test_npc = {
+            "name": "Test NPC",
+            "personality": "Test personality",
+            "situation": "Test situation",
+            "player_action": "Test action",
+            "context": "Test context"
+        }
+
+    async def asyncTearDown(self):
+        await self.npc_dm.aclose()
+
+    def test_create_npc_prompt_matches_sync(self):
+        args = [self.test_npc[k] for k in ("name", "personality", "situation", "player_action", "context")]
+        sync_dm = NPCDecisionMaker(ollama_url="http://test", model="test-model")
+        self.assertEqual(self.npc_dm.create_npc_prompt(*args), sync_dm.create_npc_prompt(*args))
+
+    async def test_get_npc_response_matches_sync(self):
+        mock_response = Mock()
+        mock_response.json.return_value = {"response": RESPONSE_JSON}
+        mock_response.status_code = 200
+        args = [self.test_npc[k] for k in ("name", "personality", "situation", "player_action")]
+
+        with patch.object(self.npc_dm._session, "post", return_value=mock_response) as mock_post:
+            response = await self.npc_dm.get_npc_response(*args)
+        with patch('requests.Session.post', return_value=mock_response) as mock_sync_post:
+            expected = NPCDecisionMaker(ollama_url="http://test", model="test-model").get_npc_response(*args)
+
+        self.assertEqual(response, expected)
+        self.assertEqual(mock_post.call_args.kwargs["json"], mock_sync_post.call_args.kwargs["json"])
+
+    async def test_prefix_reuse_and_keep_alive_are_forwarded(self):
+        mock_response = Mock()
+        mock_response.json.return_value = {"response": RESPONSE_JSON}
+        async with AsyncNPCDecisionMaker(ollama_url="http://test", model="m", prefix_reuse=False, keep_alive="1h") as npc_dm:
+            with patch.object(npc_dm._session, "post", return_value=mock_response) as mock_post:
+                await npc_dm.get_npc_response("a", "b", "c", "d")
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertNotIn("system", payload)
+        self.assertEqual(payload["keep_alive"], "1h")
+
+    async def test_concurrent_turns_keep_their_own_timings(self):
+        class SlowRetriever:
+            def rules_with_timings(self, query, top_k=None):
+                delay = 0.05 if query == "slow" else 0.0
+                time.sleep(delay)
+                return f"- {query}", {"embed_ms": 1000.0 if query == "slow" else 1.0}
+
+        turns = []
+        metrics = Mock()
+        metrics.observe.side_effect = turns.append
+        npc_dm = self.npc_dm.bind(retriever=SlowRetriever())
+        npc_dm.metrics = metrics
+        mock_response = Mock()
+        mock_response.json.return_value = {"response": RESPONSE_JSON}
+        with patch.object(self.npc_dm._session, "post", return_value=mock_response):
+            await asyncio.gather(
+                npc_dm.get_npc_response("Slow", "p", "slow", "talk"),
+                npc_dm.get_npc_response("Fast", "p", "fast", "talk"),
+            )
+
+        embed = {turn.npc: turn.spans["embed"] for turn in turns}
+        self.assertEqual(embed, {"Slow": 1000.0, "Fast": 1.0})
+
+    async def test_get_npc_response_non_json(self):
+        mock_response = Mock()
+        mock_response.json.return_value = {"response": "not json"}
+        with patch.object(self.npc_dm._session, "post", return_value=mock_response):
+            response = await self.npc_dm.get_npc_response("a", "b", "c", "d")
+        self.assertEqual(response["dialogue"], "not json")
+        self.assertIn("note", response)
+
+    async def test_concurrency_is_bounded(self):
+        in_flight = []
+        peak = []
+
+        def slow_post(*args, **kwargs):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            time.sleep(0.05)
+            in_flight.pop()
+            mock_response = Mock()
+            mock_response.json.return_value = {"response": RESPONSE_JSON}
+            return mock_response
+
+        with patch.object(self.npc_dm._session, "post", side_effect=slow_post):
+            results = await asyncio.gather(*[self.npc_dm.get_npc_response("a", "b", "c", "d") for _ in range(6)])
+
+        self.assertTrue(all(r["dialogue"] == "Test dialogue" for r in results))
+        self.assertLessEqual(max(peak), 2)
+
+    async def test_timeout_returns_error_dict(self):
+        self.npc_dm.timeout = 0.05
+
+        def hung_post(*args, **kwargs):
+            time.sleep(0.2)
+            return Mock()
+
+        with patch.object(self.npc_dm._session, "post", side_effect=hung_post):
+            with patch('builtins.print'):
+                response = await self.npc_dm.get_npc_response("a", "b", "c", "d")
+        self.assertIn("error", response)
+        self.assertIn("message", response)
+
+    async def test_get_npc_response_streaming(self):
+        mock_response = Mock()
+        mock_response.iter_lines.return_value = [
+            b'{"response": "chunk1"}',
+            b'{"response": "chunk2"}'
+        ]
+        mock_response.status_code = 200
+
+        with patch.object(self.npc_dm._session, "post", return_value=mock_response):
+            chunks = [c async for c in self.npc_dm.get_npc_response_streaming("a", "b", "c", "d")]
+
+        self.assertEqual(chunks, ["chunk1", "chunk2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
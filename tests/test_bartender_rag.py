@@ -0,0 +1,429 @@
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from npcs import bartender_rag, rag_client
+
+
+def make_index(n_items: int = 50, dim: int = 16, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_items):
+        vec = [rng.uniform(-1, 1) for _ in range(dim)]
+        items.append({
+            "id": f"rules.R{i}",
+            "text": f"Rule R{i}",
+            "meta": {"section": "rules", "npc_name": "Test NPC"},
+            "embedding": vec,
+            "norm": bartender_rag.l2_norm(vec),
+        })
+    return {"ollama_url": "http://test", "embed_model": "test-embed", "items": items}
+
+
+class TestVectorIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = make_index()
+        self.vindex = bartender_rag.VectorIndex.from_index(self.index)
+        self.query_vec = [random.Random(1).uniform(-1, 1) for _ in range(16)]
+
+    def test_matrix_is_contiguous_float32(self):
+        self.assertEqual(self.vindex.matrix.dtype.name, "float32")
+        self.assertTrue(self.vindex.matrix.flags["C_CONTIGUOUS"])
+        self.assertEqual(self.vindex.matrix.shape, (50, 16))
+
+    def test_search_matches_reference(self):
+        with patch.object(bartender_rag, "embed", return_value=self.query_vec):
+            expected = bartender_rag.search_index(self.index, "q", "http://test", "test-embed", top_k=5)
+            actual = self.vindex.search("q", "http://test", "test-embed", top_k=5)
+
+        self.assertEqual([h["id"] for h in actual], [h["id"] for h in expected])
+        for a, e in zip(actual, expected):
+            self.assertAlmostEqual(a["score"], e["score"], places=5)
+        self.assertNotIn("embedding", actual[0])
+
+    def test_search_top_k_larger_than_index(self):
+        hits = self.vindex.search_vector(self.query_vec, top_k=500)
+        self.assertEqual(len(hits), 50)
+        scores = [h["score"] for h in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_zero_query_scores_zero(self):
+        hits = self.vindex.search_vector([0.0] * 16, top_k=3)
+        self.assertTrue(all(h["score"] == 0.0 for h in hits))
+
+    def test_mismatched_dims_are_trimmed(self):
+        with patch.object(bartender_rag, "embed", return_value=self.query_vec[:8]):
+            expected = bartender_rag.search_index(self.index, "q", "http://test", "test-embed", top_k=3)
+        actual = self.vindex.search_vector(self.query_vec[:8], top_k=3)
+        self.assertEqual([h["id"] for h in actual], [h["id"] for h in expected])
+
+
+def clustered_vindex(n_items: int = 2000, dim: int = 32, clusters: int = 20, seed: int = 3) -> bartender_rag.VectorIndex:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    matrix = centers[rng.integers(0, clusters, n_items)] + 0.3 * rng.standard_normal((n_items, dim), dtype=np.float32)
+    items = [{"id": f"lore.{i}", "text": f"Lore {i}", "meta": {}} for i in range(n_items)]
+    return bartender_rag.VectorIndex(matrix, np.linalg.norm(matrix, axis=1).astype(np.float32), items)
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        self.exact = clustered_vindex()
+        self.ann = self.exact.with_ivf(nlist=40, nprobe=4)
+        self.query = (self.exact.matrix[17] + 0.05).tolist()
+
+    def test_lists_cover_every_item_once(self):
+        self.assertEqual(self.ann.ivf.nlist, 40)
+        self.assertEqual(int(self.ann.ivf.offsets[-1]), len(self.exact))
+        self.assertEqual(sorted(it["id"] for it in self.ann.items), sorted(it["id"] for it in self.exact.items))
+
+    def test_probing_every_list_matches_exact_scan(self):
+        expected = self.exact.search_vector(self.query, top_k=10)
+        actual = self.ann.search_vector(self.query, top_k=10, nprobe=40)
+        self.assertEqual([h["id"] for h in actual], [h["id"] for h in expected])
+        self.assertEqual([h["id"] for h in self.ann.search_vector(self.query, top_k=10, exact=True)], [h["id"] for h in expected])
+
+    def test_recall_report(self):
+        report = bartender_rag.recall_report(self.ann, top_k=5, queries=50, nprobes=[1, 8])
+        self.assertEqual([r["nprobe"] for r in report["runs"]], [1, 8])
+        self.assertGreaterEqual(report["runs"][1]["recall"], 0.95)
+        self.assertGreaterEqual(report["runs"][1]["recall"], report["runs"][0]["recall"])
+
+    def test_round_trip_keeps_lists(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "lore.npy")
+            self.ann.save(path)
+            loaded = bartender_rag.load_index(path)
+            self.assertEqual(loaded.ivf.nprobe, 4)
+            self.assertEqual(
+                [h["id"] for h in loaded.search_vector(self.query, top_k=5)],
+                [h["id"] for h in self.ann.search_vector(self.query, top_k=5)],
+            )
+            # rebuilding without IVF removes the stale centroid file
+            self.exact.save(path)
+            self.assertFalse(os.path.exists(bartender_rag.ivf_path(path)))
+            self.assertIsNone(bartender_rag.load_index(path).ivf)
+
+
+class TestBinaryIndexFormat(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.index = make_index(n_items=10, dim=8)
+        self.query_vec = [0.5] * 8
+
+    def test_save_and_memory_mapped_load_round_trip(self):
+        path = os.path.join(self.tmpdir.name, "idx.npy")
+        original = bartender_rag.VectorIndex.from_index(self.index)
+        original.save(path)
+
+        loaded = bartender_rag.load_index(path)
+        self.assertIsInstance(loaded.matrix, np.memmap)
+        self.assertEqual(loaded.embed_model, "test-embed")
+        self.assertEqual(loaded.items, original.items)
+        self.assertEqual(
+            [h["id"] for h in loaded.search_vector(self.query_vec, top_k=4)],
+            [h["id"] for h in original.search_vector(self.query_vec, top_k=4)],
+        )
+
+    def test_overwriting_a_mapped_index_leaves_readers_intact(self):
+        path = os.path.join(self.tmpdir.name, "idx.npy")
+        bartender_rag.VectorIndex.from_index(make_index(n_items=200, dim=8)).save(path)
+        reader = bartender_rag.load_index(path)
+        expected = [h["id"] for h in reader.search_vector(self.query_vec, top_k=4)]
+
+        bartender_rag.VectorIndex.from_index(self.index).save(path)
+
+        self.assertEqual([h["id"] for h in reader.search_vector(self.query_vec, top_k=4)], expected)
+        self.assertEqual(len(bartender_rag.load_index(path)), 10)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["idx.meta.json", "idx.npy"])
+
+    def test_legacy_json_index_is_converted(self):
+        legacy = os.path.join(self.tmpdir.name, "legacy_index.json")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+
+        loaded = bartender_rag.load_index(legacy)
+        self.assertEqual(len(loaded), 10)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, "legacy_index.npy")))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, "legacy_index.meta.json")))
+
+    def test_missing_index_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            bartender_rag.load_index(os.path.join(self.tmpdir.name, "nope.npy"))
+
+
+def fake_embed_post(url, json=None, timeout=None):
+    resp = Mock()
+    if url.endswith("/api/embed"):
+        resp.status_code = 200
+        resp.json.return_value = {"embeddings": [[float(len(t)), 1.0] for t in json["input"]]}
+    else:
+        resp.status_code = 200
+        resp.json.return_value = {"embedding": [float(len(json["prompt"])), 1.0]}
+    return resp
+
+
+class TestBatchEmbedder(unittest.TestCase):
+    def setUp(self):
+        self.texts = ["a" * n for n in range(1, 12)]
+
+    def test_batches_preserve_order(self):
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed", batch_size=3, workers=2)
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post) as mock_post:
+            vecs = embedder.embed_many(self.texts)
+
+        self.assertEqual([v[0] for v in vecs], [float(n) for n in range(1, 12)])
+        self.assertEqual(mock_post.call_count, 4)
+        self.assertTrue(embedder.supports_batch)
+        self.assertEqual(embedder.embedded, 11)
+
+    def test_falls_back_to_single_embeddings_endpoint(self):
+        def old_server(url, json=None, timeout=None):
+            if url.endswith("/api/embed"):
+                resp = Mock()
+                resp.status_code = 404
+                return resp
+            return fake_embed_post(url, json=json, timeout=timeout)
+
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed", batch_size=4, workers=2)
+        with patch.object(embedder.session, "post", side_effect=old_server):
+            vecs = embedder.embed_many(self.texts)
+
+        self.assertFalse(embedder.supports_batch)
+        self.assertEqual([v[0] for v in vecs], [float(n) for n in range(1, 12)])
+
+    def test_build_index_uses_embedder(self):
+        chunks = [bartender_rag.Chunk(id=f"c{i}", text=t, meta={}) for i, t in enumerate(self.texts[:3])]
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed")
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post):
+            index = bartender_rag.build_index(chunks, "http://test", "test-embed", embedder=embedder)
+
+        self.assertEqual([it["id"] for it in index["items"]], ["c0", "c1", "c2"])
+        self.assertAlmostEqual(index["items"][0]["norm"], 2 ** 0.5)
+
+
+class TestIncrementalBuild(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [bartender_rag.Chunk(id=f"rules.R{i}", text=f"Rule {i}", meta={}) for i in range(1, 6)]
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed")
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post):
+            index = bartender_rag.build_index(self.chunks, "http://test", "test-embed", embedder=embedder)
+        self.previous = bartender_rag.VectorIndex.from_index(index)
+
+    def rebuild(self, chunks, embed_model="test-embed"):
+        embedder = bartender_rag.BatchEmbedder("http://test", embed_model)
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post) as mock_post:
+            index = bartender_rag.build_index(chunks, "http://test", embed_model, embedder=embedder, previous=self.previous)
+        return index, mock_post
+
+    def test_unchanged_chunks_are_not_re_embedded(self):
+        index, mock_post = self.rebuild(self.chunks)
+        mock_post.assert_not_called()
+        self.assertEqual(index["stats"], {"reused": 5, "embedded": 0, "removed": 0})
+
+    def test_only_modified_added_and_removed_chunks_change(self):
+        chunks = list(self.chunks[:4])
+        chunks[1] = bartender_rag.Chunk(id="rules.R2", text="Rule 2, edited", meta={})
+        chunks.append(bartender_rag.Chunk(id="rules.R9", text="Rule 9", meta={}))
+
+        index, mock_post = self.rebuild(chunks)
+
+        self.assertEqual(index["stats"], {"reused": 3, "embedded": 2, "removed": 1})
+        sent = mock_post.call_args.kwargs["json"]["input"]
+        self.assertEqual(sent, ["Rule 2, edited", "Rule 9"])
+        self.assertEqual(index["items"][1]["embedding"][0], float(len("Rule 2, edited")))
+
+    def test_changed_embed_model_re_embeds_everything(self):
+        index, _ = self.rebuild(self.chunks, embed_model="other-embed")
+        self.assertEqual(index["stats"]["embedded"], 5)
+
+
+class TestRetriever(unittest.TestCase):
+    def setUp(self):
+        self.vindex = bartender_rag.VectorIndex.from_index(make_index(n_items=10, dim=8))
+        self.retriever = bartender_rag.Retriever(self.vindex, top_k=3)
+
+    def test_retrieve_reports_timings_and_caches_query(self):
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.json.return_value = {"embedding": [0.5] * 8}
+            first = self.retriever.retrieve("beer!")
+            second = self.retriever.retrieve("Beer!")
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual([h["id"] for h in first], [h["id"] for h in second])
+        self.assertEqual(len(first), 3)
+        self.assertEqual(set(self.retriever.last_timings), {"embed_ms", "score_ms"})
+        self.assertEqual(self.retriever.totals["calls"], 2)
+
+    def test_decision_maker_injects_rules(self):
+        from npcs.npc_decision_maker_module import NPCDecisionMaker
+
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="test-model", retriever=self.retriever, rag_top_k=2)
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.json.side_effect = [
+                {"embedding": [0.5] * 8},
+                {"response": '{"dialogue": "Aye", "actions": "", "emotion": "calm", "decision": ""}'},
+            ]
+            response = npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+
+        self.assertEqual(response["dialogue"], "Aye")
+        prompt = mock_post.call_args.kwargs["json"]["prompt"]
+        self.assertIn("Relevant Rules:", prompt)
+        self.assertEqual(prompt.count("- Rule R"), 2)
+        self.assertEqual(set(npc_dm.last_timings), {"embed_ms", "score_ms", "prompt_ms"})
+
+
+class TestHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        index = make_index(n_items=10, dim=8)
+        index["items"][3]["text"] = "Rule R3: Quote prices plainly."
+        index["items"][3]["meta"]["tags"] = ["trade", "pricing"]
+        self.vindex = bartender_rag.VectorIndex.from_index(index)
+
+    def test_lexical_first_skips_embedding_on_confident_match(self):
+        retriever = bartender_rag.Retriever(self.vindex, top_k=2, mode="lexical-first")
+        with patch('requests.Session.post') as mock_post:
+            hits = retriever.retrieve("what are your prices?")
+        mock_post.assert_not_called()
+        self.assertEqual(hits[0]["id"], "rules.R3")
+        self.assertEqual(hits[0]["source"], "lexical")
+        self.assertEqual(set(retriever.last_timings), {"lexical_ms"})
+        self.assertEqual(retriever.totals["embeds_skipped"], 1)
+
+    def test_lexical_first_falls_back_to_fusion(self):
+        retriever = bartender_rag.Retriever(self.vindex, top_k=10, mode="lexical-first", lexical_confidence=1.01)
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.json.return_value = {"embedding": [0.5] * 8}
+            hits = retriever.retrieve("what are your prices?")
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertTrue(all(h["source"] == "hybrid" for h in hits))
+        vector_rank = [h["id"] for h in self.vindex.search_vector([0.5] * 8, top_k=10)].index("rules.R3")
+        self.assertLess([h["id"] for h in hits].index("rules.R3"), vector_rank)
+        for h in hits:
+            self.assertAlmostEqual(h["score"], 0.5 * h["vector_score"] + 0.5 * h["lexical_score"], places=5)
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            bartender_rag.Retriever(self.vindex, mode="fuzzy")
+
+
+class TestQueryDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.index_path = os.path.join(self.tmpdir.name, "idx.npy")
+        index = make_index(n_items=10, dim=8)
+        index["items"][3]["text"] = "Rule R3: Quote prices plainly."
+        index["items"][3]["meta"]["tags"] = ["trade", "pricing"]
+        bartender_rag.VectorIndex.from_index(index).save(self.index_path)
+        self.socket = os.path.join(self.tmpdir.name, "rag.sock")
+
+    def start_daemon(self) -> bartender_rag.RAGDaemon:
+        server = bartender_rag.RAGDaemon(self.socket, bartender_rag.QueryService())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+            thread.join(timeout=5)
+
+        self.addCleanup(stop)
+        return server
+
+    def test_daemon_answers_like_the_in_process_query(self):
+        server = self.start_daemon()
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.json.return_value = {"embedding": [0.5] * 8}
+            remote = rag_client.query(self.socket, "what are your prices?", index=self.index_path, top_k=3)
+            again = rag_client.query(self.socket, "What are your prices?", index=self.index_path, top_k=3)
+            service = bartender_rag.QueryService()
+            local = service.query("what are your prices?", index=self.index_path, top_k=3)
+            service.close()
+
+        self.assertEqual(remote["results"], local["results"])
+        self.assertEqual(remote["composed_prompt"], local["composed_prompt"])
+        self.assertEqual(again["results"], remote["results"])
+        # the resident process embedded the query once and served the repeat from its cache
+        self.assertEqual(again["embedding_cache"]["hits"], 1)
+        self.assertEqual(server.queries, 2)
+        self.assertTrue(rag_client.ping(self.socket))
+
+    def test_lexical_first_query_skips_embedding(self):
+        self.start_daemon()
+        with patch('requests.Session.post') as mock_post:
+            out = rag_client.query(self.socket, "what are your prices?", index=self.index_path, top_k=2, mode="lexical-first")
+        mock_post.assert_not_called()
+        self.assertTrue(out["embedding_skipped"])
+        self.assertEqual(out["results"][0]["id"], "rules.R3")
+
+    def test_errors_are_returned_not_fatal(self):
+        self.start_daemon()
+        with self.assertRaises(rag_client.DaemonError):
+            rag_client.query(self.socket, "beer", index=os.path.join(self.tmpdir.name, "nope.npy"))
+        self.assertTrue(rag_client.ping(self.socket))
+
+    def test_rebuilt_index_is_picked_up(self):
+        self.start_daemon()
+        query = dict(index=self.index_path, top_k=2, mode="lexical-first")
+        self.assertEqual(rag_client.query(self.socket, "what are your prices?", **query)["results"][0]["id"], "rules.R3")
+
+        index = make_index(n_items=4, dim=8)
+        index["items"][1]["text"] = "Rule R1: Prices are posted on the wall."
+        bartender_rag.VectorIndex.from_index(index).save(self.index_path)
+
+        out = rag_client.query(self.socket, "what are your prices?", **query)
+        self.assertEqual(out["results"][0]["id"], "rules.R1")
+        with patch('requests.Session.post') as mock_post:
+            mock_post.return_value.json.return_value = {"embedding": [0.5] * 8}
+            self.assertEqual(len(rag_client.query(self.socket, "rule", index=self.index_path, top_k=10)["results"]), 4)
+
+    def test_second_daemon_does_not_take_a_live_socket(self):
+        self.start_daemon()
+        with self.assertRaises(OSError):
+            bartender_rag.RAGDaemon(self.socket, bartender_rag.QueryService())
+        self.assertTrue(rag_client.ping(self.socket))
+
+    def test_stale_socket_is_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket)
+        stale.close()
+        self.start_daemon()
+        self.assertTrue(rag_client.ping(self.socket))
+
+    def test_missing_daemon(self):
+        self.assertFalse(rag_client.ping(self.socket))
+        with self.assertRaises(rag_client.DaemonUnavailable):
+            rag_client.query(self.socket, "beer")
+
+    def test_shutdown_removes_socket(self):
+        server = bartender_rag.RAGDaemon(self.socket, bartender_rag.QueryService())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        rag_client.shutdown(self.socket)
+        thread.join(timeout=5)
+        server.server_close()
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket))
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_cli_modules_import_without_numpy_or_requests(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = "import sys, npcs.bartender_rag, npcs.rag_client; print(sorted({'numpy', 'requests'} & set(sys.modules)))"
+        out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "[]")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+import requests
+
+from benchmarks.mock_ollama import MockOllamaConfig, MockOllamaServer
+from benchmarks.run_benchmarks import compare, percentile
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+
+
+class TestMockOllama(unittest.TestCase):
+    def test_serves_generate_and_embed(self):
+        config = MockOllamaConfig(latency=0, token_rate=100000, embed_dim=8)
+        with MockOllamaServer(config=config) as server:
+            npc = NPCDecisionMaker(ollama_url=server.url, model="mock")
+            response = npc.get_npc_response("Mara", "warm", "beer", "talk")
+            embed = requests.post(f"{server.url}/api/embed", json={"model": "m", "input": ["a", "b"]}, timeout=5).json()
+        self.assertIn("dialogue", response)
+        self.assertEqual(len(embed["embeddings"]), 2)
+        self.assertEqual(len(embed["embeddings"][0]), 8)
+        self.assertEqual(server.requests, {"/api/generate": 1, "/api/embed": 1})
+
+
+class TestRegressionCheck(unittest.TestCase):
+    def test_percentile_interpolates(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertAlmostEqual(percentile([0, 10], 95), 9.5)
+
+    def test_flags_p95_regressions_beyond_tolerance(self):
+        baseline = {"results": [{"name": "a", "p95_ms": 10.0}, {"name": "b", "p95_ms": 10.0}]}
+        report = {"results": [{"name": "a", "p95_ms": 11.0}, {"name": "b", "p95_ms": 13.0}, {"name": "new", "p95_ms": 1.0}]}
+        regressions = compare(report, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("b:"))
+
+
+if __name__ == "__main__":
+    unittest.main()
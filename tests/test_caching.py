@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs import bartender_rag
+from npcs.caching import EmbeddingCache, LRUCache, ResponseCache
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "embeddings.sqlite")
+
+    def test_key_is_model_and_normalized_text(self):
+        cache = EmbeddingCache()
+        cache.put("embed-a", "Beer!", [1.0, 2.0])
+
+        self.assertEqual(cache.get("embed-a", "  beer! "), [1.0, 2.0])
+        self.assertIsNone(cache.get("embed-b", "beer!"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_disk_store_survives_restart(self):
+        cache = EmbeddingCache(path=self.path)
+        cache.put("embed-a", "any rumors?", [0.5, 0.25])
+        cache.close()
+
+        reopened = EmbeddingCache(path=self.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.get("embed-a", "Any rumors?"), [0.5, 0.25])
+        self.assertEqual(reopened.stats()["disk_hits"], 1)
+
+    def test_disk_store_is_bounded(self):
+        cache = EmbeddingCache(max_entries=0, path=self.path, max_disk_entries=3)
+        self.addCleanup(cache.close)
+        for i in range(5):
+            cache.put("m", f"text {i}", [float(i)])
+
+        self.assertEqual(len(cache.disk), 3)
+        self.assertIsNone(cache.get("m", "text 0"))
+        self.assertEqual(cache.get("m", "text 4"), [4.0])
+
+    @patch('requests.Session.post')
+    def test_embed_uses_cache(self, mock_post):
+        mock_response = Mock()
+        mock_response.json.return_value = {"embedding": [1.0, 0.0]}
+        mock_post.return_value = mock_response
+        cache = EmbeddingCache()
+
+        for text in ["beer!", "Beer!", "beer! "]:
+            vec = bartender_rag.embed(text, ollama_url="http://test", model="m", cache=cache)
+            self.assertEqual(vec, [1.0, 0.0])
+
+        self.assertEqual(mock_post.call_count, 1)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.mock_response = Mock()
+        self.mock_response.json.return_value = {
+            "response": '{"dialogue": "Test dialogue", "actions": "", "emotion": "calm", "decision": ""}'
+        }
+
+    def ask(self, npc_dm, temperature=0.0, situation="Test situation"):
+        return npc_dm.get_npc_response("Test NPC", "Test personality", situation, "talk", temperature=temperature)
+
+    @patch('requests.Session.post')
+    def test_repeated_deterministic_turn_hits_cache(self, mock_post):
+        mock_post.return_value = self.mock_response
+        cache = ResponseCache()
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m", response_cache=cache)
+
+        first = self.ask(npc_dm)
+        first["dialogue"] = "mutated by caller"
+        second = self.ask(npc_dm)
+        self.ask(npc_dm, situation="Other situation")
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(second["dialogue"], "Test dialogue")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    @patch('requests.Session.post')
+    def test_high_temperature_bypasses_cache(self, mock_post):
+        mock_post.return_value = self.mock_response
+        cache = ResponseCache(max_temperature=0.3)
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m", response_cache=cache)
+
+        self.ask(npc_dm, temperature=0.7)
+        self.ask(npc_dm, temperature=0.7)
+
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(cache.stats()["bypassed"], 2)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_ttl_expires_entries(self):
+        cache = ResponseCache(ttl=0.0)
+        cache.put("k", {"dialogue": "hi"})
+        with patch('npcs.caching.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get("k"))
+
+    def test_sqlite_backend_persists_and_is_bounded(self):
+        path = os.path.join(self.tmpdir.name, "responses.sqlite")
+        cache = ResponseCache(backend="sqlite", path=path, max_entries=2)
+        for i in range(3):
+            cache.put(f"k{i}", {"dialogue": str(i)})
+        cache.close()
+
+        reopened = ResponseCache(backend="sqlite", path=path, max_entries=2)
+        self.addCleanup(reopened.close)
+        self.assertIsNone(reopened.get("k0"))
+        self.assertEqual(reopened.get("k2"), {"dialogue": "2"})
+        self.assertEqual(reopened.stats()["entries"], 2)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            ResponseCache(backend="redis")
+
+
+if __name__ == "__main__":
+    unittest.main()
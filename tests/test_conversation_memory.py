@@ -0,0 +1,47 @@
+import json
+import unittest
+
+from npcs.conversation_memory import ConversationMemory, estimate_tokens
+
+
+class TestConversationMemory(unittest.TestCase):
+    def test_empty_memory_renders_nothing(self):
+        self.assertEqual(ConversationMemory().render(), "")
+
+    def test_recent_turns_are_verbatim_compact_json(self):
+        memory = ConversationMemory(token_budget=1024)
+        memory.add_turn("beer!", "Coming right up.")
+        memory.add_turn("any rumors?", "Heard the mill's haunted.")
+
+        rendered = memory.render()
+        self.assertTrue(rendered.startswith("Recent turns: "))
+        turns = json.loads(rendered[len("Recent turns: "):])
+        self.assertEqual(turns[0], {"player": "beer!", "npc": "Coming right up."})
+        self.assertNotIn("\n ", rendered)
+
+    def test_prompt_size_stays_flat(self):
+        memory = ConversationMemory(token_budget=200, max_recent_turns=4)
+        sizes = []
+        for i in range(500):
+            memory.add_turn(f"player line number {i} asking about ale", f"npc reply {i}: " + "mugs clink " * 5)
+            sizes.append(memory.tokens)
+
+        self.assertLessEqual(max(sizes), 200)
+        self.assertLess(max(sizes[250:]) - min(sizes[250:]), 40)
+        self.assertIn("player line number 499", memory.render())
+        self.assertIn("Earlier: ", memory.render())
+        self.assertGreater(memory.turns_dropped, 0)
+
+    def test_oversized_turn_is_truncated(self):
+        memory = ConversationMemory(token_budget=100)
+        memory.add_turn("hi", "x" * 10_000)
+        self.assertLessEqual(memory.tokens, 100)
+
+    def test_estimate_tokens(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs import bartender_rag
+from npcs.caching import EmbeddingCache
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker, NPCDecisionMaker, NPCSpec
+
+DELAYS = {"Mara": 0.15, "Grog": 0.05, "Tess": 0.10}
+ROOM = [NPCSpec(name, "gruff") for name in DELAYS]
+
+
+def slow_generate(url, json=None, timeout=None, **kwargs):
+    """Each NPC's generation takes DELAYS[name] seconds."""
+    name = next(n for n in DELAYS if f"Name: {n}" in json["prompt"])
+    time.sleep(DELAYS[name])
+    resp = Mock()
+    resp.status_code = 200
+    resp.ok = True
+    resp.json.return_value = {"response": '{"dialogue": "%s here"}' % name}
+    return resp
+
+
+def make_retriever():
+    index = bartender_rag.VectorIndex.from_index({"items": [
+        {"id": "R1", "text": "No credit.", "embedding": [1.0, 0.0]},
+        {"id": "R2", "text": "Last call at midnight.", "embedding": [0.0, 1.0]},
+    ]})
+    return bartender_rag.Retriever(index, ollama_url="http://test", embed_model="e", cache=EmbeddingCache(max_entries=8))
+
+
+class TestGroupTurn(unittest.TestCase):
+    def setUp(self):
+        self.npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m")
+
+    @patch('requests.Session.post', side_effect=slow_generate)
+    def test_replies_arrive_in_completion_order_concurrently(self, mock_post):
+        start = time.perf_counter()
+        replies = [(spec.name, response["dialogue"]) for spec, response in self.npc_dm.group_turn(ROOM, "a brawl starts", "shout")]
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(replies, [("Grog", "Grog here"), ("Tess", "Tess here"), ("Mara", "Mara here")])
+        self.assertLess(elapsed, sum(DELAYS.values()))
+
+    @patch('requests.Session.post', side_effect=slow_generate)
+    def test_max_workers_caps_concurrency(self, mock_post):
+        start = time.perf_counter()
+        list(self.npc_dm.group_turn(ROOM, "a brawl starts", "shout", max_workers=1))
+        self.assertGreaterEqual(time.perf_counter() - start, sum(DELAYS.values()))
+
+    def test_group_turns_share_one_worker_pool(self):
+        workers = []
+
+        def post(*args, **kwargs):
+            workers.append(threading.current_thread())
+            return slow_generate(*args, **kwargs)
+
+        with patch('requests.Session.post', side_effect=post):
+            for _ in range(3):
+                list(self.npc_dm.bind().group_turn(ROOM, "a brawl starts", "shout"))
+
+        self.assertEqual(len(workers), 3 * len(ROOM))
+        self.assertLessEqual(len(set(workers)), len(ROOM))
+
+    @patch('requests.Session.post', side_effect=slow_generate)
+    def test_situation_is_embedded_once(self, mock_post):
+        calls = []
+        lock = threading.Lock()
+
+        def fake_embed(text, **kwargs):
+            with lock:
+                calls.append(text)
+            time.sleep(0.02)
+            return [1.0, 0.0]
+
+        room = [NPCSpec(spec.name, spec.personality, retriever=make_retriever()) for spec in ROOM]
+        with patch.object(bartender_rag, "embed", side_effect=fake_embed):
+            replies = dict((spec.name, response) for spec, response in self.npc_dm.group_turn(room, "a brawl starts", "shout"))
+
+        self.assertEqual(calls, ["a brawl starts"])
+        self.assertEqual(set(replies), set(DELAYS))
+        prompts = [c.kwargs["json"]["prompt"] for c in mock_post.call_args_list]
+        self.assertTrue(all("- No credit." in p for p in prompts))
+
+    @patch('requests.Session.post', side_effect=slow_generate)
+    def test_spec_context_overrides_scene_context(self, mock_post):
+        room = [NPCSpec("Mara", "warm", context="Mara owes the player"), NPCSpec("Grog", "gruff")]
+        list(self.npc_dm.group_turn(room, "a brawl starts", "shout", context="the tavern is full"))
+        prompts = {json.dumps(c.kwargs["json"]["prompt"]) for c in mock_post.call_args_list}
+        self.assertTrue(any("Mara owes the player" in p for p in prompts))
+        self.assertTrue(any("Grog" in p and "the tavern is full" in p for p in prompts))
+
+
+class TestAsyncGroupTurn(unittest.IsolatedAsyncioTestCase):
+    async def test_replies_stream_under_the_concurrency_cap(self):
+        npc_dm = AsyncNPCDecisionMaker(ollama_url="http://test", model="m", max_concurrency=2, timeout=5.0)
+        self.addAsyncCleanup(npc_dm.aclose)
+        with patch.object(npc_dm._session, "post", side_effect=slow_generate):
+            start = time.perf_counter()
+            names = [spec.name async for spec, _ in npc_dm.group_turn(ROOM, "a brawl starts", "shout")]
+            elapsed = time.perf_counter() - start
+
+        # Mara and Grog start first; Tess only gets a slot once Grog is done
+        self.assertEqual(names[0], "Grog")
+        self.assertEqual(sorted(names), sorted(DELAYS))
+        self.assertGreaterEqual(elapsed, DELAYS["Grog"] + DELAYS["Tess"])
+        self.assertLess(elapsed, sum(DELAYS.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
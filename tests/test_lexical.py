@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from npcs.lexical import LexicalIndex, tokenize
+
+ITEMS = [
+    {"id": "rules.R10", "text": "Rule R10: Cut off drinks for visibly drunk patrons.", "meta": {"tags": ["safety", "alcohol"]}},
+    {"id": "rules.R11", "text": "Rule R11: Quote prices plainly; haggling is allowed once.", "meta": {"tags": ["trade", "pricing"]}},
+    {"id": "rules.R14", "text": "Rule R14: If threatened, stay calm and call the guard.", "meta": {"tags": ["safety", "threats"]}},
+]
+
+
+class TestTokenize(unittest.TestCase):
+    def test_drops_stopwords_and_strips_suffixes(self):
+        self.assertEqual(tokenize("What are your prices for drinks?"), ["pric", "drink"])
+        self.assertEqual(tokenize("pricing"), tokenize("price"))
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = LexicalIndex.from_items(ITEMS)
+
+    def test_tags_match_without_text_overlap(self):
+        hits = self.index.search("got any alcohol?", top_k=2)
+        self.assertEqual(hits[0][0], 0)
+        self.assertGreaterEqual(hits[0][1], 0.5)
+
+    def test_unknown_words_lower_confidence(self):
+        focused = self.index.search("your prices", top_k=1)[0][1]
+        diluted = self.index.search("your prices for the dragon hoard scrolls", top_k=1)[0][1]
+        self.assertGreater(focused, diluted)
+        self.assertEqual(self.index.search("dragon hoard"), [])
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "idx.lexical.json")
+            self.index.save(path)
+            loaded = LexicalIndex.load(path)
+        self.assertTrue(loaded.matches(it["id"] for it in ITEMS))
+        self.assertEqual(loaded.search("threats", top_k=3), self.index.search("threats", top_k=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
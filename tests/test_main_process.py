@@ -1,10 +1,31 @@
+import json
+import requests
 import unittest
-from unittest.mock import patch, call
+from unittest.mock import Mock, patch, call
 
 import main_process
 
 
+def npc_reply(text):
+    resp = Mock()
+    resp.status_code = 200
+    resp.ok = True
+    resp.json.return_value = {"response": text}
+    return resp
+
+
 class TestMainProcess(unittest.TestCase):
+    def setUp(self):
+        retriever = patch('main_process.load_retriever', return_value=None)
+        retriever.start()
+        self.addCleanup(retriever.stop)
+        post = patch('requests.Session.post', return_value=npc_reply(json.dumps({"dialogue": "Evening.", "emotion": "bored"})))
+        self.mock_post = post.start()
+        self.addCleanup(post.stop)
+        # the bartender's replies; the loop's own messages still go to print
+        show_reply = patch('main_process.show_reply')
+        self.mock_show_reply = show_reply.start()
+        self.addCleanup(show_reply.stop)
     
     @patch('builtins.print')
     @patch('builtins.input')
@@ -73,6 +94,31 @@ class TestMainProcess(unittest.TestCase):
         # Should exit on exact 'quit' match
         assert mock_input.call_count == 2
 
+    @patch('builtins.print')
+    @patch('builtins.input')
+    def test_main_loop_survives_ollama_errors(self, mock_input, mock_print):
+        """An error reply is reported instead of raising KeyError: 'dialogue'"""
+        self.mock_post.side_effect = requests.exceptions.ConnectionError("refused")
+        mock_input.side_effect = ['hello', 'quit']
+        main_process.main_loop()
+
+        printed = [c.args[0] for c in mock_print.call_args_list if c.args]
+        self.assertTrue(any('does not answer' in str(p) for p in printed))
+        self.mock_show_reply.assert_not_called()
+        mock_print.assert_called_with('Goodbye quit')
+
+    @patch('builtins.print')
+    @patch('builtins.input')
+    def test_main_loop_repairs_truncated_reply(self, mock_input, mock_print):
+        """A truncated reply without an emotion is repaired and shown as neutral"""
+        self.mock_post.return_value = npc_reply('{"dialogue": "We close at mid')
+        mock_input.side_effect = ['hello', 'quit']
+        main_process.main_loop()
+
+        response = self.mock_show_reply.call_args.args[0]
+        self.assertEqual((response['emotion'], response['dialogue']), ('neutral', 'We close at mid'))
+        self.assertEqual(self.mock_post.call_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from npcs.metrics import MetricsRegistry, TurnMetrics
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+
+OLLAMA_STATS = {
+    "done": True,
+    "total_duration": 900_000_000,
+    "load_duration": 0,
+    "prompt_eval_count": 412,
+    "prompt_eval_duration": 200_000_000,
+    "eval_count": 58,
+    "eval_duration": 580_000_000,
+}
+NPC_JSON = '{"dialogue": "Aye", "actions": "", "emotion": "calm", "decision": ""}'
+
+
+class TestTurnMetrics(unittest.TestCase):
+    def test_records_ollama_stats_and_network_time(self):
+        turn = TurnMetrics(npc="Mara", model="m")
+        turn.add_timings({"embed_ms": 3.0, "prompt_ms": 0.5})
+        turn.spans["request"] = 950.0
+        turn.record_ollama(OLLAMA_STATS)
+        turn.finish()
+
+        self.assertEqual(turn.prompt_tokens, 412)
+        self.assertEqual(turn.eval_tokens, 58)
+        self.assertAlmostEqual(turn.spans["ollama_prompt_eval"], 200.0)
+        self.assertAlmostEqual(turn.spans["network"], 50.0)
+        self.assertAlmostEqual(turn.eval_tokens_per_sec, 100.0)
+        self.assertIn("prefill 200.0ms/412 tok", turn.breakdown())
+        self.assertIn("embed 3.0ms", turn.breakdown())
+
+
+    def test_prefix_reuse_estimate(self):
+        turn = TurnMetrics(expected_prompt_tokens=500)
+        turn.spans["request"] = 950.0
+        turn.record_ollama(dict(OLLAMA_STATS, prompt_eval_count=100, prompt_eval_duration=50_000_000))
+        self.assertEqual(turn.est_reused_prompt_tokens, 400)
+        self.assertAlmostEqual(turn.est_prefill_saved_ms, 200.0)
+        self.assertIn("prefix reused ~400 tok, ~200.0ms saved", turn.finish().breakdown())
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_prometheus_histograms_are_cumulative(self):
+        registry = MetricsRegistry(buckets=(0.01, 0.1, 1.0))
+        for ms in (5.0, 50.0, 500.0):
+            turn = TurnMetrics()
+            turn.spans["request"] = ms
+            registry.observe(turn.finish())
+
+        text = registry.to_prometheus()
+        self.assertIn('npc_turn_stage_seconds_bucket{stage="request",le="0.01"} 1', text)
+        self.assertIn('npc_turn_stage_seconds_bucket{stage="request",le="0.1"} 2', text)
+        self.assertIn('npc_turn_stage_seconds_bucket{stage="request",le="+Inf"} 3', text)
+        self.assertIn('npc_turns_total{outcome="ok"} 3', text)
+        self.assertAlmostEqual(registry.snapshot()["stages_mean_ms"]["request"], 185.0)
+
+    def test_writes_json_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "turns.jsonl")
+            registry = MetricsRegistry(jsonl_path=path)
+            registry.observe(TurnMetrics(npc="Mara").finish())
+            registry.observe(TurnMetrics(npc="Bob", error=True).finish())
+            with open(path, encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual([r["npc"] for r in rows], ["Mara", "Bob"])
+        self.assertTrue(rows[1]["error"])
+
+
+class TestDecisionMakerMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.npc_dm = NPCDecisionMaker(ollama_url="http://test", model="test-model", metrics=self.registry)
+
+    @patch('requests.Session.post')
+    def test_get_npc_response_records_turn(self, mock_post):
+        mock_post.return_value.json.return_value = {"response": NPC_JSON, **OLLAMA_STATS}
+        self.npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+
+        turn = self.npc_dm.last_metrics
+        self.assertEqual(turn.eval_tokens, 58)
+        self.assertGreater(turn.expected_prompt_tokens, 0)
+        self.assertTrue({"prompt", "request", "parse", "ollama_eval", "network"} <= set(turn.spans))
+        self.assertEqual(self.registry.snapshot()["tokens"], {"prompt": 412, "eval": 58, "est_reused_prompt": 0})
+
+    @patch('requests.Session.post')
+    def test_streaming_records_first_token_and_final_stats(self, mock_post):
+        mock_post.return_value.iter_lines.return_value = [
+            json.dumps({"response": NPC_JSON[:20], "done": False}).encode(),
+            json.dumps({"response": NPC_JSON[20:], "done": False}).encode(),
+            json.dumps({"response": "", **OLLAMA_STATS}).encode(),
+        ]
+        events = list(self.npc_dm.get_npc_response_stream_parsed("Mara", "warm", "beer!", "talk"))
+
+        self.assertEqual(events[-1], ("response", json.loads(NPC_JSON)))
+        turn = self.npc_dm.last_metrics
+        self.assertTrue(turn.streamed)
+        self.assertIn("first_token", turn.spans)
+        self.assertEqual(turn.prompt_tokens, 412)
+        self.assertEqual(self.registry.snapshot()["turns"]["ok"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,7 +26,7 @@ class TestNPCDecisionMaker(unittest.TestCase):
         self.assertIn(self.test_npc["name"], prompt)
         self.assertIn(self.test_npc["context"], prompt)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_npc_response(self, mock_post):
         mock_response = Mock()
         mock_response.json.return_value = {
@@ -45,7 +45,7 @@ class TestNPCDecisionMaker(unittest.TestCase):
         self.assertIsInstance(response, dict)
         self.assertIn("dialogue", response)
 
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_get_npc_response_streaming(self, mock_post):
         mock_response = Mock()
         mock_response.iter_lines.return_value = [
@@ -66,5 +66,43 @@ class TestNPCDecisionMaker(unittest.TestCase):
         self.assertIsInstance(chunks[0], str)
 
 
+    @patch('requests.Session.post')
+    def test_prefix_reuse_sends_constant_system_prompt(self, mock_post):
+        from npcs.npc_decision_maker_module import NPC_SYSTEM_PROMPT
+        mock_post.return_value.json.return_value = {"response": '{"dialogue": "Aye"}'}
+
+        for situation in ("beer!", "a room for the night"):
+            self.npc_dm.get_npc_response("Mara", "warm", situation, "talk")
+        first, second = [c.kwargs["json"] for c in mock_post.call_args_list]
+
+        self.assertEqual(first["system"], NPC_SYSTEM_PROMPT)
+        self.assertEqual(second["system"], first["system"])
+        self.assertNotIn("Dungeon Master", first["prompt"])
+        self.assertIn("a room for the night", second["prompt"])
+        self.assertIn("keep_alive", first)
+
+    @patch('requests.Session.post')
+    def test_prefix_reuse_off_sends_whole_prompt(self, mock_post):
+        mock_post.return_value.json.return_value = {"response": '{"dialogue": "Aye"}'}
+        npc_dm = NPCDecisionMaker(prefix_reuse=False)
+        npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+        payload = mock_post.call_args.kwargs["json"]
+        self.assertNotIn("system", payload)
+        self.assertEqual(payload["prompt"], npc_dm.create_npc_prompt("Mara", "warm", "beer!", "talk"))
+
+    @patch('requests.Session.post')
+    def test_temperature_is_sent_as_an_option(self, mock_post):
+        mock_post.return_value.json.return_value = {"response": '{"dialogue": "Aye"}'}
+        mock_post.return_value.iter_lines.return_value = [b'{"response": "Aye"}']
+        self.npc_dm.get_npc_response("Mara", "warm", "beer!", "talk", temperature=0.2)
+        list(self.npc_dm.get_npc_response_streaming("Mara", "warm", "beer!", "talk", temperature=0.2))
+
+        self.assertEqual(mock_post.call_count, 2)
+        for call in mock_post.call_args_list:
+            payload = call.kwargs["json"]
+            self.assertEqual(payload["options"], {"temperature": 0.2})
+            self.assertNotIn("temperature", payload)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,104 @@
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs.metrics import MetricsRegistry
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.npc_response import parse_response, repair_json, validate
+
+FULL = {"dialogue": "Aye, one ale.", "actions": "pours", "emotion": "warm", "decision": "serve"}
+
+
+def reply(text):
+    resp = Mock()
+    resp.status_code = 200
+    resp.ok = True
+    resp.json.return_value = {"response": text}
+    return resp
+
+
+class TestParseResponse(unittest.TestCase):
+    def test_valid_json_passes_through(self):
+        parsed = parse_response(json.dumps(FULL))
+        self.assertEqual(parsed.outcome, "valid")
+        self.assertEqual(parsed.to_dict(), FULL)
+        self.assertIsNone(parsed.raw)
+
+    def test_fields_are_coerced_and_defaulted(self):
+        parsed = validate({"Speech": "Hm.", "actions": ["wipes glass", "sighs"], "emotion": "", "decision": None})
+        self.assertEqual(parsed.to_dict(), {"dialogue": "Hm.", "actions": "wipes glass; sighs", "emotion": "neutral", "decision": ""})
+        self.assertIsNone(validate({"emotion": "sad"}))
+        self.assertIsNone(validate(["not", "an", "object"]))
+
+    def test_repairs(self):
+        cases = {
+            '```json\n{"dialogue": "Hi",}\n```': "Hi",
+            'Sure! {"dialogue": "Hi", "emotion": "warm"} Hope that helps.': "Hi",
+            '{"dialogue": "We close at mid': "We close at mid",
+            '{"dialogue": "Hi", "actions": "wav': "Hi",
+            '{"dialogue": "Hi", "emotion"': "Hi",
+            '{"dialogue": "Hi", "emotion": ': "Hi",
+            '{"dialogue": "Say \\"when\\"", "actions": ["pours", "wai': 'Say "when"',
+            '{“dialogue”: “Hi”}': "Hi",
+        }
+        for text, dialogue in cases.items():
+            with self.subTest(text=text):
+                parsed = parse_response(text)
+                self.assertIsNotNone(parsed, repair_json(text))
+                self.assertEqual(parsed.dialogue, dialogue)
+                self.assertEqual(parsed.outcome, "repaired")
+                self.assertEqual(parsed.raw, text)
+
+    def test_unrepairable(self):
+        for text in ("", "no json here", '{"emotion": "sad"}', '{"dialo'):
+            with self.subTest(text=text):
+                self.assertIsNone(parse_response(text))
+
+
+class TestReask(unittest.TestCase):
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+        self.npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m", metrics=self.metrics)
+
+    @patch('requests.Session.post')
+    def test_repaired_reply_needs_no_second_generation(self, mock_post):
+        mock_post.return_value = reply('{"dialogue": "Aye", "emotion": "wa')
+        response = self.npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+        self.assertEqual(response["dialogue"], "Aye")
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(self.npc_dm.last_metrics.response, "repaired")
+
+    @patch('requests.Session.post')
+    def test_reask_is_a_bounded_last_resort(self, mock_post):
+        mock_post.side_effect = [reply("Aye, one ale."), reply(json.dumps(FULL))]
+        response = self.npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+        self.assertEqual(response, FULL)
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertIn("Aye, one ale.", mock_post.call_args.kwargs["json"]["prompt"])
+        self.assertEqual(self.npc_dm.last_metrics.response, "reasked")
+
+        mock_post.side_effect = None
+        mock_post.return_value = reply("still prose")
+        mock_post.reset_mock()
+        response = self.npc_dm.get_npc_response("Mara", "warm", "another!", "talk")
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(response["dialogue"], "still prose")
+        self.assertEqual(response["emotion"], "neutral")
+        self.assertIn("raw_response", response)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot["responses"], {"valid": 0, "repaired": 0, "reasked": 1, "fallback": 1})
+        self.assertEqual(snapshot["fallback_rate"], 0.5)
+        self.assertIn('npc_responses_total{outcome="fallback"} 1', self.metrics.to_prometheus())
+
+    @patch('requests.Session.post')
+    def test_reask_can_be_disabled(self, mock_post):
+        mock_post.return_value = reply("prose")
+        self.npc_dm.max_reasks = 0
+        response = self.npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(response["dialogue"], "prose")
+
+
+if __name__ == "__main__":
+    unittest.main()
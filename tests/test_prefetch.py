@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.prefetch import Prefetcher
+from npcs.scheduler import OllamaScheduler
+
+
+def rules_hit(*tags):
+    return {"id": "R", "text": "rule", "meta": {"tags": list(tags)}}
+
+
+def situation(prompt):
+    return prompt.split('Current Situation: ')[1].split('\n')[0] if 'Current Situation: ' in prompt else prompt
+
+
+def streamed(dialogue, delay=0.0, started=None):
+    def lines():
+        if started is not None:
+            started.set()
+        text = json.dumps({"dialogue": dialogue, "emotion": "warm"})
+        for i in range(0, len(text), 4):
+            time.sleep(delay)
+            yield json.dumps({"response": text[i:i + 4]}).encode()
+        yield json.dumps({"response": "", "done": True}).encode()
+
+    resp = Mock()
+    resp.status_code = 200
+    resp.ok = True
+    resp.iter_lines.side_effect = lambda: lines()
+    return resp
+
+
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.retriever = Mock()
+        self.retriever.retrieve.return_value = [rules_hit("pricing", "trade"), rules_hit("service")]
+        self.retriever.rules_with_timings.return_value = ("- rule", {"embed_ms": 0.0})
+        self.npc = NPCDecisionMaker(ollama_url="http://test", model="m", retriever=None)
+        self.npc.retriever = self.retriever
+        self.prefetcher = Prefetcher(self.npc)
+        self.addCleanup(self.prefetcher.close)
+        self.kwargs = dict(npc_name="Bob", npc_personality="bored", situation="", player_action="talk", context="")
+
+    def test_predicts_from_retrieved_tags_and_skips_what_was_just_asked(self):
+        self.assertEqual(self.prefetcher.predict("Can I get a drink?"), ["How much do I owe?", "An ale, please."])
+        self.retriever.retrieve.return_value = [rules_hit("pricing")]
+        self.assertEqual(self.prefetcher.predict("How much do I owe you?"), ["An ale, please."])
+
+    @patch('requests.Session.post')
+    def test_serves_a_matching_speculation(self, mock_post):
+        mock_post.side_effect = lambda url, json=None, **kw: streamed(f"reply to {situation(json['prompt'])}")
+        self.npc.metrics = Mock()
+        self.prefetcher.start("Can I get a drink?", self.kwargs)
+        for spec in self.prefetcher._pending:
+            spec.future.result(timeout=1.0)
+
+        response = self.prefetcher.take("how much do i owe")
+        self.assertEqual(response["dialogue"], "reply to How much do I owe?")
+        self.assertEqual(self.prefetcher.stats()["hits"], 1)
+        self.assertEqual(self.prefetcher.hit_rate, 1.0)
+        # speculative turns are not player turns
+        self.npc.metrics.observe.assert_not_called()
+
+    @patch('requests.Session.post')
+    def test_unmatched_input_cancels_in_flight_work(self, mock_post):
+        started = threading.Event()
+        responses = []
+
+        def post(url, json=None, **kw):
+            responses.append(streamed("slow", delay=0.05, started=started))
+            return responses[-1]
+
+        mock_post.side_effect = post
+        self.prefetcher.start("Can I get a drink?", self.kwargs)
+        self.assertTrue(started.wait(1.0))
+        futures = [spec.future for spec in self.prefetcher._pending]
+
+        t0 = time.perf_counter()
+        self.assertIsNone(self.prefetcher.take("Tell me about the dragon"))
+        self.assertLess(time.perf_counter() - t0, 0.05)
+        stats = self.prefetcher.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["cancelled"]), (0, 1, 2))
+        time.sleep(0.15)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(self.prefetcher.stats()["generated"], 0)
+        # the abandoned stream hung up rather than leaving the connection to the GC
+        self.assertIsNone(futures[0].result(timeout=2.0))
+        responses[0].close.assert_called_once()
+
+    def test_real_turn_overtakes_queued_speculation(self):
+        scheduler = OllamaScheduler("http://test", workers=1)
+        self.addCleanup(scheduler.close)
+        release = threading.Event()
+        sent = []
+
+        def post(url, **kw):
+            sent.append(situation(kw["json"]["prompt"]))
+            if kw["json"]["prompt"] == "block":
+                release.wait(2.0)
+            resp = Mock()
+            resp.json.return_value = {"response": json.dumps({"dialogue": f"reply to {sent[-1]}"})}
+            return resp
+
+        patcher = patch.object(scheduler.session, "post", side_effect=post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.npc.scheduler = scheduler
+        self.prefetcher.max_candidates = 1
+
+        def wait_for(predicate):
+            deadline = time.monotonic() + 2.0
+            while not predicate():
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.005)
+
+        # occupy the only worker so everything after it has to queue
+        blocker = scheduler.submit_generate({"model": "m", "prompt": "block", "stream": False})
+        wait_for(lambda: sent == ["block"])
+        self.assertEqual(self.prefetcher.start("Can I get a drink?", self.kwargs), ["How much do I owe?"])
+        wait_for(lambda: scheduler.stats()["queued_generate"] == 1)
+
+        self.assertIsNone(self.prefetcher.take("Tell me about the dragon"))
+        real = threading.Thread(target=lambda: self.npc.get_npc_response(**dict(self.kwargs, situation="Tell me about the dragon")))
+        real.start()
+        wait_for(lambda: scheduler.stats()["queued_generate"] == 2)
+        release.set()
+        real.join(2.0)
+        blocker.result(timeout=2.0)
+        wait_for(lambda: len(sent) == 3)
+
+        self.assertEqual(sent, ["block", "Tell me about the dragon", "How much do I owe?"])
+
+    def test_no_retriever_means_no_speculation(self):
+        self.npc.retriever = None
+        self.assertEqual(self.prefetcher.start("hello", self.kwargs), [])
+        self.assertIsNone(self.prefetcher.take("hello"))
+        self.assertEqual(self.prefetcher.hit_rate, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from npcs.bartender_rag import compose_prompt
+from npcs.conversation_memory import estimate_tokens
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.prompt_templates import PromptTemplate, Segment
+
+TEMPLATE = PromptTemplate((
+    Segment("intro", "You are {name}.\n"),
+    Segment("rules", "Rules:\n{rules}\n", optional=True),
+    Segment("input", "Player: {query}"),
+))
+
+
+class TestPromptTemplate(unittest.TestCase):
+    def test_render_matches_format(self):
+        text, tokens = TEMPLATE.render_with_tokens(name="Mara", rules="- no credit", query="ale {please}")
+        self.assertEqual(text, "You are Mara.\nRules:\n- no credit\nPlayer: ale {please}")
+        self.assertEqual(list(tokens), ["intro", "rules", "input"])
+        self.assertEqual(tokens["rules"], estimate_tokens("Rules:\n- no credit\n"))
+        self.assertEqual(TEMPLATE.tokens(name="Mara", rules="- no credit", query="ale {please}"), tokens)
+
+    def test_optional_segments_drop_out_when_empty(self):
+        for rules in (None, ""):
+            text, tokens = TEMPLATE.render_with_tokens(name="Mara", rules=rules, query="ale")
+            self.assertEqual(text, "You are Mara.\nPlayer: ale")
+            self.assertNotIn("rules", tokens)
+
+    def test_bind_prerenders_static_segments(self):
+        bound = TEMPLATE.bind(name="Grog")
+        self.assertEqual(bound.slots, ("rules", "query"))
+        self.assertEqual(bound.static_tokens, estimate_tokens("You are Grog.\n"))
+        self.assertEqual(bound.render(rules="", query="hi"), TEMPLATE.render(name="Grog", rules="", query="hi"))
+        self.assertEqual(TEMPLATE.bind(rules="").names, ("intro", "input"))
+
+    def test_missing_slot_and_bad_placeholders(self):
+        with self.assertRaises(KeyError):
+            TEMPLATE.render(name="Mara", rules="")
+        with self.assertRaises(ValueError):
+            PromptTemplate((Segment("bad", "{value:>10}"),))
+
+
+class TestCompiledNPCPrompts(unittest.TestCase):
+    def test_turn_prompt_is_cached_per_npc(self):
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m")
+        first = npc_dm.template_for("Mara", "warm")
+        self.assertIs(npc_dm.template_for("Mara", "warm"), first)
+        self.assertIs(npc_dm.bind().template_for("Mara", "warm"), first)
+        self.assertIsNot(npc_dm.template_for("Mara", "cold"), first)
+
+        prompt = npc_dm.create_turn_prompt("Mara", "warm", "busy night", "talk", context="earlier: hi", rules="- no credit")
+        self.assertEqual(prompt, (
+            "NPC Information:\n- Name: Mara\n- Personality: warm\n\n"
+            "Current Situation: busy night\n\nPlayer Action: talk\n"
+            "\nRelevant Rules:\n- no credit\n"
+            "\nAdditional Context: earlier: hi"
+        ))
+        tokens = first.tokens(situation="busy night", player_action="talk", rules=None, context="earlier: hi")
+        self.assertEqual(set(tokens), {"npc", "turn", "context"})
+
+    def test_compose_prompt(self):
+        prompt = compose_prompt("Mara", "beer!", [{"text": "No credit."}, {"text": "Last call at midnight."}])
+        self.assertIn("(top-2):\n- No credit.\n- Last call at midnight.\n\nPlayer input: beer!\n\n", prompt)
+        self.assertTrue(prompt.startswith("You are roleplaying NPC Mara, a bartender."))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs import bartender_rag
+from npcs.registry import IndexRegistry, UnknownNPC
+
+
+def fake_embed_post(url, json=None, timeout=None):
+    resp = Mock()
+    resp.status_code = 200
+    resp.json.return_value = {"embeddings": [[float(len(t)), 1.0] for t in json["input"]]}
+    return resp
+
+
+def write_rules(directory, npc_id, npc_name, n_rules=3):
+    rules = {
+        "npc_name": npc_name,
+        "operational_rules": [
+            {"id": f"R{i}", "text": f"{npc_name} rule {i}", "tags": ["service"]} for i in range(n_rules)
+        ],
+    }
+    with open(os.path.join(directory, f"{npc_id}_rules.json"), "w", encoding="utf-8") as f:
+        json.dump(rules, f)
+
+
+class TestIndexRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        write_rules(self.tmp, "bartender", "Mara the Bartender")
+        write_rules(self.tmp, "smith", "Grog the Smith")
+        write_rules(self.tmp, "guard", "Tess the Guard")
+        self.registry = IndexRegistry(rules_dir=self.tmp)
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed")
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post):
+            self.built = self.registry.build_all(embedder)
+
+    def test_discovers_and_builds_one_index_per_npc(self):
+        self.assertEqual(sorted(self.registry.npcs), ["bartender", "guard", "smith"])
+        self.assertEqual(self.registry.rules("smith").npc_name, "Grog the Smith")
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, "smith_rules_index.npy")))
+        self.assertEqual(self.built["guard"]["embedded"], 3)
+        self.assertFalse(self.registry.rules("guard").stale)
+        self.assertEqual(self.registry.loaded(), [])
+
+    def test_loads_lazily_and_reuses_loaded_index(self):
+        first = self.registry.get("smith")
+        second = self.registry.get("smith")
+        self.assertIs(first, second)
+        self.assertEqual(first.index.npc_name, "Grog the Smith")
+        self.assertEqual(self.registry.stats()["loads"], 1)
+        self.assertEqual(self.registry.stats()["hits"], 1)
+
+    def test_cold_indexes_are_unloaded_over_budget(self):
+        one = self.registry.get("bartender").nbytes
+        self.registry.memory_budget = one * 2 + one // 2
+        self.registry.get("bartender")
+        self.registry.get("smith")
+        self.registry.get("bartender")
+        self.registry.get("guard")
+
+        loaded = [os.path.basename(p) for p in self.registry.loaded()]
+        self.assertEqual(loaded, ["bartender_rules_index.npy", "guard_rules_index.npy"])
+        self.assertEqual(self.registry.unloads, 1)
+        self.assertLessEqual(self.registry.nbytes, self.registry.memory_budget)
+
+    def test_retriever_loads_lexical_index_for_hybrid_modes(self):
+        retriever = self.registry.retriever("guard", mode="lexical-first")
+        self.assertIsNotNone(retriever.lexical)
+        self.assertIs(retriever.index, self.registry.get("guard").index)
+
+    def test_rebuild_while_a_retriever_is_live(self):
+        retriever = self.registry.retriever("smith", top_k=2)
+        write_rules(self.tmp, "smith", "Grog the Smith", n_rules=40)
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed")
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post):
+            self.registry.build("smith", embedder)
+
+        with patch.object(bartender_rag, "embed", return_value=[20.0, 1.0]):
+            hits = retriever.retrieve("rule")
+        self.assertEqual(len(retriever.index), 3)
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(len(self.registry.get("smith").index), 40)
+
+    def test_rebuild_outside_the_registry_is_picked_up(self):
+        old = self.registry.get("smith")
+        write_rules(self.tmp, "smith", "Grog the Smith", n_rules=40)
+        embedder = bartender_rag.BatchEmbedder("http://test", "test-embed")
+        with patch.object(embedder.session, "post", side_effect=fake_embed_post):
+            # as the bartender_rag CLI or another process would
+            bartender_rag.build_rules_index(os.path.join(self.tmp, "smith_rules.json"), self.registry.rules("smith").index_path, embedder)
+
+        new = self.registry.get("smith")
+        self.assertIsNot(new, old)
+        self.assertEqual(len(new.index), 40)
+        self.assertEqual(len(old.index), 3)
+        self.assertIs(self.registry.get("smith"), new)
+        self.assertEqual(self.registry.stats()["loads"], 2)
+
+    def test_unknown_npc(self):
+        with self.assertRaises(UnknownNPC):
+            self.registry.get("dragon")
+        self.assertNotIn("dragon", self.registry)
+        write_rules(self.tmp, "dragon", "Smaug")
+        self.assertIn("dragon", self.registry)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs import bartender_rag
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.scheduler import BACKGROUND, INTERACTIVE, OllamaScheduler
+
+
+class FakeOllama:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, timeout=None):
+        with self.lock:
+            self.calls.append((url, json))
+        time.sleep(self.delay)
+        resp = Mock()
+        if url.endswith("/api/embed"):
+            resp.json.return_value = {"embeddings": [[float(len(t))] for t in json["input"]]}
+        else:
+            resp.json.return_value = {"response": '{"dialogue": "%s"}' % json["prompt"][:5]}
+        return resp
+
+
+class TestOllamaScheduler(unittest.TestCase):
+    def make(self, fake, **kwargs):
+        scheduler = OllamaScheduler("http://test", **kwargs)
+        patcher = patch.object(scheduler.session, "post", side_effect=fake.post)
+        patcher.start()
+        self.addCleanup(scheduler.close)
+        self.addCleanup(patcher.stop)
+        return scheduler
+
+    def test_embeds_within_window_are_batched(self):
+        fake = FakeOllama()
+        scheduler = self.make(fake, workers=2, batch_window=0.05)
+        futures = [scheduler.submit_embed("x" * n, "embed-model") for n in range(1, 9)]
+
+        self.assertEqual([f.result(timeout=2) for f in futures], [[float(n)] for n in range(1, 9)])
+        embed_calls = [c for c in fake.calls if c[0].endswith("/api/embed")]
+        self.assertEqual(len(embed_calls), 1)
+        self.assertEqual(scheduler.stats()["avg_embed_batch"], 8)
+
+    def test_concurrent_workers_claim_each_batch_once(self):
+        fake = FakeOllama()
+        scheduler = self.make(fake, workers=2, batch_window=0.05)
+        futures = []
+        lock = threading.Lock()
+
+        def submit(start, priority):
+            for n in range(start, start + 4):
+                future = scheduler.submit_embed("x" * n, "embed-model", priority=priority)
+                with lock:
+                    futures.append(future)
+                time.sleep(0.005)
+
+        # the interactive requests re-queue the model's marker while the first worker is still collecting
+        threads = [threading.Thread(target=submit, args=(1, BACKGROUND)), threading.Thread(target=submit, args=(5, INTERACTIVE))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sorted(f.result(timeout=2)[0] for f in futures), [float(n) for n in range(1, 9)])
+        sent = [text for url, body in fake.calls if url.endswith("/api/embed") for text in body["input"]]
+        self.assertEqual(sorted(sent), sorted("x" * n for n in range(1, 9)))
+        self.assertEqual(scheduler.stats()["embed_batches"], len([c for c in fake.calls if c[0].endswith("/api/embed")]))
+        self.assertTrue(all(t.is_alive() for t in scheduler._workers))
+
+    def test_identical_inflight_prompts_are_deduplicated(self):
+        fake = FakeOllama(delay=0.05)
+        scheduler = self.make(fake, workers=2)
+        payload = {"model": "m", "prompt": "hello there", "stream": False}
+        futures = [scheduler.submit_generate(dict(payload)) for _ in range(5)]
+
+        results = [f.result(timeout=2) for f in futures]
+        self.assertEqual(len(fake.calls), 1)
+        self.assertTrue(all(r == results[0] for r in results))
+        self.assertEqual(scheduler.stats()["deduplicated"], 4)
+
+    def test_interactive_overtakes_background(self):
+        fake = FakeOllama(delay=0.02)
+        scheduler = self.make(fake, workers=1)
+        blocker = scheduler.submit_generate({"model": "m", "prompt": "block"})
+        time.sleep(0.005)
+        background = [scheduler.submit_generate({"model": "m", "prompt": f"bg{i}"}, priority=BACKGROUND) for i in range(3)]
+        interactive = scheduler.submit_generate({"model": "m", "prompt": "talk"}, priority=INTERACTIVE)
+
+        for f in [blocker, interactive] + background:
+            f.result(timeout=2)
+        prompts = [c[1]["prompt"] for c in fake.calls]
+        self.assertEqual(prompts[:2], ["block", "talk"])
+
+    def test_errors_propagate_and_stats(self):
+        scheduler = OllamaScheduler("http://test", workers=1)
+        self.addCleanup(scheduler.close)
+        with patch.object(scheduler.session, "post", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                scheduler.generate({"model": "m", "prompt": "x"})
+        stats = scheduler.stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertIn("avg_wait_ms", stats)
+
+    def test_clients_route_through_scheduler(self):
+        fake = FakeOllama()
+        scheduler = self.make(fake, workers=2, batch_window=0.0)
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m", scheduler=scheduler)
+        with patch('requests.post') as direct_post:
+            response = npc_dm.get_npc_response("Test NPC", "calm", "beer!", "talk")
+            vec = bartender_rag.embed("beer!", model="embed-model", scheduler=scheduler)
+        direct_post.assert_not_called()
+        self.assertIn("dialogue", response)
+        self.assertEqual(vec, [5.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
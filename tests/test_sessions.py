@@ -0,0 +1,207 @@
+import asyncio
+import base64
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import npc_server
+from npcs.npc_decision_maker_module import AsyncNPCDecisionMaker
+from npcs.sessions import SessionManager, SessionNotFound, TooManySessions
+
+
+RESPONSE_JSON = '{"dialogue": "Aye, one ale.", "actions": "pours", "emotion": "warm", "decision": "serve"}'
+
+
+def fake_post(url, json=None, timeout=None, stream=False):
+    resp = Mock()
+    resp.json.return_value = {"response": RESPONSE_JSON}
+    resp.iter_lines.return_value = [
+        b'{"response": "' + RESPONSE_JSON[i:i + 8].replace('"', '\\"').encode() + b'"}'
+        for i in range(0, len(RESPONSE_JSON), 8)
+    ]
+    return resp
+
+
+class TestSessionManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = AsyncNPCDecisionMaker(ollama_url="http://test", model="m", max_concurrency=4, timeout=1.0)
+        self.manager = SessionManager(self.client, max_sessions=3, idle_timeout=60, max_in_flight=2)
+        patcher = patch.object(self.client._session, "post", side_effect=fake_post)
+        self.mock_post = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_sessions_keep_separate_identity_and_memory(self):
+        mara = self.manager.create_session("Mara", "warm")
+        grog = self.manager.create_session("Grog", "grumpy")
+
+        await self.manager.take_turn(mara.session_id, "beer!")
+        await self.manager.take_turn(mara.session_id, "another!")
+        await self.manager.take_turn(grog.session_id, "hello")
+
+        self.assertEqual(mara.turns, 2)
+        self.assertEqual(grog.turns, 1)
+        self.assertIn("another!", mara.memory.render())
+        self.assertNotIn("beer!", grog.memory.render())
+        last_prompt = self.mock_post.call_args.kwargs["json"]["prompt"]
+        self.assertIn("Grog", last_prompt)
+        self.assertIs(mara.npc._session, grog.npc._session)
+
+    async def test_session_limit_and_close(self):
+        sessions = [self.manager.create_session(f"npc{i}") for i in range(3)]
+        with self.assertRaises(TooManySessions):
+            self.manager.create_session("one too many")
+        self.manager.close_session(sessions[0].session_id)
+        with self.assertRaises(SessionNotFound):
+            await self.manager.take_turn(sessions[0].session_id, "hi")
+
+    async def test_idle_sessions_are_evicted(self):
+        session = self.manager.create_session("Mara")
+        session.last_active -= 120
+        self.assertEqual(self.manager.evict_idle(), 1)
+        self.assertEqual(len(self.manager), 0)
+        self.assertEqual(self.manager.stats()["evicted"], 1)
+
+    async def test_open_session_loads_the_index_off_the_event_loop(self):
+        loaded_on = []
+
+        def retriever_for(npc_id, index_path):
+            loaded_on.append(threading.current_thread())
+            return None
+
+        with patch.object(self.manager, "_retriever_for", side_effect=retriever_for):
+            session = await self.manager.open_session("Mara", index_path="mara_index.npy")
+        self.assertIsNot(loaded_on[0], threading.current_thread())
+        self.assertIs(self.manager.get(session.session_id), session)
+
+    async def test_stream_turn_records_memory(self):
+        session = self.manager.create_session("Mara")
+        events = [e async for e in self.manager.stream_turn(session.session_id, "beer!")]
+        self.assertEqual("".join(v for k, v in events if k == "dialogue"), "Aye, one ale.")
+        self.assertEqual(events[-1][1]["emotion"], "warm")
+        self.assertEqual(session.turns, 1)
+
+
+class TestNPCServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.client = AsyncNPCDecisionMaker(ollama_url="http://test", model="m", max_concurrency=4, timeout=1.0)
+        patcher = patch.object(self.client._session, "post", side_effect=fake_post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = SessionManager(self.client)
+        self.listener = await asyncio.start_server(npc_server.NPCServer(self.manager).handle, "127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+        await self.client.aclose()
+
+    async def request(self, method, path, payload=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        raw = await reader.read()
+        writer.close()
+        head, _, data = raw.partition(b"\r\n\r\n")
+        return int(head.split(b" ")[1]), json.loads(data)
+
+    async def test_http_session_lifecycle(self):
+        status, created = await self.request("POST", "/sessions", {"npc_name": "Mara", "personality": "warm"})
+        self.assertEqual(status, 201)
+        sid = created["session_id"]
+
+        status, response = await self.request("POST", f"/sessions/{sid}/turns", {"input": "beer!"})
+        self.assertEqual(status, 200)
+        self.assertEqual(response["dialogue"], "Aye, one ale.")
+
+        status, stats = await self.request("GET", "/stats")
+        self.assertEqual(stats["total_turns"], 1)
+
+        status, _ = await self.request("DELETE", f"/sessions/{sid}")
+        self.assertEqual(status, 200)
+        status, _ = await self.request("POST", f"/sessions/{sid}/turns", {"input": "beer!"})
+        self.assertEqual(status, 404)
+
+    async def test_bad_requests(self):
+        status, _ = await self.request("POST", "/sessions", {})
+        self.assertEqual(status, 400)
+        status, _ = await self.request("GET", "/nope")
+        self.assertEqual(status, 404)
+        _, created = await self.request("POST", "/sessions", {"npc_name": "Mara"})
+        status, body = await self.request("POST", f"/sessions/{created['session_id']}/turns", {"input": "hi", "temperature": "hot"})
+        self.assertEqual(status, 400)
+        self.assertIn("temperature", body["error"])
+        for field in ("npc", "npc_name", "index"):
+            status, body = await self.request("POST", "/sessions", {"npc_name": "Mara", field: ["not", "a", "string"]})
+            self.assertEqual(status, 400)
+            self.assertIn(field, body["error"])
+
+    async def test_websocket_without_key_is_rejected(self):
+        _, created = await self.request("POST", "/sessions", {"npc_name": "Mara"})
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(
+            f"GET /sessions/{created['session_id']}/ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\n"
+            "Connection: Upgrade\r\n\r\n".encode()
+        )
+        raw = await asyncio.wait_for(reader.read(), timeout=5)
+        writer.close()
+        self.assertTrue(raw.startswith(b"HTTP/1.1 400"))
+
+    async def test_sessions_pick_npcs_from_the_registry(self):
+        from npcs.registry import IndexRegistry
+
+        rules_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, rules_dir)
+        with open(os.path.join(rules_dir, "smith_rules.json"), "w", encoding="utf-8") as f:
+            json.dump({"npc_name": "Grog the Smith"}, f)
+        self.manager._registry = IndexRegistry(rules_dir=rules_dir)
+
+        status, listed = await self.request("GET", "/npcs")
+        self.assertEqual(listed["npcs"], [{"npc": "smith", "npc_name": "Grog the Smith", "built": False}])
+        status, _ = await self.request("POST", "/sessions", {"npc": "dragon"})
+        self.assertEqual(status, 404)
+        # rules without a built index cannot back a session yet
+        status, _ = await self.request("POST", "/sessions", {"npc": "smith"})
+        self.assertEqual(status, 400)
+
+    async def test_websocket_streams_dialogue(self):
+        _, created = await self.request("POST", "/sessions", {"npc_name": "Mara"})
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        writer.write(
+            f"GET /sessions/{created['session_id']}/ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\n"
+            f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode()
+        )
+        head = await reader.readuntil(b"\r\n\r\n")
+        self.assertIn(b"101 Switching Protocols", head)
+
+        mask = b"\x01\x02\x03\x04"
+        payload = b"beer!"
+        writer.write(struct.pack("!BB", 0x81, 0x80 | len(payload)) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+        await writer.drain()
+
+        messages = []
+        while not messages or messages[-1]["type"] != "response":
+            _, data = await npc_server.read_ws_frame(reader)
+            messages.append(json.loads(data))
+        writer.close()
+
+        dialogue = "".join(m["text"] for m in messages if m["type"] == "dialogue")
+        self.assertEqual(dialogue, "Aye, one ale.")
+        self.assertEqual(messages[-1]["response"]["decision"], "serve")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import json
+import unittest
+from unittest.mock import Mock, patch
+
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.npc_response import validate
+from npcs.streaming_json import DialogueStreamParser
+
+
+RESPONSE = {
+    "emotion": "wary",
+    "actions": ["wipes a mug", {"nested": {"dialogue": "not this one"}}],
+    "dialogue": "Ale's \"fresh\" today.\nWant one? é\U0001F37A",
+    "decision": "pour",
+}
+# what the schema layer makes of it: every field a string
+VALIDATED = validate(RESPONSE).to_dict()
+
+
+def feed_all(parser, text, size):
+    return "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+
+
+class TestDialogueStreamParser(unittest.TestCase):
+    def test_emits_dialogue_for_any_fragmentation(self):
+        for ensure_ascii in (True, False):
+            text = json.dumps(RESPONSE, ensure_ascii=ensure_ascii)
+            for size in (1, 2, 3, 7, len(text)):
+                parser = DialogueStreamParser()
+                self.assertEqual(feed_all(parser, text, size), RESPONSE["dialogue"])
+                self.assertEqual(parser.result(), VALIDATED)
+
+    def test_dialogue_is_emitted_before_object_closes(self):
+        parser = DialogueStreamParser()
+        self.assertEqual(parser.feed('{"dialogue": "Hel'), "Hel")
+        self.assertEqual(parser.feed('lo", "emotion": "happy"'), "lo")
+        self.assertTrue(parser.field_complete)
+        self.assertEqual(parser.feed('}'), "")
+
+    def test_truncated_json_is_repaired(self):
+        parser = DialogueStreamParser()
+        parser.feed('{"dialogue": "Cut o')
+        self.assertEqual(parser.response().outcome, "repaired")
+        self.assertEqual(parser.result(), {"dialogue": "Cut o", "actions": "", "emotion": "neutral", "decision": ""})
+
+    def test_invalid_escape_is_kept_literally(self):
+        text = '{"dialogue": "Bad \\q and \\x41 escapes", "emotion": "sad"}'
+        for size in (1, 3, len(text)):
+            parser = DialogueStreamParser()
+            self.assertEqual(feed_all(parser, text, size), "Bad \\q and \\x41 escapes")
+            self.assertEqual(parser.result()["dialogue"], "Bad \\q and \\x41 escapes")
+
+    def test_unrepairable_stream_falls_back_to_text(self):
+        parser = DialogueStreamParser()
+        parser.feed('Sorry, I cannot do that.')
+        result = parser.result()
+        self.assertEqual(result["dialogue"], "Sorry, I cannot do that.")
+        self.assertIn("raw_response", result)
+
+
+class TestStreamParsedResponse(unittest.TestCase):
+    @patch('requests.Session.post')
+    def test_get_npc_response_stream_parsed(self, mock_post):
+        text = json.dumps(RESPONSE)
+        mock_response = Mock()
+        mock_response.iter_lines.return_value = [
+            json.dumps({"response": text[i:i + 5]}).encode() for i in range(0, len(text), 5)
+        ]
+        mock_post.return_value = mock_response
+
+        events = list(NPCDecisionMaker(ollama_url="http://test", model="m").get_npc_response_stream_parsed(
+            "Test NPC", "Test personality", "Test situation", "Test action"
+        ))
+
+        self.assertEqual("".join(v for k, v in events if k == "dialogue"), RESPONSE["dialogue"])
+        self.assertEqual(events[-1], ("response", VALIDATED))
+        self.assertEqual(mock_post.call_args.kwargs["json"]["format"], "json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from unittest.mock import Mock, patch
+
+import requests
+
+from npcs.npc_decision_maker_module import NPCDecisionMaker
+from npcs.transport import DEFAULT_TIMEOUTS, CircuitBreaker, CircuitOpen, OllamaTransport
+
+
+def status(code):
+    resp = Mock()
+    resp.status_code = code
+    resp.ok = code < 400
+    resp.json.return_value = {"response": '{"dialogue": "Aye"}'}
+    return resp
+
+
+class TestOllamaTransport(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30.0)
+        self.transport = OllamaTransport("http://test", retries=2, backoff=0.01, breaker=self.breaker)
+        self.addCleanup(self.transport.close)
+        sleeper = patch.object(self.transport, "_sleep_before_retry")
+        self.sleep = sleeper.start()
+        self.addCleanup(sleeper.stop)
+
+    def post(self, side_effect):
+        with patch.object(self.transport.session, "post", side_effect=side_effect) as mock_post:
+            try:
+                return self.transport.post("/api/generate", json={"prompt": "hi"}), mock_post
+            except requests.exceptions.RequestException as e:
+                return e, mock_post
+
+    def test_retries_5xx_and_connection_errors_with_backoff(self):
+        resp, mock_post = self.post([status(503), requests.exceptions.ConnectionError("reset"), status(200)])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], [0, 1])
+        self.assertEqual(self.transport.retried, 2)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_gives_up_with_last_5xx_response(self):
+        resp, mock_post = self.post([status(500)] * 3)
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(mock_post.call_count, 3)
+
+    def test_read_timeout_is_not_retried(self):
+        err, mock_post = self.post(requests.exceptions.ReadTimeout("slow"))
+        self.assertIsInstance(err, requests.exceptions.ReadTimeout)
+        self.assertEqual(mock_post.call_count, 1)
+        self.sleep.assert_not_called()
+
+    def test_client_errors_are_returned_without_retry(self):
+        resp, mock_post = self.post([status(404)])
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(mock_post.call_count, 1)
+
+    def test_per_endpoint_timeouts_reach_the_session(self):
+        with patch.object(self.transport.session, "post", return_value=status(200)) as mock_post:
+            self.transport.post("/api/generate", json={})
+            self.transport.post("/api/embed", json={})
+            self.transport.post("/api/embed", json={}, timeout=7.0)
+        timeouts = [c.kwargs["timeout"] for c in mock_post.call_args_list]
+        self.assertEqual(timeouts[0], DEFAULT_TIMEOUTS["/api/generate"])
+        self.assertEqual(timeouts[1], DEFAULT_TIMEOUTS["/api/embed"])
+        self.assertEqual(timeouts[2][1], 7.0)
+
+    def test_breaker_opens_and_fails_fast(self):
+        err, mock_post = self.post(requests.exceptions.ConnectionError("refused"))
+        self.assertIsInstance(err, requests.exceptions.ConnectionError)
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(self.breaker.state, "open")
+
+        err, mock_post = self.post([status(200)])
+        self.assertIsInstance(err, CircuitOpen)
+        mock_post.assert_not_called()
+        self.assertEqual(self.transport.short_circuited, 1)
+
+    def test_open_breaker_gives_existing_error_dict(self):
+        npc_dm = NPCDecisionMaker(ollama_url="http://test", model="m", transport=self.transport)
+        self.post(requests.exceptions.ConnectionError("refused"))
+        with patch.object(self.transport.session, "post") as mock_post:
+            response = npc_dm.get_npc_response("Mara", "warm", "beer!", "talk")
+        mock_post.assert_not_called()
+        self.assertEqual(set(response), {"error", "message"})
+        self.assertTrue(npc_dm.last_metrics.error)
+
+    def test_half_open_trial_closes_or_reopens(self):
+        self.post(requests.exceptions.ConnectionError("refused"))
+        self.breaker._opened_at -= 31
+        self.assertEqual(self.breaker.state, "half-open")
+
+        err, mock_post = self.post(requests.exceptions.ConnectionError("still down"))
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(self.breaker.state, "open")
+
+        self.breaker._opened_at -= 31
+        resp, _ = self.post([status(200)])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_unexpected_error_settles_half_open_trial(self):
+        self.post(requests.exceptions.ConnectionError("refused"))
+        self.breaker._opened_at -= 31
+        err, _ = self.post(requests.exceptions.MissingSchema("no scheme"))
+        self.assertIsInstance(err, requests.exceptions.MissingSchema)
+        self.breaker._opened_at -= 31
+        resp, _ = self.post([status(200)])
+        self.assertEqual(resp.status_code, 200)
+
+    def test_stats_shape(self):
+        self.post([status(200)])
+        stats = self.transport.stats()
+        self.assertEqual(set(stats), {"requests", "retried", "failures", "short_circuited", "pool", "breaker"})
+        self.assertEqual(set(stats["pool"]), {"hosts", "maxsize", "connections_opened", "idle_connections", "requests_served"})
+        self.assertEqual(stats["pool"]["maxsize"], 16)
+        self.assertEqual(set(stats["breaker"]), {"state", "consecutive_failures", "opened", "rejected", "retry_after_s"})
+        self.assertEqual(stats["requests"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()